@@ -6,7 +6,7 @@ import { useState } from 'react'
 import { useProducts, useManufacturers, useManufacturerProducts } from './hooks/useProducts'
 import { useCart } from './hooks/useCart'
 import { getDynamicLeadTime, getLeadTimeClass, formatPrice } from './utils/leadTime'
-import { Product } from './types'
+import { Product, productKey } from './types'
 import CartDrawer from './components/CartDrawer'
 import QuantityInput from './components/QuantityInput'
 
@@ -184,7 +184,7 @@ export default function App() {
                 // Вкладки производителей или поиск - обычная таблица
                 products.map((product, idx) => (
                   <ProductRow
-                    key={product.id}
+                    key={productKey(product)}
                     product={product}
                     isEven={idx % 2 === 0}
                     quantity={getQuantity(product.article)}
@@ -295,7 +295,7 @@ function LazyManufacturerGroup({
       {/* Строки товаров (если развёрнуто) */}
       {isExpanded && loaded && products.map((product, idx) => (
         <ProductRow
-          key={product.id}
+          key={productKey(product)}
           product={product}
           isEven={idx % 2 === 0}
           quantity={getQuantity(product.article)}
@@ -0,0 +1,28 @@
+import { describe, it, expect } from 'vitest'
+import { searchIndexLookup, searchTerms, SearchIndex } from '../utils/searchIndex'
+
+// Фрагмент индекса build.py для ['ls1520', 'ls1912'] / ['Розетка', 'Рамка']
+const index: SearchIndex = {
+  version: 1,
+  articles: ['ls1520', 'ls1912'],
+  keys: ['12', '1520', '1912', '20', '520', '912', 'ls1520', 'ls1912', 's1520', 's1912', 'рамка', 'розетка'],
+  postings: [[1], [0], [1], [0], [0], [1], [0], [1], [0], [1], [1], [0]]
+}
+
+describe('searchIndexLookup', () => {
+  it('нормализует запрос', () => {
+    expect(searchTerms('LS-1520 Ёлка')).toEqual(['ls', '1520', 'елка'])
+  })
+
+  it('находит подстроку артикула и префикс наименования', () => {
+    expect(searchIndexLookup(index, 'LS')).toEqual([0, 1])
+    expect(searchIndexLookup(index, '152')).toEqual([0])
+    expect(searchIndexLookup(index, 'ра')).toEqual([1])
+  })
+
+  it('все слова запроса должны совпасть', () => {
+    expect(searchIndexLookup(index, 'ls роз')).toEqual([0])
+    expect(searchIndexLookup(index, '1912 роз')).toEqual([])
+    expect(searchIndexLookup(index, '')).toEqual([])
+  })
+})
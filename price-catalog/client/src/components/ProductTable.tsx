@@ -1,5 +1,5 @@
 import { memo } from 'react'
-import { Product } from '../types'
+import { Product, productKey } from '../types'
 import { getDynamicLeadTime, getLeadTimeClass, formatPrice } from '../utils/leadTime'
 import QuantityInput from './QuantityInput'
 
@@ -93,7 +93,7 @@ export default function ProductTable({
         <tbody>
           {products.map((product) => (
             <ProductRow
-              key={product.id}
+              key={productKey(product)}
               product={product}
               cart={cart}
             />
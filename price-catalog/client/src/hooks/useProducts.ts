@@ -5,15 +5,20 @@
 
 import { useState, useEffect, useCallback, useRef, useMemo } from 'react'
 import { Product, MANUFACTURER_GROUPS } from '../types'
+import { SearchIndex, searchIndexLookup } from '../utils/searchIndex'
 
 // API URL
 const API_BASE = import.meta.env.VITE_API_URL 
   ? `${import.meta.env.VITE_API_URL}/api`
   : '/api'
 
+// Статические снапшоты каталога (build.py → /catalog), если заданы
+const STATIC_CATALOG_BASE = import.meta.env.VITE_STATIC_CATALOG_URL || ''
+
 // Константы
 const PAGE_SIZE = 500
-const DEBOUNCE_DELAY = 300
+// С локальным поисковым индексом запросы к серверу не нужны - короткая задержка
+const DEBOUNCE_DELAY = STATIC_CATALOG_BASE ? 50 : 300
 
 /**
  * Debounce функция
@@ -89,6 +94,107 @@ function setToCache(key: string, data: { products: Product[]; total: number; has
   productsCache.set(key, { ...data, timestamp: Date.now() })
 }
 
+/**
+ * Манифест статических снапшотов (output/catalog/index.json)
+ */
+interface StaticCatalogManifest {
+  generatedAt: string
+  total: number
+  all: { file: string; count: number }
+  manufacturers: { name: string; file: string; count: number }[]
+  search?: { file: string; count: number }
+}
+
+interface StaticCatalogShard {
+  total: number
+  products: Product[]
+}
+
+let staticManifestPromise: Promise<StaticCatalogManifest | null> | null = null
+
+function loadStaticManifest(): Promise<StaticCatalogManifest | null> {
+  if (!staticManifestPromise) {
+    staticManifestPromise = fetch(`${STATIC_CATALOG_BASE}/index.json`)
+      .then(response => (response.ok ? response.json() : null))
+      .catch(() => null)
+  }
+  return staticManifestPromise
+}
+
+/**
+ * Загружает все товары производителя (или весь каталог) одним статическим запросом.
+ * Возвращает null, если снапшоты не настроены или недоступны - тогда работаем через API
+ */
+async function fetchStaticProducts(manufacturer: string | undefined, signal: AbortSignal): Promise<Product[] | null> {
+  if (!STATIC_CATALOG_BASE) return null
+
+  const manifest = await loadStaticManifest()
+  if (!manifest) return null
+
+  const entry = manufacturer
+    ? manifest.manufacturers.find(m => m.name === manufacturer)
+    : manifest.all
+  if (!entry) return null
+
+  try {
+    const response = await fetch(`${STATIC_CATALOG_BASE}/${entry.file}`, { signal })
+    if (!response.ok) {
+      // Шард из устаревшего манифеста - перечитаем манифест в следующий раз
+      staticManifestPromise = null
+      return null
+    }
+    const shard: StaticCatalogShard = await response.json()
+    return shard.products
+  } catch (err) {
+    if (err instanceof Error && err.name === 'AbortError') throw err
+    return null
+  }
+}
+
+let staticSearchPromise: Promise<{ index: SearchIndex; products: Product[] } | null> | null = null
+
+/**
+ * Загружает поисковый индекс и шард all один раз на сессию
+ */
+function loadStaticSearch(): Promise<{ index: SearchIndex; products: Product[] } | null> {
+  if (!staticSearchPromise) {
+    staticSearchPromise = (async () => {
+      const manifest = await loadStaticManifest()
+      if (!manifest?.search) return null
+
+      const [index, shard] = await Promise.all([
+        fetch(`${STATIC_CATALOG_BASE}/${manifest.search.file}`).then(r => (r.ok ? r.json() : null)),
+        fetch(`${STATIC_CATALOG_BASE}/${manifest.all.file}`).then(r => (r.ok ? r.json() : null))
+      ]) as [SearchIndex | null, StaticCatalogShard | null]
+
+      // Индекс и шард должны быть из одной сборки
+      if (!index || !shard || index.articles.length !== shard.products.length) return null
+      return { index, products: shard.products }
+    })().catch(() => null)
+
+    staticSearchPromise.then(result => {
+      if (!result) {
+        staticSearchPromise = null
+        staticManifestPromise = null
+      }
+    })
+  }
+  return staticSearchPromise
+}
+
+/**
+ * Поиск по статическому индексу без запроса к API.
+ * Возвращает null, если снапшоты не настроены или недоступны
+ */
+async function searchStaticProducts(query: string): Promise<Product[] | null> {
+  if (!STATIC_CATALOG_BASE) return null
+
+  const search = await loadStaticSearch()
+  if (!search) return null
+
+  return searchIndexLookup(search.index, query).map(row => search.products[row])
+}
+
 export function useProducts(options: UseProductsOptions = {}): UseProductsResult {
   const [products, setProducts] = useState<Product[]>([])
   const [loading, setLoading] = useState(true)
@@ -140,6 +246,39 @@ export function useProducts(options: UseProductsOptions = {}): UseProductsResult
     }
 
     try {
+      // Весь производитель одним статическим файлом, без API и БД
+      if (!isLoadMore && !debouncedSearch) {
+        const manufacturer = options.manufacturer && options.manufacturer !== 'Все'
+          ? options.manufacturer
+          : undefined
+        const staticProducts = await fetchStaticProducts(manufacturer, abortControllerRef.current.signal)
+        if (staticProducts) {
+          setProducts(staticProducts)
+          setOffset(staticProducts.length)
+          setTotal(staticProducts.length)
+          setHasMore(false)
+          setToCache(cacheKey, {
+            products: staticProducts,
+            total: staticProducts.length,
+            hasMore: false
+          })
+          return
+        }
+      }
+
+      // Поиск по локальному индексу (как в API - без учёта производителя)
+      if (!isLoadMore && debouncedSearch) {
+        const found = await searchStaticProducts(debouncedSearch)
+        if (abortControllerRef.current.signal.aborted) return
+        if (found) {
+          setProducts(found)
+          setOffset(found.length)
+          setTotal(found.length)
+          setHasMore(false)
+          return
+        }
+      }
+
       // Формируем URL с параметрами
       const params = new URLSearchParams()
       params.set('limit', PAGE_SIZE.toString())
@@ -344,6 +483,22 @@ export function useManufacturerProducts(manufacturer: string, isExpanded: boolea
     setError(null)
 
     try {
+      const staticProducts = await fetchStaticProducts(manufacturer, abortControllerRef.current.signal)
+      if (staticProducts) {
+        setProducts(staticProducts)
+        productsRef.current = staticProducts
+        setTotal(staticProducts.length)
+        setHasMore(false)
+        offsetRef.current = staticProducts.length
+        setLoaded(true)
+        setToCache(cacheKey, {
+          products: staticProducts,
+          total: staticProducts.length,
+          hasMore: false
+        })
+        return
+      }
+
       const params = new URLSearchParams()
       params.set('limit', PAGE_SIZE.toString())
       params.set('offset', '0')
@@ -3,6 +3,7 @@
  */
 
 // Товар из API
+// Ключ товара - manufacturer + article: id в статических снапшотах не совпадает с id в БД
 export interface Product {
   id: number
   manufacturer: string
@@ -14,7 +15,15 @@ export interface Product {
   almatyQty: number | null
   catalogUrl: string | null
   imageUrl: string | null
-  updatedAt: string | null
+  // В статических снапшотах нет (время сборки - generatedAt в index.json)
+  updatedAt?: string | null
+}
+
+/**
+ * Ключ товара для React и сравнения (одинаковый для API и статических снапшотов)
+ */
+export function productKey(product: Pick<Product, 'manufacturer' | 'article'>): string {
+  return `${product.manufacturer}\u0000${product.article}`
 }
 
 // Ответ API списка товаров
@@ -0,0 +1,54 @@
+/**
+ * Поиск по статическому индексу каталога (search.<hash>.json из build.py)
+ *
+ * Ключи - слова наименования и все суффиксы артикула: поиск по префиксу
+ * суффикса находит подстроку артикула, как поиск на сервере. Номера строк
+ * указывают на товары в шарде all.
+ *
+ * Копия server/src/services/search.index.ts (у клиента и сервера отдельные
+ * сборки) - меняйте обе, их совпадение проверяет серверный search.index.test.ts.
+ */
+export interface SearchIndex {
+  version: number
+  articles: string[]
+  keys: string[]
+  postings: number[][]
+}
+
+/**
+ * Нормализованные слова: нижний регистр, ё → е, только буквы и цифры
+ */
+export function searchTerms(text: string): string[] {
+  return text.toLowerCase().replace(/ё/g, 'е').match(/[0-9a-zа-я]+/g) || []
+}
+
+function lowerBound(keys: string[], term: string): number {
+  let lo = 0
+  let hi = keys.length
+  while (lo < hi) {
+    const mid = (lo + hi) >>> 1
+    if (keys[mid] < term) lo = mid + 1
+    else hi = mid
+  }
+  return lo
+}
+
+/**
+ * Номера строк, где каждое слово запроса - префикс ключа (в порядке выдачи)
+ */
+export function searchIndexLookup(index: SearchIndex, query: string): number[] {
+  let result: Set<number> | null = null
+
+  for (const term of searchTerms(query)) {
+    const rows = new Set<number>()
+    for (let i = lowerBound(index.keys, term); i < index.keys.length && index.keys[i].startsWith(term); i++) {
+      for (const row of index.postings[i]) {
+        if (!result || result.has(row)) rows.add(row)
+      }
+    }
+    result = rows
+    if (result.size === 0) return []
+  }
+
+  return result ? [...result].sort((a, b) => a - b) : []
+}
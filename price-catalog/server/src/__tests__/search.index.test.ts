@@ -0,0 +1,60 @@
+import { describe, it, expect } from 'vitest'
+import { existsSync } from 'node:fs'
+import { fileURLToPath } from 'node:url'
+import { buildSearchIndex, searchIndexLookup, searchTerms } from '../services/search.index.js'
+
+// Те же данные, что в TestSearchIndex (scripts/tests/test_build.py)
+const index = buildSearchIndex([
+  { article: 'ls1520', name: 'Розетка с заземлением' },
+  { article: 'S201-C16', name: 'Автомат 16А' },
+  { article: 'cd581', name: 'Выключатель одноклавишный' },
+  { article: 'ls1912', name: 'Рамка 2-местная, ёлка' }
+])
+
+describe('searchTerms', () => {
+  it('нижний регистр, ё → е, без разделителей', () => {
+    expect(searchTerms('S201-C16 Ёлка')).toEqual(['s201', 'c16', 'елка'])
+  })
+})
+
+describe('searchIndexLookup', () => {
+  it('ключи отсортированы как в build.py', () => {
+    expect(index.keys).toEqual([...index.keys].sort())
+  })
+
+  it('часть артикула в любом месте', () => {
+    expect(searchIndexLookup(index, '1520')).toEqual([0])
+    expect(searchIndexLookup(index, 'LS')).toEqual([0, 3])
+    expect(searchIndexLookup(index, 's201c16')).toEqual([1])
+    expect(searchIndexLookup(index, 'S201-C1')).toEqual([1])
+    expect(searchIndexLookup(index, '0')).toEqual([0, 1]) // в том числе последний символ
+  })
+
+  it('все слова запроса - префиксы слов наименования', () => {
+    expect(searchIndexLookup(index, 'выкл')).toEqual([2])
+    expect(searchIndexLookup(index, 'Розетка заз')).toEqual([0])
+    expect(searchIndexLookup(index, 'розетка рамка')).toEqual([])
+    expect(searchIndexLookup(index, 'елка')).toEqual([3])
+  })
+
+  it('пустой запрос ничего не находит', () => {
+    expect(searchIndexLookup(index, '  ')).toEqual([])
+  })
+})
+
+// Копия поиска в клиенте (client/src/utils/searchIndex.ts) должна искать так же.
+// Путь в переменной: tsc сервера не тянет файл клиента в сборку
+const clientModule = fileURLToPath(new URL('../../../client/src/utils/searchIndex.ts', import.meta.url))
+
+describe.skipIf(!existsSync(clientModule))('клиентская копия searchIndex', () => {
+  const queries = ['1520', 'LS', 's201c16', 'S201-C1', '0', 'выкл', 'Розетка заз', 'розетка рамка',
+    'ёлка', 'Автомат 16а', '  ', 'zzz']
+
+  it('совпадает с серверной', async () => {
+    const client = await import(clientModule)
+    for (const query of queries) {
+      expect(client.searchTerms(query)).toEqual(searchTerms(query))
+      expect(client.searchIndexLookup(index, query)).toEqual(searchIndexLookup(index, query))
+    }
+  })
+})
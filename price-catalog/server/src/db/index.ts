@@ -25,6 +25,34 @@ export async function testConnection() {
   }
 }
 
+/**
+ * Подписка на NOTIFY канала на отдельном соединении из пула
+ * onError вызывается при потере соединения - подписку нужно открыть заново
+ */
+export async function listen(
+  channel: string,
+  onNotify: (payload?: string) => void,
+  onError: (error: Error) => void
+) {
+  const client = await pool.connect()
+
+  client.on('notification', (message) => {
+    if (message.channel === channel) onNotify(message.payload)
+  })
+  client.on('error', (error) => {
+    client.release(error)
+    onError(error)
+  })
+
+  try {
+    await client.query(`LISTEN ${channel}`)
+  } catch (error) {
+    client.release(error as Error)
+    throw error
+  }
+  return client
+}
+
 // Закрытие пула при завершении
 export async function closePool() {
   await pool.end()
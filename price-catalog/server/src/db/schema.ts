@@ -2,6 +2,13 @@ import { pgTable, serial, varchar, text, integer, timestamp } from 'drizzle-orm/
 
 /**
  * Таблица товаров
+ *
+ * build.py также хранит dealer_price_kzt и margin_source (для --reprice).
+ * Они намеренно не описаны здесь, чтобы дилерские цены не попадали в API.
+ *
+ * При PRODUCTS_PARTITIONED=true build.py создаёт таблицу секционированной по
+ * manufacturer (PRIMARY KEY (manufacturer, id)) - не применяйте к ней drizzle-kit push.
+ * Запросы с фильтром по manufacturer читают только одну партицию.
  */
 export const products = pgTable('products', {
   id: serial('id').primaryKey(),
@@ -51,8 +51,14 @@ app.get('/api/stock/:article', async (req, res) => {
 })
 
 // Health check
-app.get('/api/health', (_req, res) => {
-  res.json({ status: 'ok', timestamp: new Date().toISOString() })
+app.get('/api/health', async (_req, res) => {
+  const { catalogCache } = await import('./services/products.service.js')
+  const cached = catalogCache.get()
+  res.json({
+    status: 'ok',
+    timestamp: new Date().toISOString(),
+    catalogCache: cached ? { version: cached.version, loadedAt: cached.loadedAt, products: cached.items.length } : null
+  })
 })
 
 // Serve static files in production
@@ -76,6 +82,10 @@ async function start() {
     console.error('⚠️ Сервер запускается без подключения к БД')
   }
 
+  // Каталог в памяти, перезагрузка по NOTIFY catalog_updated из build.py
+  const { startCatalogCache } = await import('./services/products.service.js')
+  await startCatalogCache()
+
   app.listen(PORT, () => {
     console.log(`✅ Сервер запущен на http://localhost:${PORT}`)
     console.log(`📦 API доступен на http://localhost:${PORT}/api`)
@@ -0,0 +1,99 @@
+import type { Product } from '../db/schema.js'
+import { buildSearchIndex, SearchIndex } from './search.index.js'
+
+/**
+ * Канал, в который build.py отправляет NOTIFY после загрузки каталога
+ */
+export const CATALOG_CHANNEL = 'catalog_updated'
+
+/**
+ * Снимок каталога в памяти
+ * items уже отсортированы как в API: срок (наличие), затем наименование
+ */
+export interface CatalogSnapshot {
+  version: string | null
+  loadedAt: Date
+  items: Product[]
+  byManufacturer: Map<string, Product[]>
+  byArticle: Map<string, Product>
+  manufacturers: { name: string; count: number }[]
+  searchIndex: SearchIndex
+}
+
+/**
+ * Строит индексы снимка по отсортированному списку товаров
+ */
+export function buildSnapshot(items: Product[], version: string | null = null): CatalogSnapshot {
+  const byManufacturer = new Map<string, Product[]>()
+  const byArticle = new Map<string, Product>()
+
+  for (const product of items) {
+    // Срезы сохраняют порядок общего списка
+    let slice = byManufacturer.get(product.manufacturer)
+    if (!slice) {
+      slice = []
+      byManufacturer.set(product.manufacturer, slice)
+    }
+    slice.push(product)
+    byArticle.set(product.article, product)
+  }
+
+  const manufacturers = [...byManufacturer.entries()]
+    .map(([name, slice]) => ({ name, count: slice.length }))
+    .sort((a, b) => a.name.localeCompare(b.name, 'en'))
+
+  return {
+    version,
+    loadedAt: new Date(),
+    items,
+    byManufacturer,
+    byArticle,
+    manufacturers,
+    searchIndex: buildSearchIndex(items)
+  }
+}
+
+/**
+ * Кэш каталога в памяти процесса
+ *
+ * Каталог меняется только при загрузке из build.py, поэтому чтения идут из памяти,
+ * а по NOTIFY catalog_updated кэш сбрасывается и загружается заново. Пока идёт
+ * перезагрузка, get() возвращает null и сервис читает из PostgreSQL - устаревших
+ * данных не отдаём.
+ */
+export class CatalogCache {
+  private snapshot: CatalogSnapshot | null = null
+  private generation = 0
+
+  constructor(private readonly loadProducts: () => Promise<Product[]>) {}
+
+  /**
+   * Текущий снимок или null, если кэш не загружен
+   */
+  get(): CatalogSnapshot | null {
+    return this.snapshot
+  }
+
+  /**
+   * Сбросить кэш (например, при потере LISTEN-соединения)
+   */
+  invalidate(): void {
+    this.generation++
+    this.snapshot = null
+  }
+
+  /**
+   * Сбросить и загрузить каталог заново
+   * Если во время загрузки пришло новое уведомление, результат отбрасывается -
+   * актуальнее будет загрузка, начатая позже
+   */
+  async reload(version: string | null = null): Promise<void> {
+    this.invalidate()
+    const generation = this.generation
+
+    const items = await this.loadProducts()
+    if (generation !== this.generation) return
+
+    this.snapshot = buildSnapshot(items, version)
+  }
+}
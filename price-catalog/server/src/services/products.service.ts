@@ -1,6 +1,8 @@
-import { eq, ilike, or, sql, count, asc } from 'drizzle-orm'
-import { db } from '../db/index.js'
+import { eq, and, or, sql, count, asc, SQL } from 'drizzle-orm'
+import { db, listen } from '../db/index.js'
 import { products, Product } from '../db/schema.js'
+import { CatalogCache, CATALOG_CHANNEL } from './catalog.cache.js'
+import { searchIndexLookup, searchTerms } from './search.index.js'
 
 /**
  * Сортировка по приоритету срока доставки:
@@ -14,6 +16,89 @@ const leadTimePriority = sql`CASE
   ELSE 2 
 END`
 
+/**
+ * Текст колонки, нормализованный как searchTerms: нижний регистр, ё → е
+ * Кириллица переводится через translate - lower() для неё зависит от локали базы
+ */
+const normalizedText = (column: typeof products.article | typeof products.name) =>
+  sql`translate(lower(${column}), 'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯё', 'абвгдеежзийклмнопрстуфхцчшщъыьэюяе')`
+
+/**
+ * Условие поиска в PostgreSQL с теми же правилами, что у поискового индекса:
+ * каждое слово запроса - подстрока артикула без разделителей или начало слова наименования
+ */
+function searchCondition(terms: string[]): SQL | undefined {
+  const compactArticle = sql`regexp_replace(${normalizedText(products.article)}, '[^0-9a-zа-я]+', '', 'g')`
+  const nameWords = sql`' ' || regexp_replace(${normalizedText(products.name)}, '[^0-9a-zа-я]+', ' ', 'g')`
+
+  // В словах только буквы и цифры - экранировать % и _ не нужно
+  return and(...terms.map(term => or(
+    sql`${compactArticle} LIKE ${`%${term}%`}`,
+    sql`${nameWords} LIKE ${`% ${term}%`}`
+  )))
+}
+
+/**
+ * Кэш каталога в памяти (CATALOG_CACHE=false - всегда читать из PostgreSQL)
+ * Порядок строк берётся из того же ORDER BY, что и у запросов из БД
+ */
+export const catalogCache = new CatalogCache(() =>
+  db.select()
+    .from(products)
+    .orderBy(leadTimePriority, asc(products.name), asc(products.id))
+)
+
+const CATALOG_CACHE_ENABLED = process.env.CATALOG_CACHE !== 'false'
+const LISTEN_RETRY_MS = 5000
+let listener: Awaited<ReturnType<typeof listen>> | null = null
+
+/**
+ * Подписывается на NOTIFY catalog_updated и загружает каталог в память
+ * Подписка идёт до загрузки, чтобы не пропустить обновление между ними
+ */
+export async function startCatalogCache(): Promise<void> {
+  if (!CATALOG_CACHE_ENABLED) return
+
+  try {
+    if (!listener) {
+      listener = await listen(
+        CATALOG_CHANNEL,
+        (version) => {
+          console.log(`🔄 Каталог обновлён (${version || 'без версии'}), перезагрузка кэша`)
+          catalogCache.reload(version || null).catch((error) => {
+            console.error('Ошибка перезагрузки кэша каталога:', error)
+          })
+        },
+        (error) => {
+          // Уведомления могли потеряться - читаем из БД, пока не подпишемся снова
+          console.error('⚠️ Потеряно LISTEN-соединение, кэш каталога отключён:', error.message)
+          listener = null
+          catalogCache.invalidate()
+          setTimeout(() => startCatalogCache(), LISTEN_RETRY_MS)
+        }
+      )
+    }
+    await catalogCache.reload()
+    console.log(`✅ Кэш каталога: ${catalogCache.get()?.items.length ?? 0} товаров`)
+  } catch (error) {
+    console.error('⚠️ Кэш каталога недоступен, чтение из PostgreSQL:', error)
+    catalogCache.invalidate()
+    setTimeout(() => startCatalogCache(), LISTEN_RETRY_MS)
+  }
+}
+
+/**
+ * Отписывается от уведомлений и сбрасывает кэш
+ */
+export async function stopCatalogCache(): Promise<void> {
+  if (listener) {
+    await listener.query(`UNLISTEN ${CATALOG_CHANNEL}`).catch(() => {})
+    listener.release()
+    listener = null
+  }
+  catalogCache.invalidate()
+}
+
 /**
  * Интерфейс для пагинации
  */
@@ -46,6 +131,9 @@ export class ProductsService {
     const limit = Math.min(params.limit || this.DEFAULT_LIMIT, this.MAX_LIMIT)
     const offset = params.offset || 0
 
+    const cached = catalogCache.get()
+    if (cached) return this.page(cached.items, limit, offset)
+
     const [items, totalResult] = await Promise.all([
       db.select()
         .from(products)
@@ -72,6 +160,9 @@ export class ProductsService {
     const limit = Math.min(params.limit || this.DEFAULT_LIMIT, this.MAX_LIMIT)
     const offset = params.offset || 0
 
+    const cached = catalogCache.get()
+    if (cached) return this.page(cached.byManufacturer.get(manufacturer) || [], limit, offset)
+
     const [items, totalResult] = await Promise.all([
       db.select()
         .from(products)
@@ -97,6 +188,9 @@ export class ProductsService {
    * Получить товар по артикулу
    */
   async getByArticle(article: string): Promise<Product | null> {
+    const cached = catalogCache.get()
+    if (cached) return cached.byArticle.get(article.toLowerCase()) || null
+
     const result = await db.select()
       .from(products)
       .where(eq(products.article, article.toLowerCase()))
@@ -108,22 +202,29 @@ export class ProductsService {
   /**
    * Поиск товаров с пагинацией
    * Сортировка: сначала по сроку (наличие), затем по алфавиту
+   * Пока кэш каталога не загружен - в PostgreSQL по тем же правилам, что и индекс
    */
   async search(query: string, params: PaginationParams = {}): Promise<PaginatedResult<Product>> {
     const limit = Math.min(params.limit || this.DEFAULT_LIMIT, this.MAX_LIMIT)
     const offset = params.offset || 0
-    const searchPattern = `%${query}%`
 
-    const whereClause = or(
-      ilike(products.article, searchPattern),
-      ilike(products.name, searchPattern)
-    )
+    // Поисковый индекс в памяти: подстрока артикула или префиксы слов наименования
+    const cached = catalogCache.get()
+    if (cached) {
+      const rows = searchIndexLookup(cached.searchIndex, query)
+      return this.page(rows.map(row => cached.items[row]), limit, offset)
+    }
+
+    const terms = searchTerms(query)
+    if (terms.length === 0) return { items: [], total: 0, hasMore: false }
+
+    const whereClause = searchCondition(terms)
 
     const [items, totalResult] = await Promise.all([
       db.select()
         .from(products)
         .where(whereClause)
-        .orderBy(leadTimePriority, asc(products.name))
+        .orderBy(leadTimePriority, asc(products.name), asc(products.id))
         .limit(limit)
         .offset(offset),
       db.select({ count: count() })
@@ -144,6 +245,9 @@ export class ProductsService {
    * Получить список производителей с количеством товаров
    */
   async getManufacturers(): Promise<{ name: string; count: number }[]> {
+    const cached = catalogCache.get()
+    if (cached) return cached.manufacturers
+
     const result = await db
       .select({
         name: products.manufacturer,
@@ -176,6 +280,11 @@ export class ProductsService {
    * Получить общее количество товаров
    */
   async getCount(manufacturer?: string): Promise<number> {
+    const cached = catalogCache.get()
+    if (cached) {
+      return manufacturer ? cached.byManufacturer.get(manufacturer)?.length || 0 : cached.items.length
+    }
+
     const query = manufacturer
       ? db.select({ count: count() }).from(products).where(eq(products.manufacturer, manufacturer))
       : db.select({ count: count() }).from(products)
@@ -183,6 +292,18 @@ export class ProductsService {
     const result = await query
     return result[0]?.count || 0
   }
+
+  /**
+   * Страница из отсортированного списка в памяти
+   */
+  private page(items: Product[], limit: number, offset: number): PaginatedResult<Product> {
+    const pageItems = items.slice(offset, offset + limit)
+    return {
+      items: pageItems,
+      total: items.length,
+      hasMore: offset + pageItems.length < items.length
+    }
+  }
 }
 
 // Экспорт синглтона
@@ -0,0 +1,98 @@
+/**
+ * Поисковый индекс каталога (тот же формат, что search.<hash>.json из build.py)
+ *
+ * Ключи - слова наименования и все суффиксы артикула: поиск по префиксу
+ * суффикса находит подстроку артикула. keys отсортированы для бинарного
+ * поиска, postings[i] - номера строк для keys[i] по возрастанию.
+ *
+ * Поиск в PostgreSQL (ProductsService.search без кэша) совпадает по тем же
+ * правилам. client/src/utils/searchIndex.ts - копия searchTerms и
+ * searchIndexLookup для браузера, синхронность проверяет search.index.test.ts.
+ */
+export interface SearchIndex {
+  version: number
+  articles: string[]
+  keys: string[]
+  postings: number[][]
+}
+
+const SEARCH_INDEX_VERSION = 1
+// Суффиксы от одного символа: иначе запрос из последней буквы артикула его не найдёт
+const SEARCH_MIN_SUFFIX = 1
+
+/**
+ * Нормализованные слова: нижний регистр, ё → е, только буквы и цифры
+ */
+export function searchTerms(text: string): string[] {
+  return text.toLowerCase().replace(/ё/g, 'е').match(/[0-9a-zа-я]+/g) || []
+}
+
+function searchKeys(article: string, name: string): Set<string> {
+  const articleTerms = searchTerms(article)
+  const compact = articleTerms.join('')
+  const keys = new Set<string>([compact, ...articleTerms, ...searchTerms(name)])
+
+  for (let i = 0; i <= compact.length - SEARCH_MIN_SUFFIX; i++) {
+    keys.add(compact.slice(i))
+  }
+  keys.delete('')
+  return keys
+}
+
+/**
+ * Строит индекс по товарам в порядке выдачи API
+ */
+export function buildSearchIndex(items: { article: string; name: string }[]): SearchIndex {
+  const postings = new Map<string, number[]>()
+
+  items.forEach((item, row) => {
+    for (const key of searchKeys(item.article, item.name)) {
+      let rows = postings.get(key)
+      if (!rows) {
+        rows = []
+        postings.set(key, rows)
+      }
+      rows.push(row)
+    }
+  })
+
+  // Сравнение по code units, как sorted() в Python
+  const keys = [...postings.keys()].sort((a, b) => (a < b ? -1 : a > b ? 1 : 0))
+  return {
+    version: SEARCH_INDEX_VERSION,
+    articles: items.map(item => item.article),
+    keys,
+    postings: keys.map(key => postings.get(key)!)
+  }
+}
+
+function lowerBound(keys: string[], term: string): number {
+  let lo = 0
+  let hi = keys.length
+  while (lo < hi) {
+    const mid = (lo + hi) >>> 1
+    if (keys[mid] < term) lo = mid + 1
+    else hi = mid
+  }
+  return lo
+}
+
+/**
+ * Номера строк, где каждое слово запроса - префикс ключа (в порядке выдачи)
+ */
+export function searchIndexLookup(index: SearchIndex, query: string): number[] {
+  let result: Set<number> | null = null
+
+  for (const term of searchTerms(query)) {
+    const rows = new Set<number>()
+    for (let i = lowerBound(index.keys, term); i < index.keys.length && index.keys[i].startsWith(term); i++) {
+      for (const row of index.postings[i]) {
+        if (!result || result.has(row)) rows.add(row)
+      }
+    }
+    result = rows
+    if (result.size === 0) return []
+  }
+
+  return result ? [...result].sort((a, b) => a - b) : []
+}
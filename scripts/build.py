@@ -11,19 +11,37 @@ Price System - Автоматизированная система генера
 - Уведомления в Telegram
 """
 
-import pandas as pd
+from __future__ import annotations
+
 import os
+import re
 import sys
 import io
+import gzip
 import json
-import requests
-from typing import Dict, List, Tuple, Optional
+import hashlib
+import html
+import threading
+from typing import Dict, List, Tuple, Optional, TYPE_CHECKING
 from datetime import datetime
+from contextlib import contextmanager
+
+# pandas, requests и Google API импортируются внутри функций, которые их используют:
+# запуск с USE_GOOGLE_DRIVE=false, --dry-run и тесты не платят за их загрузку
+from pricing import (
+    LEAD_TIME_ASTANA,
+    LEAD_TIME_ALMATY,
+    LEAD_TIME_ON_REQUEST,
+    clean,
+    safe_float,
+    manufacturer_slug,
+    determine_lead_time,
+)
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
-# Google Drive API
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
 
 # ============================================================================
 # КОНФИГУРАЦИЯ
@@ -41,6 +59,50 @@ TELEGRAM_CHAT_IDS = os.environ.get("TELEGRAM_CHAT_IDS", "272265312").split(",")
 INPUT_DIR = "input"
 OUTPUT_DIR = "output"
 
+# Режим наблюдения (--watch)
+WATCH_POLL_INTERVAL = float(os.environ.get("WATCH_POLL_INTERVAL", "3"))
+WATCH_DEBOUNCE = float(os.environ.get("WATCH_DEBOUNCE", "10"))
+WATCH_STATE_FILE = os.path.join(OUTPUT_DIR, ".drive_changes_token.json")
+
+# Клиент Google Drive: общие учётные данные, по сервису на поток
+DRIVE_HTTP_TIMEOUT = int(os.environ.get("DRIVE_HTTP_TIMEOUT", "60"))
+_drive_lock = threading.Lock()
+_drive_local = threading.local()
+_drive_credentials = None
+drive_setup_stats = {'seconds': 0.0, 'clients': 0}
+
+# Загрузка на Google Drive: кэш file_id, размер части и повторы resumable upload
+DRIVE_UPLOAD_CACHE = os.path.join(OUTPUT_DIR, ".drive_uploads.json")
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(5 * 1024 * 1024)))  # кратно 256 KB
+UPLOAD_RETRIES = int(os.environ.get("UPLOAD_RETRIES", "5"))
+
+# Канал NOTIFY: API-сервер перезагружает кэш каталога после загрузки в БД
+CATALOG_NOTIFY_CHANNEL = "catalog_updated"
+
+# products, секционированная по производителю: партиции грузятся параллельно,
+# неизменившиеся не перезаливаются
+PRODUCTS_PARTITIONED = os.environ.get("PRODUCTS_PARTITIONED", "false").lower() == "true"
+DB_LOAD_WORKERS = int(os.environ.get("DB_LOAD_WORKERS", "4"))
+
+# Профили сборки (регионы/партнёры): JSON-список, общие файлы поставщиков парсятся один раз
+BUILD_PROFILES_FILE = os.environ.get("BUILD_PROFILES", "")
+PROFILE_WORKERS = int(os.environ.get("PROFILE_WORKERS", "4"))
+BUILD_PROFILE = ""  # имя профиля в процессе профиля (для подписей в Telegram)
+
+# Пайплайн: отпечатки входов и результаты стадий прошлого запуска
+PIPELINE_STATE_DIR = os.path.join(OUTPUT_DIR, ".pipeline")
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", "4"))
+
+# Чекпойнты прогонов для --resume-from: результаты стадий и созданные файлы по run id
+RUNS_DIR = os.path.join(OUTPUT_DIR, "runs")
+RUNS_KEEP = int(os.environ.get("RUNS_KEEP", "5"))
+
+# История цен: снимок каждой сборки, партиции по дате
+HISTORY_DIR = os.environ.get("HISTORY_DIR", os.path.join(OUTPUT_DIR, "history"))
+
+# Статические снапшоты каталога (раздаются nginx через gzip_static)
+STATIC_CATALOG_DIR = os.environ.get("STATIC_CATALOG_DIR", os.path.join(OUTPUT_DIR, "catalog"))
+
 # Нужные бренды из Euroelectric.xlsx
 ALLOWED_BRANDS = [
     'AirRoxy',
@@ -54,6 +116,9 @@ ALLOWED_BRANDS = [
     'Schneider Electric'
 ]
 
+# Файлы остатков (для быстрого обновления --stock-only)
+STOCK_FILES = ['ostatki_Euroelectric.xlsx', 'dostupnost_Euroelectric.xlsx']
+
 # Файлы для скачивания из Google Drive
 DRIVE_FILES = {
     'Euroelectric.xlsx': None,
@@ -70,6 +135,8 @@ DRIVE_FILES = {
 
 def send_telegram_message(message: str, parse_mode: str = "HTML"):
     """Отправляет сообщение в Telegram"""
+    import requests
+    
     if not TELEGRAM_BOT_TOKEN:
         print("⚠️ TELEGRAM_BOT_TOKEN не указан, уведомления отключены")
         return
@@ -116,6 +183,8 @@ def notify_error(error: str):
 <code>{error[:500]}</code>
 
 🕐 {datetime.now().strftime('%d.%m.%Y %H:%M')}"""
+    if BUILD_PROFILE:
+        message = f"🏷 <b>{BUILD_PROFILE}</b>\n" + message
     send_telegram_message(message)
 
 
@@ -123,53 +192,110 @@ def notify_error(error: str):
 # GOOGLE DRIVE
 # ============================================================================
 
+def load_drive_credentials():
+    """Учётные данные сервисного аккаунта (загружаются один раз на процесс)"""
+    global _drive_credentials
+    from google.oauth2 import service_account
+    
+    with _drive_lock:
+        if _drive_credentials is not None:
+            return _drive_credentials
+        
+        # Используем полный доступ к Drive для возможности создания файлов
+        scopes = ['https://www.googleapis.com/auth/drive']
+        
+        # Проверяем наличие credentials
+        creds_json = os.environ.get("GOOGLE_CREDENTIALS_JSON")
+        
+        if creds_json:
+            # Credentials из переменной окружения (для GitHub Actions)
+            creds_dict = json.loads(creds_json)
+            credentials = service_account.Credentials.from_service_account_info(
+                creds_dict,
+                scopes=scopes
+            )
+        elif os.path.exists(CREDENTIALS_FILE):
+            # Credentials из файла (для локального запуска)
+            credentials = service_account.Credentials.from_service_account_file(
+                CREDENTIALS_FILE,
+                scopes=scopes
+            )
+        else:
+            raise FileNotFoundError(
+                f"❌ Credentials не найдены!\n"
+                f"Укажите GOOGLE_CREDENTIALS_JSON или создайте {CREDENTIALS_FILE}"
+            )
+        
+        _drive_credentials = credentials
+        return credentials
+
+
 def get_drive_service(readonly: bool = True):
-    """Создает сервис Google Drive API"""
-    # Используем полный доступ к Drive для возможности создания файлов
-    scopes = ['https://www.googleapis.com/auth/drive']
-    
-    # Проверяем наличие credentials
-    creds_json = os.environ.get("GOOGLE_CREDENTIALS_JSON")
-    
-    if creds_json:
-        # Credentials из переменной окружения (для GitHub Actions)
-        creds_dict = json.loads(creds_json)
-        credentials = service_account.Credentials.from_service_account_info(
-            creds_dict,
-            scopes=scopes
-        )
-    elif os.path.exists(CREDENTIALS_FILE):
-        # Credentials из файла (для локального запуска)
-        credentials = service_account.Credentials.from_service_account_file(
-            CREDENTIALS_FILE,
-            scopes=scopes
-        )
-    else:
-        raise FileNotFoundError(
-            f"❌ Credentials не найдены!\n"
-            f"Укажите GOOGLE_CREDENTIALS_JSON или создайте {CREDENTIALS_FILE}"
-        )
+    """Сервис Google Drive API для текущего потока
+    
+    Клиент googleapiclient не потокобезопасен, поэтому у каждого потока свой
+    сервис со своим keep-alive соединением; учётные данные общие. Discovery-документ
+    берётся из пакета (static_discovery), а не скачивается.
+    """
+    service = getattr(_drive_local, 'service', None)
+    if service is not None:
+        return service
+    
+    import time
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build
+    
+    started = time.time()
+    http = AuthorizedHttp(load_drive_credentials(), http=httplib2.Http(timeout=DRIVE_HTTP_TIMEOUT))
+    service = build('drive', 'v3', http=http, static_discovery=True, cache_discovery=False)
+    _drive_local.service = service
     
-    return build('drive', 'v3', credentials=credentials)
+    with _drive_lock:
+        drive_setup_stats['seconds'] += time.time() - started
+        drive_setup_stats['clients'] += 1
+    
+    return service
 
 
-def list_drive_files(service) -> Dict[str, str]:
-    """Получает список файлов в папке Google Drive"""
+def reset_drive_setup_stats():
+    """Обнуляет счётчики подключения к Drive перед сборкой (в --watch процесс живёт долго)"""
+    with _drive_lock:
+        drive_setup_stats['seconds'] = 0.0
+        drive_setup_stats['clients'] = 0
+
+
+def print_drive_setup_stats():
+    """Время подключения к Drive за сборку"""
+    if drive_setup_stats['clients']:
+        print(f"  ⏱ подключение к Drive: {drive_setup_stats['seconds']:.2f} сек "
+              f"(клиентов: {drive_setup_stats['clients']})")
+
+
+def list_drive_file_meta(service) -> Dict[str, Dict]:
+    """Получает метаданные файлов в папке Google Drive: {имя: {id, md5Checksum, ...}}"""
     results = service.files().list(
         q=f"'{GOOGLE_DRIVE_FOLDER_ID}' in parents and trashed=false",
-        fields="files(id, name, mimeType, modifiedTime)"
+        fields="files(id, name, mimeType, modifiedTime, md5Checksum)"
     ).execute()
     
     files = {}
     for f in results.get('files', []):
-        files[f['name']] = f['id']
+        files[f['name']] = f
         print(f"  📄 {f['name']}")
     
     return files
 
 
+def list_drive_files(service) -> Dict[str, str]:
+    """Получает список файлов в папке Google Drive"""
+    return {name: f['id'] for name, f in list_drive_file_meta(service).items()}
+
+
 def download_file_from_drive(service, file_id: str, file_name: str) -> bytes:
     """Скачивает файл из Google Drive"""
+    from googleapiclient.http import MediaIoBaseDownload
+    
     request = service.files().get_media(fileId=file_id)
     file_buffer = io.BytesIO()
     downloader = MediaIoBaseDownload(file_buffer, request)
@@ -182,8 +308,8 @@ def download_file_from_drive(service, file_id: str, file_name: str) -> bytes:
     return file_buffer.read()
 
 
-def download_all_files_from_drive() -> bool:
-    """Скачивает все необходимые файлы из Google Drive"""
+def download_all_files_from_drive(file_names: Optional[List[str]] = None) -> bool:
+    """Скачивает необходимые файлы из Google Drive (по умолчанию все DRIVE_FILES)"""
     print("\n📥 Скачивание файлов из Google Drive...")
     
     try:
@@ -192,7 +318,7 @@ def download_all_files_from_drive() -> bool:
         
         os.makedirs(INPUT_DIR, exist_ok=True)
         
-        for file_name in DRIVE_FILES.keys():
+        for file_name in (file_names or DRIVE_FILES.keys()):
             if file_name in drive_files:
                 file_id = drive_files[file_name]
                 content = download_file_from_drive(service, file_id, file_name)
@@ -213,48 +339,150 @@ def download_all_files_from_drive() -> bool:
         return False
 
 
+def download_drive_file(file_name: str, drive_meta: Dict[str, Dict]) -> Optional[str]:
+    """Скачивает один входной файл, если он изменился на Google Drive
+    
+    Returns:
+        локальный путь или None, если файла нет на Drive
+    """
+    if file_name not in drive_meta:
+        if file_name != 'name_cache.xlsx':  # name_cache может не существовать
+            print(f"  ⚠️ {file_name} не найден в Google Drive")
+        return None
+    
+    local_path = os.path.join(INPUT_DIR, file_name)
+    remote_md5 = drive_meta[file_name].get('md5Checksum')
+    if remote_md5 and os.path.exists(local_path) and file_md5(local_path) == remote_md5:
+        print(f"  ⏭ {file_name} не изменился")
+        return local_path
+    
+    service = get_drive_service()
+    content = download_file_from_drive(service, drive_meta[file_name]['id'], file_name)
+    
+    os.makedirs(INPUT_DIR, exist_ok=True)
+    with open(local_path, 'wb') as f:
+        f.write(content)
+    
+    print(f"  ✅ {file_name} ({len(content) / 1024:.1f} KB)")
+    return local_path
+
+
+def load_drive_upload_cache() -> Dict[str, str]:
+    """Кэш {имя файла на Drive: file_id} загруженных файлов"""
+    if not os.path.exists(DRIVE_UPLOAD_CACHE):
+        return {}
+    try:
+        with open(DRIVE_UPLOAD_CACHE, encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_drive_upload_cache(cache: Dict[str, str]):
+    os.makedirs(os.path.dirname(DRIVE_UPLOAD_CACHE) or '.', exist_ok=True)
+    with open(DRIVE_UPLOAD_CACHE, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+
+
+def find_drive_file(service, drive_filename: str) -> Optional[Dict]:
+    """Ищет файл в папке: сначала по закэшированному id, затем запросом по имени"""
+    fields = "id, md5Checksum, appProperties, trashed"
+    file_id = load_drive_upload_cache().get(drive_filename)
+    
+    if file_id:
+        try:
+            file = service.files().get(fileId=file_id, fields=fields).execute()
+            if not file.get('trashed'):
+                return file
+        except Exception:
+            pass  # файл удалён - ищем по имени
+    
+    results = service.files().list(
+        q=f"name='{drive_filename}' and '{GOOGLE_DRIVE_FOLDER_ID}' in parents and trashed=false",
+        fields=f"files({fields})"
+    ).execute()
+    existing_files = results.get('files', [])
+    return existing_files[0] if existing_files else None
+
+
+def execute_resumable(request) -> Dict:
+    """Загружает файл по частям, при сбое продолжает с последней части"""
+    import time
+    
+    response = None
+    failures = 0
+    
+    while response is None:
+        try:
+            status, response = request.next_chunk(num_retries=3)
+            failures = 0
+            if status and response is None:
+                print(f"  ⏳ {status.progress() * 100:.0f}%")
+        except Exception as e:
+            failures += 1
+            if failures > UPLOAD_RETRIES:
+                raise
+            print(f"  ⚠️ Сбой загрузки ({e}), повтор {failures}/{UPLOAD_RETRIES}...")
+            time.sleep(2 ** failures)
+    
+    return response
+
+
 def upload_file_to_drive(local_path: str, drive_filename: str) -> Optional[str]:
-    """Загружает файл на Google Drive"""
+    """Загружает файл на Google Drive
+    
+    Загрузка пропускается, если на Drive уже лежит тот же файл: совпадает
+    md5Checksum или сохранённый в appProperties хэш содержимого xlsx
+    (сам xlsx каждый раз отличается датой создания).
+    """
+    from googleapiclient.http import MediaFileUpload
+    
     print(f"\n📤 Загрузка {drive_filename} на Google Drive...")
     
     try:
         service = get_drive_service(readonly=False)
         
-        file_metadata = {
-            'name': drive_filename,
-            'parents': [GOOGLE_DRIVE_FOLDER_ID]
-        }
-        
-        media = MediaFileUpload(
-            local_path,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            resumable=True
-        )
-        
-        # Проверяем, существует ли файл с таким именем
-        results = service.files().list(
-            q=f"name='{drive_filename}' and '{GOOGLE_DRIVE_FOLDER_ID}' in parents and trashed=false",
-            fields="files(id)"
-        ).execute()
-        
-        existing_files = results.get('files', [])
+        content_md5 = xlsx_content_md5(local_path)
+        existing = find_drive_file(service, drive_filename)
         
-        if existing_files:
-            # Обновляем существующий файл
-            file_id = existing_files[0]['id']
-            file = service.files().update(
-                fileId=file_id,
-                media_body=media
-            ).execute()
-            print(f"  ✅ Файл обновлён: {drive_filename}")
+        if existing and (existing.get('md5Checksum') == file_md5(local_path)
+                         or existing.get('appProperties', {}).get('contentMd5') == content_md5):
+            print(f"  ⏭ Файл не изменился: {drive_filename}")
+            file = existing
         else:
-            # Создаём новый файл
-            file = service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
-            print(f"  ✅ Файл создан: {drive_filename}")
+            media = MediaFileUpload(
+                local_path,
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                chunksize=UPLOAD_CHUNK_SIZE,
+                resumable=True
+            )
+            app_properties = {'contentMd5': content_md5}
+            
+            if existing:
+                # Обновляем существующий файл
+                file = execute_resumable(service.files().update(
+                    fileId=existing['id'],
+                    body={'appProperties': app_properties},
+                    media_body=media,
+                    fields='id'
+                ))
+                print(f"  ✅ Файл обновлён: {drive_filename}")
+            else:
+                # Создаём новый файл
+                file = execute_resumable(service.files().create(
+                    body={
+                        'name': drive_filename,
+                        'parents': [GOOGLE_DRIVE_FOLDER_ID],
+                        'appProperties': app_properties
+                    },
+                    media_body=media,
+                    fields='id'
+                ))
+                print(f"  ✅ Файл создан: {drive_filename}")
+        
+        cache = load_drive_upload_cache()
+        cache[drive_filename] = file['id']
+        save_drive_upload_cache(cache)
         
         return file.get('id')
         
@@ -263,11 +491,19 @@ def upload_file_to_drive(local_path: str, drive_filename: str) -> Optional[str]:
         return None
 
 
-def send_telegram_file(file_path: str, caption: str = ""):
-    """Отправляет файл в Telegram"""
+def send_telegram_file(file_path: str, caption: str = "") -> Dict[str, int]:
+    """Отправляет файл в Telegram
+    
+    Returns:
+        {chat_id: message_id} успешно отправленных сообщений
+    """
+    import requests
+    
+    sent = {}
+    
     if not TELEGRAM_BOT_TOKEN:
         print("  ⚠️ TELEGRAM_BOT_TOKEN не указан")
-        return
+        return sent
     
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendDocument"
     
@@ -288,32 +524,124 @@ def send_telegram_file(file_path: str, caption: str = ""):
                     timeout=120
                 )
             if response.status_code == 200:
+                sent[chat_id] = response.json()['result']['message_id']
                 print(f"  📱 Telegram: файл отправлен в {chat_id}")
             else:
                 print(f"  ⚠️ Telegram ошибка: {response.text}")
         except Exception as e:
             print(f"  ⚠️ Telegram ошибка: {e}")
+    
+    return sent
+
+
+def edit_telegram_caption(messages: Dict[str, int], caption: str):
+    """Меняет подпись у уже отправленных файлов"""
+    import requests
+    
+    if not TELEGRAM_BOT_TOKEN:
+        return
+    
+    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/editMessageCaption"
+    
+    for chat_id, message_id in messages.items():
+        try:
+            response = requests.post(url, json={
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "caption": caption,
+                "parse_mode": "HTML"
+            }, timeout=10)
+            if response.status_code != 200:
+                print(f"  ⚠️ Telegram ошибка: {response.text}")
+        except Exception as e:
+            print(f"  ⚠️ Telegram ошибка: {e}")
 
 
 # ============================================================================
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 # ============================================================================
 
-def clean(x):
-    """Очистка строковых значений"""
-    if isinstance(x, str):
-        return x.strip()
-    return x
+def xlsx_content_md5(path: str) -> str:
+    """MD5 содержимого xlsx без метаданных (дата создания меняется при каждой записи)"""
+    import zipfile
+    
+    try:
+        digest = hashlib.md5()
+        with zipfile.ZipFile(path) as archive:
+            for name in sorted(archive.namelist()):
+                if name == 'docProps/core.xml':
+                    continue
+                digest.update(name.encode('utf-8'))
+                digest.update(archive.read(name))
+        return digest.hexdigest()
+    except zipfile.BadZipFile:
+        return file_md5(path)
+
+
+def file_md5(path: str) -> str:
+    """MD5 содержимого файла (как md5Checksum в Google Drive)"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
-def safe_float(x):
-    """Безопасное преобразование в float"""
-    try:
-        if pd.isna(x):
-            return None
-        return float(x)
-    except:
-        return None
+# ============================================================================
+# КАТАЛОГ (КОЛОНОЧНОЕ ПРЕДСТАВЛЕНИЕ)
+# ============================================================================
+
+# Каталог между стадиями - один DataFrame, а не список словарей.
+# Повторяющиеся строки хранятся как category, дилерская цена остаётся
+# float64: во float32 цены в тенге теряют копейки и меняется округление.
+CATALOG_COLUMNS = ['manufacturer', 'article', 'name', 'dealer_price_kzt', 'srok', 'catalog_url', 'image_url']
+CATALOG_DTYPES = {
+    'manufacturer': 'category',
+    'article': 'object',
+    'name': 'object',
+    'dealer_price_kzt': 'float64',
+    'srok': 'category',
+    'catalog_url': 'category',
+    'image_url': 'category',
+}
+
+
+def make_catalog(records) -> pd.DataFrame:
+    """Создаёт компактный каталог из кортежей (в порядке CATALOG_COLUMNS) или словарей"""
+    import pandas as pd
+    
+    df = pd.DataFrame.from_records(records, columns=CATALOG_COLUMNS) if len(records) else \
+        pd.DataFrame(columns=CATALOG_COLUMNS)
+    df['article'] = df['article'].astype(str)
+    return df.astype(CATALOG_DTYPES)
+
+
+def concat_catalogs(*catalogs: pd.DataFrame) -> pd.DataFrame:
+    """Объединяет каталоги поставщиков (категории пересобираются по общему набору)"""
+    import pandas as pd
+    
+    return pd.concat([c.astype(object) for c in catalogs], ignore_index=True).astype(CATALOG_DTYPES)
+
+
+def catalog_margins(articles: pd.Series, manufacturers: pd.Series,
+                    margins_dict: Dict) -> Tuple[pd.Series, pd.Categorical]:
+    """Маржа и её источник для всего каталога (векторная версия get_margin)
+    
+    Returns:
+        (маржа, источник: 'article' | 'manufacturer' | 'global')
+    """
+    import numpy as np
+    import pandas as pd
+    
+    by_article = articles.astype(object).map(margins_dict['by_article'])
+    by_manufacturer = manufacturers.astype(object).map(margins_dict['by_manufacturer'])
+    
+    margin = by_article.fillna(by_manufacturer).fillna(margins_dict['global_margin']).astype('float64')
+    source = pd.Categorical.from_codes(
+        np.select([by_article.notna(), by_manufacturer.notna()], [0, 1], 2),
+        categories=['article', 'manufacturer', 'global']
+    )
+    return margin, source
 
 
 # ============================================================================
@@ -322,6 +650,8 @@ def safe_float(x):
 
 def load_name_cache() -> Dict[str, str]:
     """Загружает кэш наименований из name_cache.xlsx"""
+    import pandas as pd
+    
     cache_file = os.path.join(INPUT_DIR, "name_cache.xlsx")
     cache = {}
     
@@ -370,6 +700,8 @@ def load_name_cache() -> Dict[str, str]:
 
 def load_settings() -> Tuple[Dict, Dict]:
     """Загружает настройки из settings.xlsx"""
+    import pandas as pd
+    
     settings_file = os.path.join(INPUT_DIR, "settings.xlsx")
     
     if not os.path.exists(settings_file):
@@ -409,6 +741,8 @@ def load_settings() -> Tuple[Dict, Dict]:
 
 def validate_settings(settings_dict: Dict):
     """Проверяет обязательные параметры"""
+    import pandas as pd
+    
     required = ['kurs', 'global_margin']
     
     for param in required:
@@ -426,6 +760,8 @@ def validate_settings(settings_dict: Dict):
 
 def load_stock() -> Tuple[Dict, Dict]:
     """Загружает остатки из Алматы и Астаны"""
+    import pandas as pd
+    
     almaty_file = os.path.join(INPUT_DIR, "ostatki_Euroelectric.xlsx")
     astana_file = os.path.join(INPUT_DIR, "dostupnost_Euroelectric.xlsx")
     
@@ -465,29 +801,19 @@ def load_stock() -> Tuple[Dict, Dict]:
     return almaty_stock, astana_stock
 
 
-def determine_lead_time(article: str, almaty: Dict, astana: Dict) -> str:
-    """Определяет срок доставки по наличию"""
-    astana_qty = astana.get(article, 0)
-    almaty_qty = almaty.get(article, 0)
-    
-    if astana_qty > 0:
-        return "6-10 дней"
-    if almaty_qty > 0:
-        return "10-14 дней"
-    return "по запросу"
-
-
 # ============================================================================
 # ПАРСИНГ EUROELECTRIC
 # ============================================================================
 
-def parse_euroelectric(almaty: Dict, astana: Dict, name_cache: Dict) -> List[Dict]:
+def parse_euroelectric(almaty: Dict, astana: Dict, name_cache: Dict) -> pd.DataFrame:
     """Парсит единый файл Euroelectric.xlsx с использованием кэша наименований"""
+    import pandas as pd
+    
     main_file = os.path.join(INPUT_DIR, "Euroelectric.xlsx")
     
     if not os.path.exists(main_file):
         print(f"⚠️ Файл {main_file} не найден, пропускаем EuroElectric")
-        return []
+        return make_catalog([])
     
     df = pd.read_excel(main_file)
     all_products = []
@@ -523,15 +849,7 @@ def parse_euroelectric(almaty: Dict, astana: Dict, name_cache: Dict) -> List[Dic
         dealer_price_kzt = round(rrc * 0.6, 2)
         lead_time = determine_lead_time(article, almaty, astana)
         
-        all_products.append({
-            'manufacturer': brand,
-            'article': article,
-            'name': name,
-            'dealer_price_kzt': dealer_price_kzt,
-            'srok': lead_time,
-            'catalog_url': '',
-            'image_url': ''
-        })
+        all_products.append((brand, article, name, dealer_price_kzt, lead_time, '', ''))
         
         brand_counts[brand] = brand_counts.get(brand, 0) + 1
     
@@ -540,20 +858,22 @@ def parse_euroelectric(almaty: Dict, astana: Dict, name_cache: Dict) -> List[Dic
     for brand in sorted(brand_counts.keys()):
         print(f"     • {brand}: {brand_counts[brand]}")
     
-    return all_products
+    return make_catalog(all_products)
 
 
 # ============================================================================
 # ПАРСИНГ AXIMA (WAGO)
 # ============================================================================
 
-def parse_axima() -> List[Dict]:
+def parse_axima() -> pd.DataFrame:
     """Парсит прайс Axima (Wago)"""
+    import pandas as pd
+    
     axima_file = os.path.join(INPUT_DIR, "Axima_price.xlsx")
     
     if not os.path.exists(axima_file):
         print(f"⚠️ Файл {axima_file} не найден, пропускаем Axima")
-        return []
+        return make_catalog([])
     
     df = pd.read_excel(axima_file, header=None)
     products = []
@@ -568,32 +888,100 @@ def parse_axima() -> List[Dict]:
         if not article or not name or price is None or price <= 0:
             continue
         
-        products.append({
-            'manufacturer': 'Wago',
-            'article': article,
-            'name': name,
-            'dealer_price_kzt': price,
-            'srok': '10-14 дней',
-            'catalog_url': '',
-            'image_url': ''
-        })
+        products.append(('Wago', article, name, price, '10-14 дней', '', ''))
     
     print(f"  ✅ Wago: {len(products)} товаров")
-    return products
+    return make_catalog(products)
+
+
+# ============================================================================
+# ДЕДУПЛИКАЦИЯ АРТИКУЛОВ
+# ============================================================================
+
+def article_keys(articles: pd.Series) -> pd.Series:
+    """Артикулы как в БД и ключах остатков: без пробелов по краям, нижний регистр"""
+    return articles.astype(str).str.strip().str.lower()
+
+
+def dedupe_catalog(catalogs: Dict[str, pd.DataFrame], policy: str = 'cheapest',
+                   supplier_priority: Optional[List[str]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Объединяет каталоги поставщиков и оставляет по одному товару на артикул
+    
+    Артикулы сравниваются без регистра и пробелов по краям (как в БД).
+    Победитель среди дублей:
+        'cheapest' - минимальная дилерская цена, при равенстве - приоритет поставщика
+        'priority' - первый поставщик из supplier_priority, затем дешевле
+    
+    Args:
+        catalogs: {поставщик: каталог}, порядок задаёт приоритет по умолчанию
+    
+    Returns:
+        (каталог без дублей, отчёт о конфликтах)
+    """
+    import numpy as np
+    import pandas as pd
+    
+    if policy not in ('cheapest', 'priority'):
+        raise ValueError(f"❌ Неизвестная политика дедупликации: {policy}")
+    
+    suppliers = list(catalogs.keys())
+    priority = list(supplier_priority or []) + [s for s in suppliers if s not in (supplier_priority or [])]
+    
+    df = concat_catalogs(*catalogs.values())
+    supplier = np.repeat(suppliers, [len(c) for c in catalogs.values()])
+    key = article_keys(df['article'])
+    
+    # duplicated() строит хэш-индекс по ключу - без сортировки всего каталога
+    dup_mask = key.duplicated(keep=False).to_numpy()
+    if not dup_mask.any():
+        return df, pd.DataFrame()
+    
+    conflicts = df[dup_mask].assign(
+        article_key=key[dup_mask],
+        supplier=supplier[dup_mask],
+        supplier_rank=pd.Series(supplier[dup_mask], index=df.index[dup_mask]).map(
+            {name: rank for rank, name in enumerate(priority)})
+    )
+    order = ['article_key', 'dealer_price_kzt', 'supplier_rank'] if policy == 'cheapest' \
+        else ['article_key', 'supplier_rank', 'dealer_price_kzt']
+    winners = conflicts.sort_values(order, kind='stable').drop_duplicates('article_key').index
+    
+    keep = ~dup_mask
+    keep[df.index.get_indexer(winners)] = True
+    conflicts['winner'] = conflicts.index.isin(winners)
+    
+    report = conflicts.sort_values(['article_key', 'winner'], ascending=[True, False])[
+        ['article_key', 'supplier', 'manufacturer', 'article', 'name', 'dealer_price_kzt', 'winner']
+    ].reset_index(drop=True)
+    
+    return df[keep].reset_index(drop=True), report
+
+
+def write_conflict_report(report: pd.DataFrame) -> Optional[str]:
+    """Сохраняет отчёт о дублях артикулов в output/DUPLICATES_<дата>.xlsx"""
+    if report.empty:
+        return None
+    
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    filename = f"DUPLICATES_{datetime.now().strftime('%Y-%m-%d')}.xlsx"
+    output_path = os.path.join(OUTPUT_DIR, filename)
+    report.to_excel(output_path, index=False)
+    
+    print(f"  ⚠️ Дубли артикулов: {report['article_key'].nunique()} (отчёт: {filename})")
+    return output_path
 
 
 # ============================================================================
 # ГЕНЕРАЦИЯ EXCEL ФАЙЛОВ
 # ============================================================================
 
-def generate_internal(products: List[Dict]) -> Tuple[str, str]:
+def generate_internal(catalog: pd.DataFrame) -> Tuple[str, str]:
     """Генерирует внутренний прайс с дилерскими ценами
     
     Returns:
         (local_path, filename_with_date)
     """
-    df = pd.DataFrame(products)
-    df = df.sort_values(['manufacturer', 'article'])
+    df = catalog.sort_values(['manufacturer', 'article'])
     
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
@@ -608,48 +996,24 @@ def generate_internal(products: List[Dict]) -> Tuple[str, str]:
     return output_path, filename
 
 
-def get_margin(article: str, manufacturer: str, margins_dict: Dict) -> float:
-    """Возвращает маржу с учетом приоритета"""
-    if article in margins_dict['by_article']:
-        return margins_dict['by_article'][article]
-    if manufacturer in margins_dict['by_manufacturer']:
-        return margins_dict['by_manufacturer'][manufacturer]
-    return margins_dict['global_margin']
-
-
-def calculate_client_price(dealer_price_kzt: float, article: str, manufacturer: str,
-                          kurs: float, margins_dict: Dict) -> int:
-    """Рассчитывает клиентскую цену в рублях"""
-    margin = get_margin(article, manufacturer, margins_dict)
-    client_price_rub = (dealer_price_kzt * (1 + margin)) / kurs
-    return round(client_price_rub)
-
-
-def generate_public(products: List[Dict], settings_dict: Dict, margins_dict: Dict) -> Tuple[pd.DataFrame, str]:
+def generate_public(catalog: pd.DataFrame, settings_dict: Dict, margins_dict: Dict) -> Tuple[pd.DataFrame, str]:
     """Генерирует клиентский прайс с финальными ценами в рублях"""
+    import pandas as pd
+    
     kurs = settings_dict['kurs']
     
-    public_data = []
-    for p in products:
-        client_price = calculate_client_price(
-            p['dealer_price_kzt'],
-            p['article'],
-            p['manufacturer'],
-            kurs,
-            margins_dict
-        )
-        
-        public_data.append({
-            'Производитель': p['manufacturer'],
-            'Артикул': p['article'],
-            'Наименование': p['name'],
-            'Цена, руб': client_price,
-            'Срок поставки': p['srok'],
-            'catalog_url': p['catalog_url'],
-            'image_url': p['image_url']
-        })
+    margin, _ = catalog_margins(catalog['article'], catalog['manufacturer'], margins_dict)
+    client_price = ((catalog['dealer_price_kzt'] * (1 + margin)) / kurs).round().astype('int64')
     
-    df = pd.DataFrame(public_data)
+    df = pd.DataFrame({
+        'Производитель': catalog['manufacturer'],
+        'Артикул': catalog['article'],
+        'Наименование': catalog['name'],
+        'Цена, руб': client_price,
+        'Срок поставки': catalog['srok'],
+        'catalog_url': catalog['catalog_url'],
+        'image_url': catalog['image_url']
+    })
     df = df.sort_values(['Производитель', 'Артикул'])
     
     output_path = os.path.join(OUTPUT_DIR, "PUBLIC.xlsx")
@@ -660,50 +1024,457 @@ def generate_public(products: List[Dict], settings_dict: Dict, margins_dict: Dic
 
 
 # ============================================================================
-# ЗАГРУЗКА В POSTGRESQL
+# СТРОКИ КАТАЛОГА ДЛЯ САЙТА
 # ============================================================================
 
-def upload_to_postgresql(products: List[Dict], settings_dict: Dict, 
-                         almaty_stock: Dict, astana_stock: Dict, 
-                         margins_dict: Dict) -> bool:
-    """Загружает данные в PostgreSQL для веб-приложения"""
+def prepare_catalog_rows(catalog: pd.DataFrame, settings_dict: Dict,
+                         almaty_stock: Dict, astana_stock: Dict,
+                         margins_dict: Dict) -> pd.DataFrame:
+    """Готовит строки каталога для сайта (цена в рублях, остатки, срок)
+    
+    Колонки идут в порядке INSERT в upload_to_postgresql.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    kurs = settings_dict.get('kurs', 5)
+    
+    articles = article_keys(catalog['article'])
+    margin, margin_source = catalog_margins(articles, catalog['manufacturer'], margins_dict)
+    # Series.round - банковское округление, как round() в Python
+    price_rub = ((catalog['dealer_price_kzt'] * (1 + margin)) / kurs).round().astype('int32')
+    
+    astana_qty = articles.map(astana_stock).fillna(0).astype('int32')
+    almaty_qty = articles.map(almaty_stock).fillna(0).astype('int32')
+    
+    srok = catalog['srok'].astype(object)
+    lead_time = srok.where(
+        srok.notna() & (srok != ''),
+        np.select([astana_qty > 0, almaty_qty > 0], [LEAD_TIME_ASTANA, LEAD_TIME_ALMATY], LEAD_TIME_ON_REQUEST)
+    )
+    
+    return pd.DataFrame({
+        'manufacturer': catalog['manufacturer'],
+        'article': articles,
+        'name': catalog['name'],
+        'price_rub': price_rub,
+        'lead_time_default': lead_time.astype('category'),
+        'astana_qty': astana_qty,
+        'almaty_qty': almaty_qty,
+        'catalog_url': catalog['catalog_url'],
+        'image_url': catalog['image_url'],
+        'dealer_price_kzt': catalog['dealer_price_kzt'],
+        'margin_source': margin_source,
+    })
+
+
+# ============================================================================
+# СТАТИЧЕСКИЕ СНАПШОТЫ КАТАЛОГА
+# ============================================================================
+
+def lead_time_priority(rows: pd.DataFrame) -> np.ndarray:
+    """Приоритет сортировки как в API: Астана → Алматы → по запросу"""
+    import numpy as np
+    
+    return np.select([rows['astana_qty'] > 0, rows['almaty_qty'] > 0], [0, 1], 2)
+
+
+def write_static_shard(directory: str, stem: str, payload: Dict) -> str:
+    """Пишет JSON-шард с хэшем содержимого в имени + .gz/.br рядом
+    
+    Returns:
+        имя файла шарда
+    """
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest()[:12]
+    filename = f"{stem}.{digest}.json"
+    path = os.path.join(directory, filename)
+    
+    with open(path, 'wb') as f:
+        f.write(body)
+    
+    # mtime=0 - одинаковое содержимое даёт одинаковый .gz
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(body, compresslevel=9, mtime=0))
+    
     try:
-        import psycopg2
-        from psycopg2.extras import execute_values
+        import brotli
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(body, quality=11))
     except ImportError:
-        print("❌ Библиотека psycopg2 не установлена!")
-        return False
+        pass
     
-    database_url = os.environ.get('DATABASE_URL') or settings_dict.get('database_url')
+    return filename
+
+
+# Поисковый индекс: ключи - слова наименования и все суффиксы артикула
+# (поиск по префиксу суффикса = поиск подстроки в артикуле, как ILIKE).
+# Суффиксы от одного символа: иначе запрос из последней буквы артикула его не найдёт
+SEARCH_INDEX_VERSION = 1
+SEARCH_MIN_SUFFIX = 1
+
+
+def search_terms(text: str) -> List[str]:
+    """Нормализованные слова: нижний регистр, ё → е, только буквы и цифры"""
+    return re.findall(r'[0-9a-zа-я]+', str(text).lower().replace('ё', 'е'))
+
+
+def search_keys(article: str, name: str) -> set:
+    """Ключи индекса для одного товара"""
+    compact = ''.join(search_terms(article))
+    keys = {compact[i:] for i in range(len(compact) - SEARCH_MIN_SUFFIX + 1)} | {compact}
+    keys.update(search_terms(article))
+    keys.update(search_terms(name))
+    keys.discard('')
+    return keys
+
+
+def build_search_index(articles: List[str], names: List[str]) -> Dict:
+    """Поисковый индекс каталога
     
-    if not database_url:
-        print("❌ DATABASE_URL не указан!")
-        return False
+    Строки - товары в порядке выдачи API, keys отсортированы для бинарного
+    поиска по префиксу, postings[i] - номера строк для keys[i] по возрастанию.
+    """
+    postings: Dict[str, List[int]] = {}
+    for row, (article, name) in enumerate(zip(articles, names)):
+        for key in search_keys(article, name):
+            postings.setdefault(key, []).append(row)
     
-    print("\n🔄 Загрузка в PostgreSQL...")
+    keys = sorted(postings)
+    return {
+        'version': SEARCH_INDEX_VERSION,
+        'articles': list(articles),
+        'keys': keys,
+        'postings': [postings[key] for key in keys]
+    }
+
+
+def search_index_lookup(index: Dict, query: str) -> List[int]:
+    """Номера строк, где каждое слово запроса - префикс ключа (в порядке выдачи)"""
+    from bisect import bisect_left
+    
+    keys = index['keys']
+    result = None
+    
+    for term in search_terms(query):
+        rows = set()
+        i = bisect_left(keys, term)
+        while i < len(keys) and keys[i].startswith(term):
+            rows.update(index['postings'][i])
+            i += 1
+        result = rows if result is None else result & rows
+        if not result:
+            return []
     
+    return sorted(result) if result else []
+
+
+def static_manifest_files(index_path: str) -> set:
+    """Имена шардов, на которые ссылается index.json (пустое множество, если его нет)"""
     try:
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor()
+        with open(index_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    files = {manifest['all']['file']} | {m['file'] for m in manifest.get('manufacturers', [])}
+    if manifest.get('search'):
+        files.add(manifest['search']['file'])
+    return files
+
+
+def generate_static_snapshots(catalog: pd.DataFrame, settings_dict: Dict,
+                              almaty_stock: Dict, astana_stock: Dict,
+                              margins_dict: Dict) -> Optional[str]:
+    """Генерирует предсжатые JSON-шарды каталога по производителям + индекс
+    
+    Структура STATIC_CATALOG_DIR:
+        index.json                       - манифест (не кэшируется)
+        all.<hash>.json[.gz|.br]         - весь каталог
+        search.<hash>.json[...]          - поисковый индекс по строкам all
+        <производитель>.<hash>.json[...] - шард производителя
+    
+    Returns:
+        путь к index.json или None при ошибке
+    """
+    import numpy as np
+    import pandas as pd
+    
+    print(f"\n🗂 Генерация статических снапшотов в {STATIC_CATALOG_DIR}...")
+    
+    try:
+        rows = prepare_catalog_rows(catalog, settings_dict, almaty_stock, astana_stock, margins_dict)
         
-        kurs = settings_dict.get('kurs', 5)
+        # id - порядковый номер в статическом каталоге (с id в БД не совпадает,
+        # товар идентифицируется парой manufacturer + article)
+        rows = rows.sort_values(['manufacturer', 'article']).reset_index(drop=True)
+        rows['id'] = np.arange(1, len(rows) + 1)
+        # Сортировка как в API: сначала по наличию, затем по наименованию
+        rows['priority'] = lead_time_priority(rows)
+        rows = rows.sort_values(['priority', 'name'], kind='stable')
         
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS products (
-                id SERIAL PRIMARY KEY,
-                manufacturer VARCHAR(255) NOT NULL,
-                article VARCHAR(255) NOT NULL,
-                name TEXT NOT NULL,
-                price_rub INTEGER NOT NULL,
-                lead_time_default VARCHAR(50),
-                astana_qty INTEGER DEFAULT 0,
-                almaty_qty INTEGER DEFAULT 0,
+        # Без времени сборки в товарах: хэш шарда меняется только вместе с данными
+        items = pd.DataFrame({
+            'id': rows['id'],
+            'manufacturer': rows['manufacturer'].astype(object),
+            'article': rows['article'],
+            'name': rows['name'],
+            'priceRub': rows['price_rub'],
+            'leadTimeDefault': rows['lead_time_default'].astype(object),
+            'astanaQty': rows['astana_qty'],
+            'almatyQty': rows['almaty_qty'],
+            'catalogUrl': rows['catalog_url'].astype(object).replace('', None),
+            'imageUrl': rows['image_url'].astype(object).replace('', None)
+        }).to_dict('records')
+        
+        by_manufacturer: Dict[str, List[Dict]] = {}
+        for item in items:
+            by_manufacturer.setdefault(item['manufacturer'], []).append(item)
+        
+        os.makedirs(STATIC_CATALOG_DIR, exist_ok=True)
+        index_path = os.path.join(STATIC_CATALOG_DIR, 'index.json')
+        previous = static_manifest_files(index_path)
+        
+        manifest = {
+            'generatedAt': datetime.now().isoformat(),
+            'total': len(items),
+            'all': {
+                'file': write_static_shard(STATIC_CATALOG_DIR, 'all', {'total': len(items), 'products': items}),
+                'count': len(items)
+            },
+            'manufacturers': []
+        }
+        
+        # Индекс строится по общему списку: номер строки = позиция в all
+        search_index = build_search_index([item['article'] for item in items],
+                                          [item['name'] for item in items])
+        manifest['search'] = {
+            'file': write_static_shard(STATIC_CATALOG_DIR, 'search', search_index),
+            'count': len(search_index['keys'])
+        }
+        
+        for manufacturer in sorted(by_manufacturer.keys()):
+            shard = by_manufacturer[manufacturer]
+            filename = write_static_shard(
+                STATIC_CATALOG_DIR,
+                manufacturer_slug(manufacturer),
+                {'manufacturer': manufacturer, 'total': len(shard), 'products': shard}
+            )
+            manifest['manufacturers'].append({
+                'name': manufacturer,
+                'file': filename,
+                'count': len(shard)
+            })
+        
+        # Манифест пишем последним, чтобы он ссылался только на готовые шарды
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+        
+        # Шарды прошлой сборки живут ещё одно поколение: клиент со старым
+        # index.json догружает вкладки без 404. Более старые удаляем.
+        keep = static_manifest_files(index_path) | previous
+        for existing in os.listdir(STATIC_CATALOG_DIR):
+            base = re.sub(r'\.(gz|br)$', '', existing)
+            if base.endswith('.json') and base != 'index.json' and base not in keep:
+                os.remove(os.path.join(STATIC_CATALOG_DIR, existing))
+        
+        print(f"  ✅ {len(manifest['manufacturers'])} шардов + all ({len(items)} товаров)")
+        return index_path
+        
+    except Exception as e:
+        print(f"  ⚠️ Ошибка генерации снапшотов: {e}")
+        return None
+
+
+# ============================================================================
+# ИСТОРИЯ ЦЕН
+# ============================================================================
+
+HISTORY_COLUMNS = ['article', 'manufacturer', 'dealer_price_kzt', 'price_rub', 'astana_qty', 'almaty_qty']
+
+
+def history_partition(date_str: str) -> str:
+    """Путь к снимку за день: history/date=YYYY-MM-DD/snapshot.parquet"""
+    return os.path.join(HISTORY_DIR, f"date={date_str}", "snapshot.parquet")
+
+
+def list_history_dates() -> List[str]:
+    """Даты сохранённых снимков по возрастанию"""
+    if not os.path.exists(HISTORY_DIR):
+        return []
+    return sorted(
+        name[len('date='):] for name in os.listdir(HISTORY_DIR)
+        if name.startswith('date=') and os.path.exists(history_partition(name[len('date='):]))
+    )
+
+
+def append_price_history(rows: pd.DataFrame, date_str: str) -> str:
+    """Сохраняет снимок цен и остатков за день (повторная сборка перезаписывает день)"""
+    path = history_partition(date_str)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    tmp_path = path + '.tmp'
+    rows[HISTORY_COLUMNS].to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def diff_price_history(previous: pd.DataFrame, current: pd.DataFrame, top_n: int = 5) -> Dict:
+    """Сравнивает два снимка: новые, пропавшие, подорожавшие/подешевевшие артикулы
+    
+    Returns:
+        {'added': int, 'removed': int, 'repriced': int, 'top_moves': DataFrame}
+    """
+    # Ключ товара - пара (производитель, артикул): у разных производителей артикулы совпадают
+    key = ['manufacturer', 'article']
+    merged = previous[key + ['price_rub']].astype({'manufacturer': object}).merge(
+        current[key + ['price_rub']].astype({'manufacturer': object}),
+        on=key, how='outer', suffixes=('_prev', ''), indicator=True
+    )
+    both = merged[merged['_merge'] == 'both']
+    repriced = both[both['price_rub'] != both['price_rub_prev']].copy()
+    
+    # Процент от нулевой цены не считаем - такие товары не попадают в топ
+    priced = repriced[repriced['price_rub_prev'] > 0].copy()
+    priced['change_pct'] = (priced['price_rub'] - priced['price_rub_prev']) / priced['price_rub_prev'] * 100
+    
+    top_moves = priced.loc[priced['change_pct'].abs().nlargest(top_n).index,
+                             ['article', 'manufacturer', 'price_rub_prev', 'price_rub', 'change_pct']]
+    # После outer merge цены стали float из-за NaN у новых/пропавших
+    top_moves = top_moves.astype({'price_rub_prev': 'int64', 'price_rub': 'int64'})
+    
+    return {
+        'added': int((merged['_merge'] == 'right_only').sum()),
+        'removed': int((merged['_merge'] == 'left_only').sum()),
+        'repriced': len(repriced),
+        'top_moves': top_moves.reset_index(drop=True)
+    }
+
+
+def format_history_summary(diff: Dict, previous_date: str) -> str:
+    """Короткая сводка изменений для Telegram (HTML)"""
+    lines = [
+        f"📈 Изменения с {previous_date}: "
+        f"+{diff['added']:,} / −{diff['removed']:,} / ₽ {diff['repriced']:,}"
+    ]
+    for move in diff['top_moves'].itertuples(index=False):
+        lines.append(
+            f"• <code>{html.escape(str(move.article))}</code> {move.price_rub_prev:,} → {move.price_rub:,} ₽ "
+            f"({move.change_pct:+.0f}%)"
+        )
+    return "\n".join(lines)
+
+
+def record_price_history(catalog: pd.DataFrame, settings_dict: Dict,
+                         almaty_stock: Dict, astana_stock: Dict,
+                         margins_dict: Dict) -> str:
+    """Добавляет снимок сборки в историю и сравнивает с предыдущим днём
+    
+    Читаются только два снимка (сегодня и последний до него), поэтому
+    скорость не зависит от глубины истории.
+    
+    Returns:
+        сводка для Telegram или "" если сравнивать не с чем
+    """
+    import pandas as pd
+    
+    print("\n📈 История цен...")
+    
+    try:
+        rows = prepare_catalog_rows(catalog, settings_dict, almaty_stock, astana_stock, margins_dict)
+        today = datetime.now().strftime('%Y-%m-%d')
+        previous_dates = [d for d in list_history_dates() if d < today]
+        
+        append_price_history(rows, today)
+        
+        if not previous_dates:
+            print("  ℹ️ Первый снимок, сравнивать не с чем")
+            return ""
+        
+        previous = pd.read_parquet(history_partition(previous_dates[-1]), columns=['manufacturer', 'article', 'price_rub'])
+        diff = diff_price_history(previous, rows)
+        print(f"  ✅ С {previous_dates[-1]}: новых {diff['added']}, пропало {diff['removed']}, "
+              f"изменили цену {diff['repriced']}")
+        return format_history_summary(diff, previous_dates[-1])
+        
+    except ImportError:
+        print("  ⚠️ Библиотека pyarrow не установлена, история цен не сохраняется")
+        return ""
+    except Exception as e:
+        print(f"  ⚠️ Ошибка истории цен: {e}")
+        return ""
+
+
+# ============================================================================
+# ЗАГРУЗКА В POSTGRESQL
+# ============================================================================
+
+def notify_catalog_updated(cur, version: Optional[str] = None) -> str:
+    """NOTIFY catalog_updated для API-сервера - перезагрузить кэш каталога
+    
+    Вызывается до COMMIT: PostgreSQL доставит уведомление только если
+    транзакция с изменениями закоммичена.
+    """
+    version = version or datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+    cur.execute("SELECT pg_notify(%s, %s)", (CATALOG_NOTIFY_CHANNEL, version))
+    return version
+
+
+def upload_to_postgresql(catalog: pd.DataFrame, settings_dict: Dict, 
+                         almaty_stock: Dict, astana_stock: Dict, 
+                         margins_dict: Dict) -> bool:
+    """Загружает данные в PostgreSQL для веб-приложения"""
+    try:
+        import psycopg2
+        from psycopg2.extras import execute_values
+    except ImportError:
+        print("❌ Библиотека psycopg2 не установлена!")
+        return False
+    
+    database_url = os.environ.get('DATABASE_URL') or settings_dict.get('database_url')
+    
+    if not database_url:
+        print("❌ DATABASE_URL не указан!")
+        return False
+    
+    if PRODUCTS_PARTITIONED:
+        return upload_partitioned(catalog, settings_dict, almaty_stock, astana_stock,
+                                  margins_dict, database_url)
+    
+    print("\n🔄 Загрузка в PostgreSQL...")
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+        
+        # Таблица осталась от режима PRODUCTS_PARTITIONED - возвращаемся к обычной
+        if products_relkind(cur) == 'p':
+            cur.execute("DROP TABLE products")
+            cur.execute("DROP TABLE IF EXISTS products_partitions")
+        
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                id SERIAL PRIMARY KEY,
+                manufacturer VARCHAR(255) NOT NULL,
+                article VARCHAR(255) NOT NULL,
+                name TEXT NOT NULL,
+                price_rub INTEGER NOT NULL,
+                lead_time_default VARCHAR(50),
+                astana_qty INTEGER DEFAULT 0,
+                almaty_qty INTEGER DEFAULT 0,
                 catalog_url TEXT,
                 image_url TEXT,
+                dealer_price_kzt DOUBLE PRECISION,
+                margin_source VARCHAR(20),
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
         
+        # Для --reprice: дилерская цена и источник маржи (таблицы старых версий)
+        cur.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS dealer_price_kzt DOUBLE PRECISION")
+        cur.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS margin_source VARCHAR(20)")
+        
         cur.execute("CREATE INDEX IF NOT EXISTS idx_products_manufacturer ON products(manufacturer)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_products_article ON products(article)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_products_manufacturer_article ON products(manufacturer, article)")
@@ -711,37 +1482,20 @@ def upload_to_postgresql(products: List[Dict], settings_dict: Dict,
         cur.execute("TRUNCATE TABLE products RESTART IDENTITY")
         print("  🗑️ Таблица products очищена")
         
-        insert_data = []
-        for p in products:
-            article = p['article'].lower() if isinstance(p['article'], str) else str(p['article'])
-            
-            margin = get_margin(article, p['manufacturer'], margins_dict)
-            price_rub = round((p['dealer_price_kzt'] * (1 + margin)) / kurs)
-            
-            astana_qty = int(astana_stock.get(article, 0))
-            almaty_qty = int(almaty_stock.get(article, 0))
-            lead_time = p.get('srok') or determine_lead_time(article, almaty_stock, astana_stock)
-            
-            insert_data.append((
-                p['manufacturer'],
-                article,
-                p['name'],
-                price_rub,
-                lead_time,
-                astana_qty,
-                almaty_qty,
-                p.get('catalog_url', ''),
-                p.get('image_url', '')
-            ))
+        rows = prepare_catalog_rows(catalog, settings_dict, almaty_stock, astana_stock, margins_dict)
+        # Кортежи отдаются постранично, без копии всего каталога в список
+        insert_data = rows.itertuples(index=False, name=None)
         
         insert_query = """
             INSERT INTO products 
             (manufacturer, article, name, price_rub, lead_time_default, 
-             astana_qty, almaty_qty, catalog_url, image_url)
+             astana_qty, almaty_qty, catalog_url, image_url,
+             dealer_price_kzt, margin_source)
             VALUES %s
         """
         
         execute_values(cur, insert_query, insert_data, page_size=500)
+        notify_catalog_updated(cur)
         conn.commit()
         
         cur.execute("SELECT COUNT(*) FROM products")
@@ -759,114 +1513,1496 @@ def upload_to_postgresql(products: List[Dict], settings_dict: Dict,
 
 
 # ============================================================================
-# ГЛАВНАЯ ФУНКЦИЯ
+# СЕКЦИОНИРОВАННАЯ ТАБЛИЦА PRODUCTS
 # ============================================================================
 
-def main():
-    """Основная функция"""
-    import time
-    start_time = time.time()
+# Колонки партиций в порядке INSERT (prepare_catalog_rows)
+PARTITION_COLUMNS_SQL = """
+    id INTEGER NOT NULL DEFAULT nextval('products_part_id_seq'),
+    manufacturer VARCHAR(255) NOT NULL,
+    article VARCHAR(255) NOT NULL,
+    name TEXT NOT NULL,
+    price_rub INTEGER NOT NULL,
+    lead_time_default VARCHAR(50),
+    astana_qty INTEGER DEFAULT 0,
+    almaty_qty INTEGER DEFAULT 0,
+    catalog_url TEXT,
+    image_url TEXT,
+    dealer_price_kzt DOUBLE PRECISION,
+    margin_source VARCHAR(20),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+"""
+
+
+def products_relkind(cur) -> Optional[str]:
+    """Тип таблицы products: 'r' - обычная, 'p' - секционированная, None - нет таблицы"""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('products')")
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def partition_name(manufacturer: str) -> str:
+    """Имя партиции: products_p_<slug>_<хэш> (хэш различает 'JUNG' и 'Jung', длина < 63)"""
+    digest = hashlib.md5(manufacturer.encode('utf-8')).hexdigest()[:8]
+    return f"products_p_{manufacturer_slug(manufacturer).replace('-', '_')[:40]}_{digest}"
+
+
+def partition_rows_hash(rows: pd.DataFrame) -> str:
+    """Хэш строк партиции (цены, остатки, сроки) - для пропуска неизменившихся"""
+    import pandas as pd
     
-    print("=" * 70)
-    print("🚀 PRICE SYSTEM v5.0 (Google Drive + Telegram + Name Cache)")
-    print("=" * 70)
+    values = pd.util.hash_pandas_object(rows.astype(object), index=False).to_numpy()
+    return hashlib.md5(values.tobytes()).hexdigest()
+
+
+def plan_partitions(current: Dict[str, Optional[str]], hashes: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """Какие партиции перезалить и какие удалить
     
-    # Определяем режим работы
-    use_google_drive = os.environ.get('USE_GOOGLE_DRIVE', 'true').lower() == 'true'
+    Args:
+        current: {производитель: хэш} партиций в базе
+        hashes: {производитель: хэш} нового каталога
+    
+    Returns:
+        (changed, removed)
+    """
+    changed = [m for m in sorted(hashes) if current.get(m) != hashes[m]]
+    removed = [m for m in sorted(current) if m not in hashes]
+    return changed, removed
+
+
+def load_partition_staging(database_url: str, manufacturer: str, rows: pd.DataFrame) -> str:
+    """Заливает строки производителя в отдельную таблицу <партиция>_new по своему соединению
+    
+    CHECK по manufacturer позволяет ATTACH PARTITION не сканировать таблицу,
+    индексы совпадают с индексами products и подключаются при ATTACH.
+    """
+    import psycopg2
+    from psycopg2 import sql
+    from psycopg2.extras import execute_values
     
+    staging = partition_name(manufacturer) + '_new'
+    conn = psycopg2.connect(database_url)
     try:
-        # Уведомление о старте
-        notify_start()
+        cur = conn.cursor()
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(staging)))
+        cur.execute(sql.SQL("CREATE TABLE {} ({}, CHECK (manufacturer = {}))").format(
+            sql.Identifier(staging), sql.SQL(PARTITION_COLUMNS_SQL), sql.Literal(manufacturer)))
         
-        # 1. Скачивание файлов из Google Drive (если включено)
-        if use_google_drive:
-            if not download_all_files_from_drive():
-                raise Exception("Не удалось скачать файлы из Google Drive")
-        else:
-            print("\n📂 Используем локальные файлы из папки input/")
+        execute_values(cur, sql.SQL("""
+            INSERT INTO {}
+            (manufacturer, article, name, price_rub, lead_time_default,
+             astana_qty, almaty_qty, catalog_url, image_url,
+             dealer_price_kzt, margin_source)
+            VALUES %s
+        """).format(sql.Identifier(staging)).as_string(cur), rows.itertuples(index=False, name=None), page_size=500)
         
-        # 2. Загрузка кэша наименований
-        print("\n📚 Загрузка кэша наименований...")
-        name_cache = load_name_cache()
+        cur.execute(sql.SQL("ALTER TABLE {} ADD PRIMARY KEY (manufacturer, id)").format(sql.Identifier(staging)))
+        cur.execute(sql.SQL("CREATE INDEX ON {} (article)").format(sql.Identifier(staging)))
+        cur.execute(sql.SQL("CREATE INDEX ON {} (manufacturer, article)").format(sql.Identifier(staging)))
+        cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(staging)))
+        conn.commit()
+        return staging
+    finally:
+        conn.close()
+
+
+def swap_partitions(cur, changed: List[str], removed: List[str], existing: set,
+                    hashes: Dict[str, str], counts: Dict[str, int], create_parent: bool):
+    """Подменяет партиции залитыми таблицами (в транзакции вызывающего)
+    
+    create_parent - products ещё не секционирована: обычная таблица удаляется
+    и создаётся секционированная (читатели ждут только эту транзакцию).
+    """
+    from psycopg2 import sql
+    
+    if create_parent:
+        cur.execute("DROP TABLE IF EXISTS products")
+        cur.execute(sql.SQL("CREATE TABLE products ({}, PRIMARY KEY (manufacturer, id)) "
+                            "PARTITION BY LIST (manufacturer)").format(sql.SQL(PARTITION_COLUMNS_SQL)))
+        cur.execute("CREATE INDEX idx_products_article ON products(article)")
+        cur.execute("CREATE INDEX idx_products_manufacturer_article ON products(manufacturer, article)")
+        cur.execute("TRUNCATE TABLE products_partitions")
+    
+    for manufacturer in removed + changed:
+        if manufacturer in existing:
+            part = sql.Identifier(partition_name(manufacturer))
+            cur.execute(sql.SQL("ALTER TABLE products DETACH PARTITION {}").format(part))
+            cur.execute(sql.SQL("DROP TABLE {}").format(part))
+    
+    for manufacturer in removed:
+        cur.execute("DELETE FROM products_partitions WHERE manufacturer = %s", (manufacturer,))
+    
+    for manufacturer in changed:
+        part = partition_name(manufacturer)
+        cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+            sql.Identifier(part + '_new'), sql.Identifier(part)))
+        cur.execute(sql.SQL("ALTER TABLE products ATTACH PARTITION {} FOR VALUES IN ({})").format(
+            sql.Identifier(part), sql.Literal(manufacturer)))
+        cur.execute("""
+            INSERT INTO products_partitions (manufacturer, partition_name, rows_hash, row_count, loaded_at)
+            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (manufacturer) DO UPDATE
+            SET partition_name = EXCLUDED.partition_name, rows_hash = EXCLUDED.rows_hash,
+                row_count = EXCLUDED.row_count, loaded_at = EXCLUDED.loaded_at
+        """, (manufacturer, part, hashes[manufacturer], counts[manufacturer]))
+
+
+def upload_partitioned(catalog: pd.DataFrame, settings_dict: Dict, almaty_stock: Dict,
+                       astana_stock: Dict, margins_dict: Dict, database_url: str) -> bool:
+    """Загрузка в products, секционированную по производителю (PRODUCTS_PARTITIONED)
+    
+    Перезаливаются только производители, у которых изменились строки: каждая
+    партиция грузится в отдельную таблицу по своему соединению (DB_LOAD_WORKERS),
+    затем одна короткая транзакция подменяет партиции и отправляет NOTIFY.
+    Запросы API с WHERE manufacturer = ... читают только свою партицию.
+    """
+    import psycopg2
+    from psycopg2 import sql
+    from concurrent.futures import ThreadPoolExecutor
+    
+    print("\n🔄 Загрузка в PostgreSQL (партиции по производителям)...")
+    
+    staged = []
+    conn = None
+    try:
+        rows = prepare_catalog_rows(catalog, settings_dict, almaty_stock, astana_stock, margins_dict)
+        groups = {str(m): g for m, g in rows.groupby('manufacturer', observed=True, sort=True)}
+        hashes = {m: partition_rows_hash(g) for m, g in groups.items()}
         
-        # 3. Загрузка настроек
-        print("\n📋 Загрузка настроек...")
-        settings_dict, margins_dict = load_settings()
-        validate_settings(settings_dict)
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+        cur.execute("CREATE SEQUENCE IF NOT EXISTS products_part_id_seq")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS products_partitions (
+                manufacturer VARCHAR(255) PRIMARY KEY,
+                partition_name VARCHAR(63) NOT NULL,
+                rows_hash VARCHAR(32),
+                row_count INTEGER NOT NULL,
+                loaded_at TIMESTAMP NOT NULL
+            )
+        """)
+        conn.commit()
         
-        # 4. Загрузка остатков
-        print("\n📦 Загрузка остатков...")
-        almaty_stock, astana_stock = load_stock()
+        create_parent = products_relkind(cur) != 'p'
+        current = {}
+        if not create_parent:
+            cur.execute("SELECT manufacturer, rows_hash FROM products_partitions")
+            current = dict(cur.fetchall())
+        conn.commit()
         
-        # 5. Парсинг EuroElectric
-        print("\n🔍 Парсинг EuroElectric...")
-        euro_products = parse_euroelectric(almaty_stock, astana_stock, name_cache)
+        changed, removed = plan_partitions(current, hashes)
+        if not changed and not removed:
+            print(f"  ⏭ Все {len(groups)} партиций без изменений")
+            return True
         
-        # 6. Парсинг Axima (Wago)
-        print("\n🔍 Парсинг Axima (Wago)...")
-        wago_products = parse_axima()
+        staged = [partition_name(m) + '_new' for m in changed]
+        with ThreadPoolExecutor(max_workers=DB_LOAD_WORKERS) as executor:
+            futures = [executor.submit(load_partition_staging, database_url, m, groups[m]) for m in changed]
+            for future in futures:
+                future.result()
+        print(f"  📥 Залито партиций: {len(changed)} из {len(groups)}"
+              + (f", удаляется: {len(removed)}" if removed else ""))
         
-        # 7. Объединение всех товаров
-        all_products = euro_products + wago_products
-        print(f"\n📊 Всего товаров: {len(all_products)}")
+        swap_partitions(cur, changed, removed, set(current), hashes,
+                        {m: len(groups[m]) for m in changed}, create_parent)
+        notify_catalog_updated(cur)
+        conn.commit()
+        staged = []
         
-        if len(all_products) == 0:
-            raise Exception("Нет товаров для обработки!")
+        cur.execute("SELECT COUNT(*) FROM products")
+        print(f"  ✅ В таблице {cur.fetchone()[0]} товаров")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка PostgreSQL: {e}")
+        return False
+    finally:
+        if conn is not None:
+            conn.rollback()
+            # Неподключённые таблицы загрузки не оставляем
+            for staging in staged:
+                try:
+                    conn.cursor().execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(staging)))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+            conn.close()
+
+
+def forget_partition_hashes(cur):
+    """Точечный UPDATE изменил строки в обход хэшей - следующая загрузка перезальёт все партиции"""
+    cur.execute("SELECT to_regclass('products_partitions')")
+    if cur.fetchone()[0]:
+        cur.execute("UPDATE products_partitions SET rows_hash = NULL")
+
+
+def update_stock_in_postgresql(almaty_stock: Dict, astana_stock: Dict, database_url: str) -> bool:
+    """Обновляет только остатки и сроки в PostgreSQL
+    
+    Остатки заливаются во временную таблицу, затем один UPDATE ... FROM
+    меняет только строки, у которых остатки действительно изменились.
+    Срок пересчитывается для брендов EuroElectric, у Wago он фиксированный.
+    """
+    try:
+        import psycopg2
+        from psycopg2.extras import execute_values
+    except ImportError:
+        print("❌ Библиотека psycopg2 не установлена!")
+        return False
+    
+    print("\n🔄 Обновление остатков в PostgreSQL...")
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
         
-        # 8. Генерация Excel файла (только INTERNAL с датой)
-        print("\n💾 Генерация Excel файла...")
-        internal_path, internal_filename = generate_internal(all_products)
+        cur.execute("""
+            CREATE TEMP TABLE stock_update (
+                article VARCHAR(255) PRIMARY KEY,
+                astana_qty INTEGER NOT NULL,
+                almaty_qty INTEGER NOT NULL
+            ) ON COMMIT DROP
+        """)
         
-        # 9. Загрузка в PostgreSQL
-        print("\n🐘 Загрузка в PostgreSQL...")
-        db_success = upload_to_postgresql(all_products, settings_dict, almaty_stock, astana_stock, margins_dict)
+        # Как и при полной загрузке, сопоставляем только строковые артикулы
+        articles = {a for a in list(almaty_stock) + list(astana_stock) if isinstance(a, str)}
+        stock_data = [
+            (article, int(astana_stock.get(article, 0)), int(almaty_stock.get(article, 0)))
+            for article in articles
+        ]
+        execute_values(cur, "INSERT INTO stock_update (article, astana_qty, almaty_qty) VALUES %s",
+                       stock_data, page_size=1000)
         
-        # 10. Загрузка INTERNAL на Google Drive (без даты, чтобы можно было обновлять)
-        if use_google_drive:
-            upload_file_to_drive(internal_path, "INTERNAL.xlsx")
+        cur.execute("""
+            UPDATE products p
+            SET astana_qty = n.astana_qty,
+                almaty_qty = n.almaty_qty,
+                lead_time_default = n.lead_time_default,
+                updated_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT
+                    pr.id,
+                    COALESCE(s.astana_qty, 0) AS astana_qty,
+                    COALESCE(s.almaty_qty, 0) AS almaty_qty,
+                    CASE
+                        WHEN pr.manufacturer <> ALL(%(brands)s) THEN pr.lead_time_default
+                        WHEN COALESCE(s.astana_qty, 0) > 0 THEN %(astana)s
+                        WHEN COALESCE(s.almaty_qty, 0) > 0 THEN %(almaty)s
+                        ELSE %(on_request)s
+                    END AS lead_time_default
+                FROM products pr
+                LEFT JOIN stock_update s ON s.article = pr.article
+            ) n
+            WHERE p.id = n.id
+              AND (p.astana_qty, p.almaty_qty, p.lead_time_default)
+                  IS DISTINCT FROM (n.astana_qty, n.almaty_qty, n.lead_time_default)
+        """, {
+            'brands': ALLOWED_BRANDS,
+            'astana': LEAD_TIME_ASTANA,
+            'almaty': LEAD_TIME_ALMATY,
+            'on_request': LEAD_TIME_ON_REQUEST
+        })
+        updated = cur.rowcount
+        if updated:
+            forget_partition_hashes(cur)
+            notify_catalog_updated(cur)
+        conn.commit()
         
-        # Подсчет времени
-        duration = time.time() - start_time
+        cur.close()
+        conn.close()
         
-        print("\n" + "=" * 70)
+        print(f"  ✅ Обновлено {updated} товаров")
+        return True
         
-        # 11. Отправка файла и уведомления в Telegram
-        if db_success:
-            print("✅ ВСЕ ГОТОВО!")
-            print(f"⏱ Время выполнения: {duration:.1f} сек")
-            print("=" * 70)
-            
-            caption = f"""✅ <b>Сборка завершена!</b>
+    except Exception as e:
+        print(f"❌ Ошибка PostgreSQL: {e}")
+        return False
 
-📊 Товаров: <b>{len(all_products):,}</b>
-⏱ Время: <b>{duration:.1f} сек</b>
-🕐 {datetime.now().strftime('%d.%m.%Y %H:%M')}"""
-            
-            send_telegram_file(internal_path, caption)
-        else:
-            print("⚠️ СБОРКА ЗАВЕРШЕНА С ОШИБКАМИ!")
-            print(f"⏱ Время выполнения: {duration:.1f} сек")
-            print("=" * 70)
-            
-            # Отправляем уведомление об ошибке PostgreSQL
-            notify_error("Ошибка загрузки в PostgreSQL. Файл создан, но данные на сайт не загружены.")
-            
-            # Всё равно отправляем файл
-            caption = f"""⚠️ <b>Сборка завершена с ошибками!</b>
 
-📊 Товаров: <b>{len(all_products):,}</b>
-❌ PostgreSQL: не загружено
-🕐 {datetime.now().strftime('%d.%m.%Y %H:%M')}"""
-            
-            send_telegram_file(internal_path, caption)
+def reprice_in_postgresql(settings_dict: Dict, margins_dict: Dict, database_url: str) -> bool:
+    """Пересчитывает price_rub в PostgreSQL по новым курсу и марже
+    
+    Таблицы маржи заливаются во временные таблицы, цена считается одним
+    UPDATE в том же порядке операций, что и get_margin/prepare_catalog_rows
+    (double precision, округление как у round() в Python).
+    """
+    try:
+        import psycopg2
+        from psycopg2.extras import execute_values
+    except ImportError:
+        print("❌ Библиотека psycopg2 не установлена!")
+        return False
+    
+    print("\n🔄 Пересчёт цен в PostgreSQL...")
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
         
-    except Exception as e:
-        print(f"\n❌ ОШИБКА: {e}")
-        import traceback
-        traceback.print_exc()
+        cur.execute("""
+            CREATE TEMP TABLE margins_by_article (
+                article VARCHAR(255) PRIMARY KEY,
+                margin DOUBLE PRECISION NOT NULL
+            ) ON COMMIT DROP
+        """)
+        cur.execute("""
+            CREATE TEMP TABLE margins_by_manufacturer (
+                manufacturer VARCHAR(255) PRIMARY KEY,
+                margin DOUBLE PRECISION NOT NULL
+            ) ON COMMIT DROP
+        """)
         
-        # Уведомление об ошибке
-        notify_error(str(e))
+        if margins_dict['by_article']:
+            execute_values(cur, "INSERT INTO margins_by_article (article, margin) VALUES %s",
+                           list(margins_dict['by_article'].items()), page_size=1000)
+        if margins_dict['by_manufacturer']:
+            execute_values(cur, "INSERT INTO margins_by_manufacturer (manufacturer, margin) VALUES %s",
+                           list(margins_dict['by_manufacturer'].items()), page_size=1000)
+        
+        cur.execute("""
+            UPDATE products p
+            SET price_rub = n.price_rub,
+                margin_source = n.margin_source,
+                updated_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT
+                    pr.id,
+                    ROUND(pr.dealer_price_kzt
+                          * (1 + COALESCE(a.margin, m.margin, %(global_margin)s::DOUBLE PRECISION))
+                          / %(kurs)s::DOUBLE PRECISION)::INTEGER AS price_rub,
+                    CASE
+                        WHEN a.margin IS NOT NULL THEN 'article'
+                        WHEN m.margin IS NOT NULL THEN 'manufacturer'
+                        ELSE 'global'
+                    END AS margin_source
+                FROM products pr
+                LEFT JOIN margins_by_article a ON a.article = pr.article
+                LEFT JOIN margins_by_manufacturer m ON m.manufacturer = pr.manufacturer
+                WHERE pr.dealer_price_kzt IS NOT NULL
+            ) n
+            WHERE p.id = n.id
+              AND (p.price_rub, p.margin_source) IS DISTINCT FROM (n.price_rub, n.margin_source)
+        """, {
+            'global_margin': float(margins_dict['global_margin']),
+            'kurs': float(settings_dict['kurs'])
+        })
+        updated = cur.rowcount
+        
+        cur.execute("SELECT COUNT(*) FROM products WHERE dealer_price_kzt IS NULL")
+        missing = cur.fetchone()[0]
+        
+        if updated:
+            forget_partition_hashes(cur)
+            notify_catalog_updated(cur)
+        conn.commit()
+        cur.close()
+        conn.close()
+        
+        print(f"  ✅ Обновлены цены у {updated} товаров")
+        if missing:
+            print(f"  ⚠️ {missing} товаров без дилерской цены - нужна полная сборка")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка PostgreSQL: {e}")
+        return False
+
+
+def load_cached_catalog() -> Optional[pd.DataFrame]:
+    """Каталог последней полной сборки из кэша стадии dedupe (PIPELINE_STATE_DIR)"""
+    import pickle
+    
+    path = _stage_cache_path('dedupe')
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)[0]
+    except Exception as e:
+        print(f"  ⚠️ Ошибка чтения кэша каталога: {e}")
+        return None
+
+
+def invalidate_static_catalog():
+    """Удаляет index.json: клиент без манифеста читает каталог из API"""
+    index_path = os.path.join(STATIC_CATALOG_DIR, 'index.json')
+    if os.path.exists(index_path):
+        os.remove(index_path)
+        print(f"  ⚠️ {index_path} удалён - сайт читает каталог из API до полной сборки")
+
+
+def refresh_static_snapshots(settings_dict: Dict, almaty_stock: Dict, astana_stock: Dict,
+                             margins_dict: Dict) -> Optional[pd.DataFrame]:
+    """Пересобирает статические снапшоты после --stock-only/--reprice
+    
+    Каталог берётся из кэша последней полной сборки. Если его нет,
+    index.json удаляется, чтобы клиент не показывал старые цены и остатки.
+    
+    Returns:
+        каталог или None, если снапшоты не обновлены
+    """
+    catalog = load_cached_catalog()
+    if catalog is not None:
+        # Срок у брендов EuroElectric считался по остаткам полной сборки - пересчитываем
+        # по новым (как UPDATE в update_stock_in_postgresql), у остальных он фиксированный
+        srok = catalog['srok'].astype(object).where(~catalog['manufacturer'].isin(ALLOWED_BRANDS))
+        catalog = catalog.assign(srok=srok.astype(CATALOG_DTYPES['srok']))
+    if catalog is not None and generate_static_snapshots(catalog, settings_dict, almaty_stock,
+                                                         astana_stock, margins_dict):
+        return catalog
+    invalidate_static_catalog()
+    return None
+
+
+def run_reprice(use_google_drive: bool) -> bool:
+    """Быстрый пересчёт цен после изменения settings.xlsx"""
+    import time
+    start_time = time.time()
+    
+    print("=" * 70)
+    print("💱 PRICE SYSTEM: пересчёт цен")
+    print("=" * 70)
+    
+    try:
+        if use_google_drive:
+            if not download_all_files_from_drive(['settings.xlsx']):
+                raise Exception("Не удалось скачать settings.xlsx из Google Drive")
+        
+        print("\n📋 Загрузка настроек...")
+        settings_dict, margins_dict = load_settings()
+        validate_settings(settings_dict)
+        
+        database_url = os.environ.get('DATABASE_URL') or settings_dict.get('database_url')
+        if not database_url:
+            raise Exception("DATABASE_URL не указан!")
+        
+        if not reprice_in_postgresql(settings_dict, margins_dict, database_url):
+            raise Exception("Ошибка пересчёта цен в PostgreSQL")
+        
+        # Статические шарды и история цен - с новыми ценами
+        almaty_stock, astana_stock = load_stock()
+        catalog = refresh_static_snapshots(settings_dict, almaty_stock, astana_stock, margins_dict)
+        if catalog is not None:
+            record_price_history(catalog, settings_dict, almaty_stock, astana_stock, margins_dict)
+        
+        print(f"⏱ Время выполнения: {time.time() - start_time:.1f} сек")
+        
+    except Exception as e:
+        print(f"\n❌ ОШИБКА: {e}")
+        notify_error(f"Пересчёт цен: {e}")
+        return False
+    
+    return True
+
+
+def run_stock_refresh(use_google_drive: bool) -> bool:
+    """Быстрое обновление: только остатки Алматы/Астаны → PostgreSQL"""
+    import time
+    start_time = time.time()
+    
+    print("=" * 70)
+    print("📦 PRICE SYSTEM: обновление остатков")
+    print("=" * 70)
+    
+    try:
+        if use_google_drive:
+            if not download_all_files_from_drive(STOCK_FILES):
+                raise Exception("Не удалось скачать файлы остатков из Google Drive")
+        
+        # Настройки нужны и для статических снапшотов (цены в шардах)
+        settings = None
+        try:
+            settings = load_settings()
+        except FileNotFoundError as e:
+            if not os.environ.get('DATABASE_URL'):
+                raise
+            print(f"  ⚠️ {e}")
+        database_url = os.environ.get('DATABASE_URL') or settings[0].get('database_url')
+        if not database_url:
+            raise Exception("DATABASE_URL не указан!")
+        
+        print("\n📦 Загрузка остатков...")
+        almaty_stock, astana_stock = load_stock()
+        
+        if not update_stock_in_postgresql(almaty_stock, astana_stock, database_url):
+            raise Exception("Ошибка обновления остатков в PostgreSQL")
+        
+        # Остатки и сроки в статических шардах
+        if settings:
+            refresh_static_snapshots(settings[0], almaty_stock, astana_stock, settings[1])
+        else:
+            invalidate_static_catalog()
+        
+        print(f"⏱ Время выполнения: {time.time() - start_time:.1f} сек")
+        
+    except Exception as e:
+        print(f"\n❌ ОШИБКА: {e}")
+        notify_error(f"Обновление остатков: {e}")
+        return False
+    
+    return True
+
+
+# ============================================================================
+# ПУБЛИКАЦИЯ
+# ============================================================================
+
+def _timed(func, *args):
+    """Вызывает func(*args) и возвращает (результат, секунды)"""
+    import time
+    started = time.time()
+    result = func(*args)
+    return result, time.time() - started
+
+
+def publish_telegram(internal_path: str) -> Dict[str, int]:
+    """Отправляет INTERNAL в Telegram сразу, с временной подписью
+    
+    Итоговую подпись ставит publish_caption, когда известен результат PostgreSQL.
+    
+    Returns:
+        {chat_id: message_id}
+    """
+    sent = send_telegram_file(internal_path, "⏳ <b>Загрузка на сайт...</b>")
+    if TELEGRAM_BOT_TOKEN and not sent:
+        raise Exception("Файл не отправлен в Telegram")
+    return sent
+
+
+def publish_caption(messages: Dict[str, int], db_success: bool, all_products: pd.DataFrame,
+                    start_time: float, history_summary: str = ""):
+    """Итоговая подпись к файлу в Telegram: успех или ошибка загрузки в PostgreSQL
+    
+    history_summary (изменения цен с прошлой сборки) добавляется в подпись.
+    """
+    import time
+    
+    duration = time.time() - start_time
+    
+    print("\n" + "=" * 70)
+    
+    if db_success:
+        print("✅ ВСЕ ГОТОВО!")
+        print(f"⏱ Время выполнения: {duration:.1f} сек")
+        print("=" * 70)
+        
+        caption = f"""✅ <b>Сборка завершена!</b>
+
+📊 Товаров: <b>{len(all_products):,}</b>
+⏱ Время: <b>{duration:.1f} сек</b>
+🕐 {datetime.now().strftime('%d.%m.%Y %H:%M')}"""
+    else:
+        print("⚠️ СБОРКА ЗАВЕРШЕНА С ОШИБКАМИ!")
+        print(f"⏱ Время выполнения: {duration:.1f} сек")
+        print("=" * 70)
+        
+        # Файл всё равно отправлен, меняем только подпись
+        caption = f"""⚠️ <b>Сборка завершена с ошибками!</b>
+
+📊 Товаров: <b>{len(all_products):,}</b>
+❌ PostgreSQL: не загружено
+🕐 {datetime.now().strftime('%d.%m.%Y %H:%M')}"""
+    
+    if history_summary:
+        caption += "\n\n" + history_summary
+    if BUILD_PROFILE:
+        caption = f"🏷 <b>{BUILD_PROFILE}</b>\n" + caption
+    
+    edit_telegram_caption(messages, caption)
+
+
+# ============================================================================
+# РЕЖИМ НАБЛЮДЕНИЯ (DAEMON)
+# ============================================================================
+
+@contextmanager
+def build_lock():
+    """Не даёт запустить две сборки одновременно (демон + ручной запуск)"""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    lock_file = open(os.path.join(OUTPUT_DIR, ".build.lock"), 'w')
+    
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None  # Windows - блокировки между процессами нет
+    
+    try:
+        if fcntl:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print("⏳ Идёт другая сборка, ждём её завершения...")
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+    finally:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def load_page_token() -> Optional[str]:
+    """Читает сохранённый pageToken Drive changes feed"""
+    if not os.path.exists(WATCH_STATE_FILE):
+        return None
+    try:
+        with open(WATCH_STATE_FILE, encoding='utf-8') as f:
+            return json.load(f).get('page_token')
+    except Exception as e:
+        print(f"  ⚠️ Ошибка чтения {WATCH_STATE_FILE}: {e}")
+        return None
+
+
+def save_page_token(page_token: str):
+    """Сохраняет pageToken, чтобы после перезапуска не пропустить изменения"""
+    os.makedirs(os.path.dirname(WATCH_STATE_FILE) or '.', exist_ok=True)
+    with open(WATCH_STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'page_token': page_token}, f)
+
+
+def poll_drive_changes(service, page_token: str) -> Tuple[List[str], str]:
+    """Читает Drive changes.list начиная с page_token
+    
+    Returns:
+        (имена изменённых файлов из DRIVE_FILES, новый page_token)
+    """
+    changed = []
+    
+    while True:
+        response = service.changes().list(
+            pageToken=page_token,
+            spaces='drive',
+            fields="nextPageToken, newStartPageToken, changes(fileId, removed, file(name, parents, trashed))"
+        ).execute()
+        
+        for change in response.get('changes', []):
+            f = change.get('file') or {}
+            if f.get('name') in DRIVE_FILES and GOOGLE_DRIVE_FOLDER_ID in f.get('parents', []):
+                changed.append(f['name'])
+        
+        if 'newStartPageToken' in response:
+            return changed, response['newStartPageToken']
+        page_token = response['nextPageToken']
+
+
+def snapshot_input_files() -> Dict[str, Tuple[float, int]]:
+    """Снимок (mtime, размер) входных файлов в INPUT_DIR"""
+    snapshot = {}
+    for file_name in DRIVE_FILES.keys():
+        path = os.path.join(INPUT_DIR, file_name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            snapshot[file_name] = (stat.st_mtime, stat.st_size)
+    return snapshot
+
+
+def detect_input_changes(before: Dict, after: Dict) -> List[str]:
+    """Список файлов, которые появились, изменились или исчезли"""
+    return sorted(name for name in set(before) | set(after) if before.get(name) != after.get(name))
+
+
+def watch(use_google_drive: bool):
+    """Демон: ждёт изменений входных файлов и пересобирает прайс
+    
+    Изменения копятся, пока поставщик не закончит загрузку
+    (WATCH_DEBOUNCE секунд тишины), затем запускается одна сборка.
+    """
+    import time
+    
+    print("=" * 70)
+    print(f"👀 Режим наблюдения: {'Google Drive changes' if use_google_drive else INPUT_DIR + '/'}")
+    print(f"   Опрос каждые {WATCH_POLL_INTERVAL:.0f} сек, пауза перед сборкой {WATCH_DEBOUNCE:.0f} сек")
+    print("=" * 70)
+    
+    if use_google_drive:
+        service = get_drive_service()
+        page_token = load_page_token()
+        if not page_token:
+            page_token = service.changes().getStartPageToken().execute()['startPageToken']
+            save_page_token(page_token)
+    else:
+        snapshot = snapshot_input_files()
+    
+    pending = set()
+    last_change_at = 0.0
+    
+    try:
+        while True:
+            try:
+                if use_google_drive:
+                    changed, page_token = poll_drive_changes(service, page_token)
+                    save_page_token(page_token)
+                else:
+                    current = snapshot_input_files()
+                    changed = detect_input_changes(snapshot, current)
+                    snapshot = current
+            except Exception as e:
+                print(f"  ⚠️ Ошибка опроса изменений: {e}")
+                changed = []
+            
+            if changed:
+                pending.update(changed)
+                last_change_at = time.time()
+                print(f"  📝 Изменены: {', '.join(sorted(set(changed)))}")
+            
+            if pending and time.time() - last_change_at >= WATCH_DEBOUNCE:
+                print(f"\n🔁 Пересборка после изменений: {', '.join(sorted(pending))}")
+                stock_only = pending <= set(STOCK_FILES)
+                settings_only = pending == {'settings.xlsx'}
+                pending.clear()
+                with build_lock():
+                    if stock_only:
+                        run_stock_refresh(use_google_drive)
+                    elif settings_only:
+                        run_reprice(use_google_drive)
+                    else:
+                        run_build(use_google_drive)
+                # Снимок не обновляем: файл, сохранённый во время сборки,
+                # найдётся при следующем опросе и запустит новую сборку
+            
+            time.sleep(WATCH_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        print("\n👋 Режим наблюдения остановлен")
+
+
+# ============================================================================
+# ПАЙПЛАЙН (DAG СТАДИЙ)
+# ============================================================================
+
+class Stage:
+    """Стадия пайплайна
+    
+    func получает словарь {имя зависимости: результат}. Кэшируемая стадия
+    пропускается, если отпечаток её входных файлов и зависимостей совпал
+    с прошлым запуском - тогда результат берётся из PIPELINE_STATE_DIR.
+    
+    files(результат) - пути созданных стадией файлов: они сохраняются
+    в чекпойнт прогона вместе с результатом.
+    
+    run_on_failure - стадия запускается и после сбоя зависимости: вместо
+    результата упавшей зависимости она получает её исключение.
+    """
+    
+    def __init__(self, name: str, func, deps: Tuple[str, ...] = (),
+                 inputs: Tuple[str, ...] = (), cacheable: bool = False,
+                 files=None, checkpoint: bool = True, run_on_failure: bool = False):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.inputs = tuple(inputs)
+        self.cacheable = cacheable
+        self.files = files
+        self.checkpoint = checkpoint
+        self.run_on_failure = run_on_failure
+
+
+def _code_version() -> str:
+    """Хэш build.py и pricing.py - при изменении кода кэш стадий становится недействительным"""
+    import pricing
+    return file_md5(os.path.abspath(__file__)) + file_md5(os.path.abspath(pricing.__file__))
+
+
+def stage_fingerprint(stage: Stage, dep_fingerprints: Dict[str, str]) -> str:
+    """Отпечаток стадии: код, содержимое входных файлов и отпечатки зависимостей"""
+    digest = hashlib.sha256()
+    digest.update(stage.name.encode('utf-8'))
+    digest.update(_code_version().encode('utf-8'))
+    for path in stage.inputs:
+        digest.update(path.encode('utf-8'))
+        digest.update(file_md5(path).encode('utf-8') if os.path.exists(path) else b'missing')
+    for dep in stage.deps:
+        digest.update(dep_fingerprints[dep].encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _stage_file_name(name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+def _stage_cache_path(name: str) -> str:
+    return os.path.join(PIPELINE_STATE_DIR, _stage_file_name(name) + '.pkl')
+
+
+def load_pipeline_state() -> Dict[str, str]:
+    """Отпечатки стадий прошлого запуска"""
+    path = os.path.join(PIPELINE_STATE_DIR, 'state.json')
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"  ⚠️ Ошибка чтения состояния пайплайна: {e}")
+        return {}
+
+
+def save_pipeline_state(state: Dict[str, str]):
+    os.makedirs(PIPELINE_STATE_DIR, exist_ok=True)
+    with open(os.path.join(PIPELINE_STATE_DIR, 'state.json'), 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+
+
+def _can_skip(stage: Stage, fingerprint: str, state: Dict[str, str]) -> bool:
+    return (stage.cacheable and state.get(stage.name) == fingerprint
+            and os.path.exists(_stage_cache_path(stage.name)))
+
+
+def new_run_dir() -> str:
+    """Папка нового прогона RUNS_DIR/<run id>, старые прогоны сверх RUNS_KEEP удаляются"""
+    import shutil
+    
+    os.makedirs(RUNS_DIR, exist_ok=True)
+    old_runs = sorted(os.listdir(RUNS_DIR))
+    for old_run in old_runs[:max(len(old_runs) - RUNS_KEEP + 1, 0)]:
+        shutil.rmtree(os.path.join(RUNS_DIR, old_run), ignore_errors=True)
+    
+    run_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+    run_dir = os.path.join(RUNS_DIR, run_id)
+    suffix = 1
+    while os.path.exists(run_dir):
+        suffix += 1
+        run_dir = os.path.join(RUNS_DIR, f"{run_id}-{suffix}")
+    os.makedirs(run_dir)
+    return run_dir
+
+
+def find_run_dir(run_id: Optional[str] = None) -> str:
+    """Папка прогона по run id (по умолчанию - последний прогон)"""
+    runs = sorted(os.listdir(RUNS_DIR)) if os.path.isdir(RUNS_DIR) else []
+    if run_id is None:
+        if not runs:
+            raise ValueError(f"❌ В {RUNS_DIR} нет прогонов для возобновления")
+        run_id = runs[-1]
+    elif run_id not in runs:
+        raise ValueError(f"❌ Прогон {run_id} не найден в {RUNS_DIR}")
+    return os.path.join(RUNS_DIR, run_id)
+
+
+def load_run_manifest(run_dir: str) -> Dict:
+    """run.json прогона: {'stages': {стадия: чекпойнт}, 'failed': стадия с ошибкой}"""
+    path = os.path.join(run_dir, 'run.json')
+    if not os.path.exists(path):
+        return {'stages': {}, 'failed': None}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_run_manifest(run_dir: str, manifest: Dict):
+    path = os.path.join(run_dir, 'run.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def save_checkpoint(run_dir: str, stage: Stage, result) -> Dict:
+    """Сохраняет результат стадии: DataFrame - в parquet, остальное - pickle
+    
+    Returns:
+        запись для run.json
+    """
+    import pickle
+    import shutil
+    import pandas as pd
+    
+    name = _stage_file_name(stage.name)
+    if isinstance(result, pd.DataFrame):
+        data = name + '.parquet'
+        result.to_parquet(os.path.join(run_dir, data))
+    else:
+        data = name + '.pkl'
+        with open(os.path.join(run_dir, data), 'wb') as f:
+            pickle.dump(result, f)
+    
+    files = {}
+    for path in (stage.files(result) if stage.files else []):
+        copy = os.path.join('files', name, os.path.basename(path))
+        os.makedirs(os.path.join(run_dir, 'files', name), exist_ok=True)
+        shutil.copy2(path, os.path.join(run_dir, copy))
+        files[path] = copy
+    
+    return {'data': data, 'files': files}
+
+
+def load_checkpoint(run_dir: str, entry: Dict):
+    """Результат стадии из чекпойнта; её файлы возвращаются на свои места"""
+    import pickle
+    import shutil
+    
+    for path, copy in entry['files'].items():
+        copy = os.path.join(run_dir, copy)
+        if not os.path.exists(path) or file_md5(path) != file_md5(copy):
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            shutil.copy2(copy, path)
+    
+    data = os.path.join(run_dir, entry['data'])
+    if data.endswith('.parquet'):
+        import pandas as pd
+        return pd.read_parquet(data)
+    with open(data, 'rb') as f:
+        return pickle.load(f)
+
+
+def resume_stages(stages: List[Stage], resume_from: str, run_dir: str) -> List[Stage]:
+    """Хвост пайплайна с resume_from: остальное берётся из чекпойнтов прогона
+    
+    Перезапускаются resume_from (одна стадия или несколько через запятую) и все
+    зависящие от них стадии, их зависимости загружаются из run_dir. Стадии вне
+    этого хвоста не запускаются.
+    """
+    names = [s.name for s in stages]
+    tail = set(resume_from.split(','))
+    for name in sorted(tail):
+        if name not in names:
+            raise ValueError(f"❌ Неизвестная стадия '{name}'. Стадии: {', '.join(names)}")
+    
+    for stage in order_stages(stages):
+        if any(dep in tail for dep in stage.deps):
+            tail.add(stage.name)
+    
+    checkpoints = load_run_manifest(run_dir)['stages']
+    restored = []
+    for name in sorted(stage_closure(stages, tail) - tail):
+        if name not in checkpoints:
+            raise ValueError(f"❌ В прогоне {os.path.basename(run_dir)} нет результата стадии '{name}': "
+                             f"возобновите с неё или с более ранней стадии")
+        restored.append(Stage(name, lambda _, entry=checkpoints[name]: load_checkpoint(run_dir, entry),
+                              checkpoint=False))
+    
+    return restored + [s for s in stages if s.name in tail]
+
+
+def order_stages(stages: List[Stage]) -> List[Stage]:
+    """Топологический порядок стадий (для плана и проверки циклов)"""
+    by_name = {s.name: s for s in stages}
+    ordered, seen = [], set()
+    
+    def visit(stage: Stage, path: Tuple[str, ...]):
+        if stage.name in seen:
+            return
+        if stage.name in path:
+            raise ValueError(f"Цикл в пайплайне: {' → '.join(path + (stage.name,))}")
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Стадия {stage.name} зависит от неизвестной {dep}")
+            visit(by_name[dep], path + (stage.name,))
+        seen.add(stage.name)
+        ordered.append(stage)
+    
+    for stage in stages:
+        visit(stage, ())
+    return ordered
+
+
+def stage_closure(stages: List[Stage], targets) -> set:
+    """Имена стадий targets и всех их зависимостей"""
+    by_name = {s.name: s for s in stages}
+    needed = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending.extend(by_name[name].deps)
+    return needed
+
+
+def plan_pipeline(stages: List[Stage], force: bool = False):
+    """Печатает план (--dry-run): порядок стадий и что будет пропущено"""
+    state = load_pipeline_state()
+    fingerprints = {}
+    
+    print("\n🗺 План сборки:")
+    for stage in order_stages(stages):
+        fingerprints[stage.name] = stage_fingerprint(stage, fingerprints)
+        if not force and _can_skip(stage, fingerprints[stage.name], state):
+            action = "⏭ пропуск (входы не изменились)"
+        else:
+            action = "▶ запуск"
+        deps = f" ← {', '.join(stage.deps)}" if stage.deps else ""
+        print(f"  {action:<34} {stage.name}{deps}")
+    print("\nℹ️ Файлы с Google Drive ещё не скачаны: план учитывает текущие файлы в input/")
+
+
+def run_pipeline(stages: List[Stage], force: bool = False,
+                 run_dir: Optional[str] = None) -> Dict[str, object]:
+    """Выполняет стадии параллельно, как только готовы их зависимости
+    
+    run_dir - папка прогона: результат каждой стадии сохраняется туда как
+    чекпойнт, а упавшие стадии записываются в run.json ('failed', через запятую).
+    После сбоя стадии ветки, не зависящие от неё, выполняются до конца.
+    
+    Returns:
+        {имя стадии: результат}
+    """
+    import pickle
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    
+    order_stages(stages)  # проверка циклов и неизвестных зависимостей
+    
+    state = load_pipeline_state()
+    pending = {s.name: s for s in stages}
+    results: Dict[str, object] = {}
+    fingerprints: Dict[str, str] = {}
+    running = {}
+    failed: Dict[str, Exception] = {}
+    
+    def is_ready(stage: Stage) -> bool:
+        return all(d in results or (stage.run_on_failure and d in failed) for d in stage.deps)
+    manifest = load_run_manifest(run_dir) if run_dir else None
+    
+    def finish(stage: Stage, result):
+        results[stage.name] = result
+        if run_dir and stage.checkpoint:
+            manifest['stages'][stage.name] = save_checkpoint(run_dir, stage, result)
+            save_run_manifest(run_dir, manifest)
+    
+    os.makedirs(PIPELINE_STATE_DIR, exist_ok=True)
+    if run_dir:
+        manifest['failed'] = None
+        save_run_manifest(run_dir, manifest)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=PIPELINE_WORKERS) as executor:
+            while pending or running:
+                ready = [s for s in pending.values() if is_ready(s)]
+                
+                for stage in ready:
+                    del pending[stage.name]
+                    fingerprints[stage.name] = stage_fingerprint(stage, fingerprints)
+                    
+                    if not force and _can_skip(stage, fingerprints[stage.name], state):
+                        with open(_stage_cache_path(stage.name), 'rb') as f:
+                            finish(stage, pickle.load(f))
+                        print(f"  ⏭ {stage.name}: входы не изменились")
+                        continue
+                    
+                    deps = {d: results[d] if d in results else failed[d] for d in stage.deps}
+                    print(f"  ▶ {stage.name}")
+                    running[executor.submit(_timed, stage.func, deps)] = stage
+                
+                # Пропущенные стадии могли открыть следующие - проверяем сразу
+                if any(is_ready(s) for s in pending.values()):
+                    continue
+                
+                if not running:
+                    break
+                
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        result, seconds = future.result()
+                    except Exception as e:
+                        # Зависящие стадии не запустятся (кроме run_on_failure), независимые
+                        # доделываем и сохраняем, чтобы --resume-from повторил только упавшие
+                        print(f"  ✖ {stage.name}: {e}")
+                        failed[stage.name] = e
+                        continue
+                    finish(stage, result)
+                    print(f"  ✔ {stage.name}: {seconds:.1f} сек")
+                    
+                    if stage.cacheable:
+                        with open(_stage_cache_path(stage.name), 'wb') as f:
+                            pickle.dump(result, f)
+                        state[stage.name] = fingerprints[stage.name]
+        
+        if failed:
+            if run_dir:
+                manifest['failed'] = ','.join(failed)
+                save_run_manifest(run_dir, manifest)
+            if len(failed) == 1:
+                raise next(iter(failed.values()))
+            raise Exception("; ".join(f"{name}: {e}" for name, e in failed.items()))
+    finally:
+        save_pipeline_state(state)
+    
+    return results
+
+
+def build_stages(use_google_drive: bool, start_time: float) -> List[Stage]:
+    """Стадии полной сборки: скачивание → парсинг → объединение → выходы"""
+    def input_path(file_name: str) -> str:
+        return os.path.join(INPUT_DIR, file_name)
+    
+    def downloads(*file_names: str) -> Tuple[str, ...]:
+        return tuple(f"download:{name}" for name in file_names) if use_google_drive else ()
+    
+    def load_and_validate_settings(_):
+        settings_dict, margins_dict = load_settings()
+        validate_settings(settings_dict)
+        return settings_dict, margins_dict
+    
+    def join_catalog(r):
+        settings_dict = r['settings'][0]
+        # Пустая ячейка в settings.xlsx читается как NaN
+        policy = settings_dict.get('dedup_policy')
+        priority = settings_dict.get('supplier_priority')
+        all_products, conflicts = dedupe_catalog(
+            {'Euroelectric': r['euroelectric'], 'Axima': r['axima']},
+            policy=policy.strip() if isinstance(policy, str) else 'cheapest',
+            supplier_priority=[p.strip() for p in priority.split(',')] if isinstance(priority, str) else None
+        )
+        print(f"\n📊 Всего товаров: {len(all_products)}")
+        if len(all_products) == 0:
+            raise Exception("Нет товаров для обработки!")
+        return all_products, conflicts
+    
+    # Каждая цель публикации - своя стадия: при сбое --resume-from повторяет только её
+    def publish_postgresql(r):
+        if not upload_to_postgresql(r['catalog'], r['settings'][0], *r['stock'], r['settings'][1]):
+            raise Exception("Ошибка загрузки в PostgreSQL. Файл создан, но данные на сайт не загружены.")
+        return True
+    
+    def publish_drive(r):
+        # INTERNAL на Google Drive (без даты, чтобы можно было обновлять)
+        file_id = upload_file_to_drive(r['internal'][0], "INTERNAL.xlsx")
+        if not file_id:
+            raise Exception("Ошибка загрузки INTERNAL.xlsx на Google Drive")
+        return file_id
+    
+    def caption(r):
+        # Стадия run_on_failure: упавшая зависимость приходит исключением
+        if isinstance(r['publish:telegram'], Exception):
+            return None
+        db_success = not isinstance(r['publish:postgresql'], Exception)
+        publish_caption(r['publish:telegram'], db_success, r['catalog'], start_time, r['history'])
+    
+    stages = []
+    
+    if use_google_drive:
+        stages.append(Stage('drive:list', lambda _: list_drive_file_meta(get_drive_service())))
+        for file_name in DRIVE_FILES.keys():
+            stages.append(Stage(
+                f"download:{file_name}",
+                lambda r, name=file_name: download_drive_file(name, r['drive:list']),
+                deps=('drive:list',),
+                files=lambda path: [path] if path else []
+            ))
+    
+    stages += [
+        Stage('name_cache', lambda _: load_name_cache(),
+              deps=downloads('name_cache.xlsx'),
+              inputs=(input_path('name_cache.xlsx'),), cacheable=True),
+        Stage('settings', load_and_validate_settings,
+              deps=downloads('settings.xlsx'),
+              inputs=(input_path('settings.xlsx'),), cacheable=True),
+        Stage('stock', lambda _: load_stock(),
+              deps=downloads(*STOCK_FILES),
+              inputs=tuple(input_path(name) for name in STOCK_FILES), cacheable=True),
+        Stage('euroelectric', lambda r: parse_euroelectric(*r['stock'], r['name_cache']),
+              deps=('stock', 'name_cache') + downloads('Euroelectric.xlsx'),
+              inputs=(input_path('Euroelectric.xlsx'),), cacheable=True),
+        Stage('axima', lambda _: parse_axima(),
+              deps=downloads('Axima_price.xlsx'),
+              inputs=(input_path('Axima_price.xlsx'),), cacheable=True),
+        # Отчёт о дублях кэшируется вместе с каталогом и пишется в каждом запуске
+        Stage('dedupe', join_catalog, deps=('euroelectric', 'axima', 'settings'), cacheable=True,
+              checkpoint=False),
+        Stage('catalog', lambda r: r['dedupe'][0], deps=('dedupe',)),
+        Stage('conflicts', lambda r: write_conflict_report(r['dedupe'][1]), deps=('dedupe',)),
+        Stage('internal', lambda r: generate_internal(r['catalog']), deps=('catalog',),
+              files=lambda internal: [internal[0]]),
+        Stage('snapshots',
+              lambda r: generate_static_snapshots(r['catalog'], r['settings'][0], *r['stock'], r['settings'][1]),
+              deps=('catalog', 'settings', 'stock')),
+        Stage('history',
+              lambda r: record_price_history(r['catalog'], r['settings'][0], *r['stock'], r['settings'][1]),
+              deps=('catalog', 'settings', 'stock')),
+        Stage('publish:postgresql', publish_postgresql, deps=('catalog', 'settings', 'stock')),
+        # Файл уходит в Telegram параллельно с загрузкой в БД, подпись ставится по её результату
+        Stage('publish:telegram', lambda r: publish_telegram(r['internal'][0]), deps=('internal',)),
+        Stage('publish:caption', caption,
+              deps=('catalog', 'history', 'publish:telegram', 'publish:postgresql'), run_on_failure=True),
+    ]
+    
+    if use_google_drive:
+        stages.append(Stage('publish:drive', publish_drive, deps=('internal',)))
+    
+    return stages
+
+
+# ============================================================================
+# ПРОФИЛИ СБОРКИ
+# ============================================================================
+
+# Стадии, общие для всех профилей: файлы поставщиков и остатки
+SHARED_STAGES = ('name_cache', 'stock', 'euroelectric', 'axima')
+SHARED_FILES = [name for name in DRIVE_FILES if name != 'settings.xlsx']
+
+
+def load_build_profiles(path: str, use_google_drive: bool) -> List[Dict]:
+    """Читает профили из JSON
+    
+    [{"name": "astana", "drive_folder_id": "...", "database_url": "...",
+      "telegram_chat_ids": ["..."], "input_dir": "..."}, ...]
+    
+    drive_folder_id - папка с settings.xlsx профиля (туда же грузится INTERNAL.xlsx),
+    файлы поставщиков берутся из общей папки GOOGLE_DRIVE_FOLDER_ID.
+    """
+    with open(path, encoding='utf-8') as f:
+        profiles = json.load(f)
+    
+    if not isinstance(profiles, list) or not profiles:
+        raise ValueError(f"❌ {path}: нужен непустой список профилей")
+    
+    names = set()
+    for profile in profiles:
+        name = profile.get('name', '')
+        if not re.fullmatch(r'[A-Za-z0-9_-]+', name):
+            raise ValueError(f"❌ Недопустимое имя профиля: '{name}' (латиница, цифры, - и _)")
+        if name in names:
+            raise ValueError(f"❌ Профиль '{name}' указан дважды")
+        if use_google_drive and not profile.get('drive_folder_id'):
+            raise ValueError(f"❌ У профиля '{name}' не указан drive_folder_id")
+        names.add(name)
+    
+    return profiles
+
+
+def apply_build_profile(profile: Dict):
+    """Переключает папки, Drive, БД и Telegram модуля на профиль
+    
+    Вызывается в отдельном процессе профиля: глобальные настройки
+    основного процесса не меняются.
+    """
+    global BUILD_PROFILE, GOOGLE_DRIVE_FOLDER_ID, TELEGRAM_CHAT_IDS, INPUT_DIR, OUTPUT_DIR
+    global DRIVE_UPLOAD_CACHE, PIPELINE_STATE_DIR, RUNS_DIR, HISTORY_DIR, STATIC_CATALOG_DIR
+    
+    name = profile['name']
+    BUILD_PROFILE = name
+    GOOGLE_DRIVE_FOLDER_ID = profile.get('drive_folder_id') or GOOGLE_DRIVE_FOLDER_ID
+    TELEGRAM_CHAT_IDS = profile.get('telegram_chat_ids') or TELEGRAM_CHAT_IDS
+    
+    INPUT_DIR = profile.get('input_dir') or os.path.join(INPUT_DIR, 'profiles', name)
+    OUTPUT_DIR = os.path.join(OUTPUT_DIR, 'profiles', name)
+    DRIVE_UPLOAD_CACHE = os.path.join(OUTPUT_DIR, ".drive_uploads.json")
+    PIPELINE_STATE_DIR = os.path.join(OUTPUT_DIR, ".pipeline")
+    RUNS_DIR = os.path.join(OUTPUT_DIR, "runs")
+    HISTORY_DIR = os.path.join(OUTPUT_DIR, "history")
+    STATIC_CATALOG_DIR = os.path.join(OUTPUT_DIR, "catalog")
+    
+    # Без database_url профиля - database_url из его settings.xlsx, но не общий DATABASE_URL
+    os.environ.pop('DATABASE_URL', None)
+    if profile.get('database_url'):
+        os.environ['DATABASE_URL'] = profile['database_url']
+
+
+def profile_stages(stages: List[Stage], shared: Dict[str, object],
+                   shared_inputs: Tuple[str, ...]) -> List[Stage]:
+    """Стадии профиля: общие результаты подставляются готовыми
+    
+    Отпечаток готовой стадии считается по общим входным файлам, поэтому
+    кэш каталога профиля сбрасывается, когда меняются файлы поставщиков.
+    """
+    skip = stage_closure(stages, SHARED_STAGES) - {'drive:list'}
+    ready = [Stage(name, lambda _, value=value: value, inputs=shared_inputs)
+             for name, value in shared.items()]
+    return ready + [s for s in stages if s.name not in skip]
+
+
+def run_profile_build(profile: Dict, shared: Dict[str, object], shared_inputs: Tuple[str, ...],
+                      use_google_drive: bool, start_time: float, force: bool = False) -> bool:
+    """Цены, Excel, снапшоты и публикация одного профиля (в отдельном процессе)"""
+    apply_build_profile(profile)
+    reset_drive_setup_stats()
+    print(f"\n🏷 Профиль {BUILD_PROFILE}: {INPUT_DIR}/settings.xlsx → {OUTPUT_DIR}/")
+    
+    try:
+        stages = profile_stages(build_stages(use_google_drive, start_time), shared, shared_inputs)
+        run_pipeline(stages, force=force)
+        print_drive_setup_stats()
+        return True
+    except Exception as e:
+        print(f"\n❌ [{BUILD_PROFILE}] ОШИБКА: {e}")
+        import traceback
+        traceback.print_exc()
+        notify_error(str(e))
+        return False
+
+
+def run_multi_build(use_google_drive: bool, profiles: List[Dict], force: bool = False) -> bool:
+    """Сборка нескольких профилей: файлы поставщиков парсятся один раз,
+    затем профили считаются и публикуются параллельно в отдельных процессах
+    
+    Returns:
+        False, если упала общая часть или хотя бы один профиль
+    """
+    import time
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    
+    start_time = time.time()
+    
+    print("=" * 70)
+    print(f"🚀 PRICE SYSTEM v5.0: {len(profiles)} профилей ({', '.join(p['name'] for p in profiles)})")
+    print("=" * 70)
+    
+    try:
+        notify_start()
+        
+        stages = build_stages(use_google_drive, start_time)
+        needed = stage_closure(stages, SHARED_STAGES)
+        results = run_pipeline([s for s in stages if s.name in needed], force=force)
+        
+    except Exception as e:
+        print(f"\n❌ ОШИБКА: {e}")
+        import traceback
+        traceback.print_exc()
+        notify_error(str(e))
+        return False
+    
+    shared = {name: results[name] for name in SHARED_STAGES}
+    shared_inputs = tuple(os.path.abspath(os.path.join(INPUT_DIR, name)) for name in SHARED_FILES)
+    
+    # spawn: чистый процесс без унаследованных соединений и блокировок
+    # (импорт build.py лёгкий, pandas грузится только в стадиях)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(PROFILE_WORKERS, len(profiles)), mp_context=context) as executor:
+        futures = {
+            profile['name']: executor.submit(run_profile_build, profile, shared, shared_inputs,
+                                             use_google_drive, start_time, force)
+            for profile in profiles
+        }
+        outcome = {}
+        for name, future in futures.items():
+            try:
+                outcome[name] = future.result()
+            except Exception as e:
+                print(f"❌ [{name}] Процесс профиля упал: {e}")
+                outcome[name] = False
+    
+    print("\n" + "=" * 70)
+    for name, success in outcome.items():
+        print(f"  {'✅' if success else '❌'} {name}")
+    print(f"⏱ Время выполнения: {time.time() - start_time:.1f} сек")
+    print("=" * 70)
+    
+    return all(outcome.values())
+
+
+# ============================================================================
+# ГЛАВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+def run_build(use_google_drive: bool, force: bool = False,
+              resume_from: Optional[str] = None, run_id: Optional[str] = None) -> bool:
+    """Полная сборка прайса
+    
+    force=True - не пропускать стадии с неизменившимися входами
+    resume_from - перезапустить прогон run_id (по умолчанию последний)
+    с этой стадии, остальное взять из его чекпойнтов
+    
+    Returns:
+        False, если сборка упала с ошибкой
+    """
+    import time
+    start_time = time.time()
+    reset_drive_setup_stats()
+    
+    print("=" * 70)
+    print("🚀 PRICE SYSTEM v5.0 (Google Drive + Telegram + Name Cache)")
+    print("=" * 70)
+    
+    run_dir = None
+    try:
+        # Уведомление о старте
+        notify_start()
+        
+        if not use_google_drive:
+            print("\n📂 Используем локальные файлы из папки input/")
+        
+        # Скачивание → парсинг → объединение → Excel, снапшоты, публикация
+        stages = build_stages(use_google_drive, start_time)
+        if resume_from:
+            run_dir = find_run_dir(run_id)
+            stages = resume_stages(stages, resume_from, run_dir)
+            print(f"\n↩️ Возобновление прогона {os.path.basename(run_dir)} со стадии {resume_from}")
+        else:
+            run_dir = new_run_dir()
+            print(f"\n🆔 Прогон {os.path.basename(run_dir)}")
+        run_pipeline(stages, force=force, run_dir=run_dir)
+        print_drive_setup_stats()
+        
+    except Exception as e:
+        print(f"\n❌ ОШИБКА: {e}")
+        import traceback
+        traceback.print_exc()
+        
+        error = str(e)
+        failed = load_run_manifest(run_dir).get('failed') if run_dir else None
+        if failed:
+            retry = f"python3 scripts/build.py --resume-from {failed} --run-id {os.path.basename(run_dir)}"
+            print(f"↩️ Повторить с упавшей стадии: {retry}")
+            error += f"\n↩️ {retry}"
+        
+        # Уведомление об ошибке
+        notify_error(error)
+        return False
+    
+    return True
+
+
+def main():
+    """Основная функция"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Сборка прайс-листов")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--watch', action='store_true',
+                      help="режим демона: пересобирать при изменении файлов поставщиков")
+    mode.add_argument('--stock-only', action='store_true',
+                      help="обновить в PostgreSQL только остатки и сроки")
+    mode.add_argument('--reprice', action='store_true',
+                      help="пересчитать цены в PostgreSQL по settings.xlsx")
+    mode.add_argument('--dry-run', action='store_true',
+                      help="показать план сборки без запуска")
+    parser.add_argument('--force', action='store_true',
+                        help="не пропускать стадии с неизменившимися входами")
+    parser.add_argument('--profiles', default=BUILD_PROFILES_FILE,
+                        help="JSON со списком профилей сборки (регионы/партнёры)")
+    parser.add_argument('--resume-from', metavar='STAGE',
+                        help="перезапустить прогон с этой стадии (например, publish:drive), "
+                             "несколько - через запятую")
+    parser.add_argument('--run-id',
+                        help="прогон для --resume-from (по умолчанию последний)")
+    args = parser.parse_args()
+    
+    if args.resume_from and (args.watch or args.stock_only or args.reprice or args.profiles):
+        parser.error("--resume-from поддерживается только для полной сборки")
+    
+    # Определяем режим работы
+    use_google_drive = os.environ.get('USE_GOOGLE_DRIVE', 'true').lower() == 'true'
+    
+    if args.profiles:
+        if args.watch or args.stock_only or args.reprice or args.dry_run:
+            parser.error("--profiles поддерживается только для полной сборки")
+        profiles = load_build_profiles(args.profiles, use_google_drive)
+        with build_lock():
+            success = run_multi_build(use_google_drive, profiles, force=args.force)
+        if not success:
+            sys.exit(1)
+        return
+    
+    if args.dry_run:
+        stages = build_stages(use_google_drive, 0.0)
+        if args.resume_from:
+            stages = resume_stages(stages, args.resume_from, find_run_dir(args.run_id))
+        plan_pipeline(stages, force=args.force)
+        return
+    
+    if args.watch:
+        watch(use_google_drive)
+        return
+    
+    with build_lock():
+        if args.stock_only:
+            success = run_stock_refresh(use_google_drive)
+        elif args.reprice:
+            success = run_reprice(use_google_drive)
+        else:
+            success = run_build(use_google_drive, force=args.force,
+                                resume_from=args.resume_from, run_id=args.run_id)
+    
+    if not success:
         sys.exit(1)
 
 
@@ -0,0 +1,79 @@
+"""
+Price System - расчёт цен и сроков поставки
+
+Чистые функции без тяжёлых зависимостей (pandas, Google API, requests):
+импортируются build.py и тестами без лишних затрат на старт.
+"""
+
+import re
+from typing import Dict
+
+
+# Сроки поставки по наличию на складах
+LEAD_TIME_ASTANA = "6-10 дней"
+LEAD_TIME_ALMATY = "10-14 дней"
+LEAD_TIME_ON_REQUEST = "по запросу"
+
+
+# ============================================================================
+# ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
+# ============================================================================
+
+def clean(x):
+    """Очистка строковых значений"""
+    if isinstance(x, str):
+        return x.strip()
+    return x
+
+
+def safe_float(x):
+    """Безопасное преобразование в float"""
+    try:
+        if x is None or x != x:  # NaN не равен сам себе
+            return None
+        return float(x)
+    except:
+        return None
+
+
+def manufacturer_slug(manufacturer: str) -> str:
+    """Имя файла для производителя: 'OBO Bettermann' → 'obo-bettermann'"""
+    slug = re.sub(r'[^a-z0-9]+', '-', str(manufacturer).lower()).strip('-')
+    return slug or 'unknown'
+
+
+# ============================================================================
+# СРОКИ ПОСТАВКИ
+# ============================================================================
+
+def determine_lead_time(article: str, almaty: Dict, astana: Dict) -> str:
+    """Определяет срок доставки по наличию"""
+    astana_qty = astana.get(article, 0)
+    almaty_qty = almaty.get(article, 0)
+    
+    if astana_qty > 0:
+        return LEAD_TIME_ASTANA
+    if almaty_qty > 0:
+        return LEAD_TIME_ALMATY
+    return LEAD_TIME_ON_REQUEST
+
+
+# ============================================================================
+# ЦЕНЫ
+# ============================================================================
+
+def get_margin(article: str, manufacturer: str, margins_dict: Dict) -> float:
+    """Возвращает маржу с учетом приоритета"""
+    if article in margins_dict['by_article']:
+        return margins_dict['by_article'][article]
+    if manufacturer in margins_dict['by_manufacturer']:
+        return margins_dict['by_manufacturer'][manufacturer]
+    return margins_dict['global_margin']
+
+
+def calculate_client_price(dealer_price_kzt: float, article: str, manufacturer: str,
+                          kurs: float, margins_dict: Dict) -> int:
+    """Рассчитывает клиентскую цену в рублях"""
+    margin = get_margin(article, manufacturer, margins_dict)
+    client_price_rub = (dealer_price_kzt * (1 + margin)) / kurs
+    return round(client_price_rub)
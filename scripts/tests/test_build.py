@@ -4,204 +4,1034 @@
 import pytest
 import sys
 import os
+import gzip
+import json
+import tracemalloc
+import threading
+
+import numpy as np
+import pandas as pd
 
 # Добавляем путь к скриптам
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from pricing import calculate_client_price
 from build import (
-    determine_lead_time,
-    get_margin,
-    calculate_client_price,
-    clean,
-    safe_float
+    manufacturer_slug,
+    generate_static_snapshots,
+    build_search_index,
+    search_index_lookup,
+    make_catalog,
+    concat_catalogs,
+    prepare_catalog_rows,
+    dedupe_catalog,
+    diff_price_history,
+    format_history_summary,
+    append_price_history,
+    list_history_dates,
+    record_price_history,
+    CATALOG_DTYPES,
+    detect_input_changes,
+    poll_drive_changes,
+    xlsx_content_md5,
+    upload_file_to_drive,
+    get_drive_service,
+    publish_telegram,
+    notify_catalog_updated,
+    Stage,
+    order_stages,
+    run_pipeline,
+    stage_closure,
+    load_build_profiles,
+    apply_build_profile,
+    profile_stages
 )
+import build
+
+
+class TestCatalog:
+    """Тесты колоночного каталога"""
+    
+    margins = {'global_margin': 0.6, 'by_manufacturer': {'Jung': 0.5}, 'by_article': {'ls1520': 0.4}}
+    
+    def test_make_and_concat(self):
+        """Кортежи и словари, общие категории после объединения"""
+        euro = make_catalog([('Jung', 'ls1520', 'Розетка', 6000.0, '6-10 дней', '', '')])
+        wago = make_catalog([{'manufacturer': 'Wago', 'article': 2002, 'name': 'Клемма',
+                              'dealer_price_kzt': 100, 'srok': '10-14 дней',
+                              'catalog_url': '', 'image_url': ''}])
+        catalog = concat_catalogs(euro, wago, make_catalog([]))
+        assert list(catalog['manufacturer'].cat.categories) == ['Jung', 'Wago']
+        assert catalog['article'].tolist() == ['ls1520', '2002']
+        assert catalog.dtypes.astype(str).to_dict() == CATALOG_DTYPES
+    
+    def test_prices_match_scalar_calculation(self):
+        """Векторный расчёт совпадает с calculate_client_price"""
+        rng = np.random.default_rng(42)
+        prices = rng.uniform(1, 100000, 2000).round(2)
+        records = [
+            (['Jung', 'Legrand', 'IEK'][i % 3], f"ls{i % 1600}", 'x', price, '', '', '')
+            for i, price in enumerate(prices)
+        ]
+        rows = prepare_catalog_rows(make_catalog(records), {'kurs': 5.3}, {}, {}, self.margins)
+        expected = [
+            calculate_client_price(r[3], r[1], r[0], 5.3, self.margins) for r in records
+        ]
+        assert rows['price_rub'].tolist() == expected
+        assert rows['margin_source'].tolist()[:4] == ['manufacturer', 'global', 'global', 'manufacturer']
+    
+    def test_lead_time_and_stock(self):
+        """Остатки по артикулу, срок - из srok или по наличию"""
+        catalog = make_catalog([
+            ('Jung', 'LS1', 'a', 100.0, '', '', ''),
+            ('Wago', 'w1', 'b', 100.0, '10-14 дней', '', ''),
+        ])
+        rows = prepare_catalog_rows(catalog, {'kurs': 5}, {'ls1': 2.0}, {'ls1': 0, 'w1': 7.9}, self.margins)
+        assert rows['article'].tolist() == ['ls1', 'w1']
+        assert rows['lead_time_default'].tolist() == ['10-14 дней', '10-14 дней']
+        assert rows['astana_qty'].tolist() == [0, 7]
+        assert rows['almaty_qty'].tolist() == [2, 0]
+    
+    def test_peak_memory_500k(self):
+        """Каталог на 500k товаров и подготовка строк для БД укладываются в бюджет"""
+        n = 500_000
+        rng = np.random.default_rng(0)
+        brands = np.array(build.ALLOWED_BRANDS)
+        catalog = pd.DataFrame({
+            'manufacturer': brands[rng.integers(0, len(brands), n)],
+            'article': [f"art{i:07d}" for i in range(n)],
+            'name': [f"Товар {i}" for i in range(n)],
+            'dealer_price_kzt': rng.uniform(100, 100000, n).round(2),
+            'srok': '',
+            'catalog_url': '',
+            'image_url': '',
+        }).astype(CATALOG_DTYPES)
+        stock = {f"art{i:07d}": 3.0 for i in range(0, n, 7)}
+        
+        assert catalog.memory_usage(deep=True).sum() < 110 * 2**20
+        
+        tracemalloc.start()
+        try:
+            rows = prepare_catalog_rows(catalog, {'kurs': 5}, stock, {}, self.margins)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        
+        assert len(rows) == n
+        assert peak < 250 * 2**20
+
+
+class TestDedupe:
+    """Тесты дедупликации артикулов"""
+    
+    euro = make_catalog([
+        ('Jung', 'ls1', 'Розетка', 100.0, '', '', ''),
+        ('Jung', 'LS1', 'Розетка 2', 90.0, '', '', ''),
+        ('IEK', 'x1', 'Автомат', 5.0, '', '', ''),
+    ])
+    wago = make_catalog([
+        ('Wago', 'ls1', 'Клемма', 80.0, '10-14 дней', '', ''),
+        ('Wago', 'w1', 'Клемма', 1.0, '10-14 дней', '', ''),
+    ])
+    
+    def _dedupe(self, **kwargs):
+        return dedupe_catalog({'Euroelectric': self.euro, 'Axima': self.wago}, **kwargs)
+    
+    def test_cheapest(self):
+        """По умолчанию побеждает минимальная цена"""
+        catalog, report = self._dedupe()
+        assert sorted(catalog['name']) == ['Автомат', 'Клемма', 'Клемма']
+        assert len(report) == 3
+        assert report[report['winner']]['supplier'].tolist() == ['Axima']
+    
+    def test_supplier_priority(self):
+        """Приоритет поставщика, внутри поставщика - дешевле"""
+        catalog, report = self._dedupe(policy='priority', supplier_priority=['Euroelectric'])
+        assert catalog['article'].str.lower().is_unique
+        assert 'Розетка 2' in catalog['name'].tolist()
+        assert report[report['winner']]['name'].tolist() == ['Розетка 2']
+    
+    def test_no_duplicates(self):
+        """Без дублей отчёт пустой, порядок сохраняется"""
+        catalog, report = dedupe_catalog({'Axima': self.wago})
+        assert report.empty
+        assert catalog['article'].tolist() == ['ls1', 'w1']
+    
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            self._dedupe(policy='random')
+    
+    def test_keys_match_database_rows(self):
+        """Дубли ищутся по тому же ключу, что пишется в БД"""
+        euro = make_catalog([('Jung', ' ls1 ', 'Розетка', 100.0, '', '', '')])
+        catalog, report = dedupe_catalog({'Euroelectric': euro, 'Axima': self.wago})
+        assert len(report) == 2
+        rows = prepare_catalog_rows(self.wago, {'kurs': 5}, {}, {},
+                                    {'global_margin': 0.6, 'by_article': {}, 'by_manufacturer': {}})
+        assert set(report['article_key']) == {build.article_keys(euro['article'])[0]} == {rows['article'][0]}
+    
+    def test_report_written_when_stage_cached(self, tmp_path, monkeypatch):
+        """Отчёт о дублях пишется и когда дедупликация взята из кэша"""
+        monkeypatch.setattr(build, 'OUTPUT_DIR', str(tmp_path / 'output'))
+        monkeypatch.setattr(build, 'PIPELINE_STATE_DIR', str(tmp_path / 'state'))
+        ready = {'euroelectric': self.euro, 'axima': self.wago, 'settings': ({}, {})}
+        
+        def make_stages():
+            stages = [s for s in build.build_stages(False, 0) if s.name in ('dedupe', 'catalog', 'conflicts')]
+            return stages + [Stage(name, lambda _, v=value: v) for name, value in ready.items()]
+        
+        run_pipeline(make_stages())
+        for report in (tmp_path / 'output').glob('DUPLICATES_*.xlsx'):
+            report.unlink()
+        run_pipeline(make_stages())
+        
+        assert build.load_pipeline_state().get('dedupe')
+        assert list((tmp_path / 'output').glob('DUPLICATES_*.xlsx'))
+
+
+class TestPriceHistory:
+    """Тесты истории цен"""
+    
+    margins = {'global_margin': 0.6, 'by_manufacturer': {}, 'by_article': {}}
+    
+    def test_diff(self):
+        """Новые, пропавшие и изменившие цену артикулы"""
+        previous = pd.DataFrame({'article': ['a', 'b', 'c'], 'manufacturer': ['Jung'] * 3,
+                                 'price_rub': [100, 200, 300]})
+        current = pd.DataFrame({'article': ['a', 'b', 'd'], 'manufacturer': ['Jung'] * 3,
+                                'price_rub': [100, 150, 50]})
+        diff = diff_price_history(previous, current)
+        assert (diff['added'], diff['removed'], diff['repriced']) == (1, 1, 1)
+        move = diff['top_moves'].iloc[0]
+        assert move['article'] == 'b' and move['price_rub_prev'] == 200 and move['change_pct'] == -25
+    
+    def test_diff_same_article_other_manufacturer(self):
+        """Одинаковый артикул у двух производителей - два разных товара"""
+        previous = pd.DataFrame({'article': ['a', 'a'], 'manufacturer': ['Jung', 'ABB'],
+                                 'price_rub': [100, 900]})
+        current = pd.DataFrame({'article': ['a', 'a'], 'manufacturer': ['Jung', 'ABB'],
+                                'price_rub': [100, 900]})
+        diff = diff_price_history(previous, current)
+        assert (diff['added'], diff['removed'], diff['repriced']) == (0, 0, 0)
+    
+    def test_diff_zero_previous_price(self):
+        """Цена с нуля считается изменённой, но не ломает топ"""
+        previous = pd.DataFrame({'article': ['a', 'b'], 'manufacturer': ['Jung'] * 2,
+                                 'price_rub': [0, 200]})
+        current = pd.DataFrame({'article': ['a', 'b'], 'manufacturer': ['Jung'] * 2,
+                                'price_rub': [500, 300]})
+        diff = diff_price_history(previous, current)
+        assert diff['repriced'] == 2
+        assert diff['top_moves']['article'].tolist() == ['b']
+        assert 'inf' not in format_history_summary(diff, '2000-01-01')
+    
+    def test_summary_escapes_article(self):
+        """Артикул экранируется для HTML-подписи Telegram"""
+        previous = pd.DataFrame({'article': ['a<b>&'], 'manufacturer': ['Jung'], 'price_rub': [100]})
+        current = pd.DataFrame({'article': ['a<b>&'], 'manufacturer': ['Jung'], 'price_rub': [200]})
+        summary = format_history_summary(diff_price_history(previous, current), '2000-01-01')
+        assert '<code>a&lt;b&gt;&amp;</code>' in summary
+    
+    def test_record_against_previous_day(self, tmp_path, monkeypatch):
+        """Снимок пишется в партицию дня и сравнивается с последним предыдущим"""
+        monkeypatch.setattr(build, 'HISTORY_DIR', str(tmp_path))
+        catalog = make_catalog([
+            ('Jung', 'a', 'x', 500.0, '', '', ''),
+            ('Jung', 'b', 'y', 1000.0, '', '', ''),
+        ])
+        old = build.prepare_catalog_rows(catalog, {'kurs': 5}, {}, {}, self.margins)
+        append_price_history(old.assign(price_rub=old['price_rub'] * 2), '2000-01-01')
+        append_price_history(old.iloc[:1], '1999-12-31')
+        
+        summary = record_price_history(catalog, {'kurs': 5}, {}, {}, self.margins)
+        
+        assert len(list_history_dates()) == 3
+        assert 'с 2000-01-01' in summary
+        assert '(-50%)' in summary
+
+
+class TestStaticSnapshots:
+    """Тесты статических снапшотов каталога"""
+    
+    products = [
+        {'manufacturer': 'Jung', 'article': 'ls1912', 'name': 'Рамка', 'dealer_price_kzt': 5000,
+         'srok': 'по запросу', 'catalog_url': '', 'image_url': ''},
+        {'manufacturer': 'Jung', 'article': 'ls1520', 'name': 'Розетка', 'dealer_price_kzt': 6000,
+         'srok': '6-10 дней', 'catalog_url': '', 'image_url': ''},
+        {'manufacturer': 'OBO Bettermann', 'article': 'obo1', 'name': 'Лоток', 'dealer_price_kzt': 1000,
+         'srok': '10-14 дней', 'catalog_url': '', 'image_url': ''},
+    ]
+    settings = {'kurs': 5}
+    margins = {'global_margin': 0.6, 'by_manufacturer': {}, 'by_article': {}}
+    
+    def _generate(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(build, 'STATIC_CATALOG_DIR', str(tmp_path))
+        index_path = generate_static_snapshots(make_catalog(self.products), self.settings, {}, {'ls1520': 3},
+                                               self.margins)
+        with open(index_path, encoding='utf-8') as f:
+            return json.load(f)
+    
+    def test_slug(self):
+        """Имя файла производителя"""
+        assert manufacturer_slug('OBO Bettermann') == 'obo-bettermann'
+        assert manufacturer_slug('Schneider Electric') == 'schneider-electric'
+    
+    def test_manifest_and_shards(self, tmp_path, monkeypatch):
+        """Манифест ссылается на шарды, .gz совпадает с .json"""
+        manifest = self._generate(tmp_path, monkeypatch)
+        assert manifest['total'] == 3
+        assert [m['name'] for m in manifest['manufacturers']] == ['Jung', 'OBO Bettermann']
+        
+        jung = manifest['manufacturers'][0]
+        assert jung['file'].startswith('jung.') and jung['count'] == 2
+        raw = (tmp_path / jung['file']).read_bytes()
+        assert gzip.decompress((tmp_path / (jung['file'] + '.gz')).read_bytes()) == raw
+    
+    def test_shard_sorted_like_api(self, tmp_path, monkeypatch):
+        """Сначала товары в наличии, цена в рублях"""
+        manifest = self._generate(tmp_path, monkeypatch)
+        shard = json.loads((tmp_path / manifest['manufacturers'][0]['file']).read_text(encoding='utf-8'))
+        assert [p['article'] for p in shard['products']] == ['ls1520', 'ls1912']
+        assert shard['products'][0]['priceRub'] == 1920
+        assert shard['products'][0]['astanaQty'] == 3
+    
+    def test_search_index_shard(self, tmp_path, monkeypatch):
+        """Индекс поиска ссылается на строки all"""
+        manifest = self._generate(tmp_path, monkeypatch)
+        index = json.loads((tmp_path / manifest['search']['file']).read_text(encoding='utf-8'))
+        all_shard = json.loads((tmp_path / manifest['all']['file']).read_text(encoding='utf-8'))
+        assert index['articles'] == [p['article'] for p in all_shard['products']]
+        rows = search_index_lookup(index, 'рамк')
+        assert [all_shard['products'][row]['article'] for row in rows] == ['ls1912']
+    
+    def test_stale_shards_removed(self, tmp_path, monkeypatch):
+        """Шарды прошлой сборки удаляются"""
+        (tmp_path / 'jung.000000000000.json').write_text('{}')
+        (tmp_path / 'jung.000000000000.json.gz').write_bytes(b'')
+        self._generate(tmp_path, monkeypatch)
+        assert not (tmp_path / 'jung.000000000000.json').exists()
+        assert not (tmp_path / 'jung.000000000000.json.gz').exists()
+    
+    def test_shards_stable_and_kept_one_generation(self, tmp_path, monkeypatch):
+        """Те же данные - те же имена шардов; шарды прошлой сборки удаляются через сборку"""
+        first = self._generate(tmp_path, monkeypatch)
+        assert self._generate(tmp_path, monkeypatch)['all']['file'] == first['all']['file']
+        
+        monkeypatch.setattr(self, 'settings', {'kurs': 4})
+        second = self._generate(tmp_path, monkeypatch)
+        assert second['all']['file'] != first['all']['file']
+        assert (tmp_path / first['all']['file']).exists()
+        
+        monkeypatch.setattr(self, 'settings', {'kurs': 3})
+        self._generate(tmp_path, monkeypatch)
+        assert not (tmp_path / first['all']['file']).exists()
+        assert (tmp_path / second['all']['file']).exists()
+
+
+class TestQuickRefresh:
+    """Тесты --stock-only и --reprice: статические шарды обновляются вместе с БД"""
+    
+    products = TestStaticSnapshots.products
+    margins = TestStaticSnapshots.margins
+    
+    @pytest.fixture
+    def env(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(build, 'STATIC_CATALOG_DIR', str(tmp_path / 'catalog'))
+        monkeypatch.setattr(build, 'PIPELINE_STATE_DIR', str(tmp_path / 'state'))
+        monkeypatch.setattr(build, 'HISTORY_DIR', str(tmp_path / 'history'))
+        monkeypatch.setenv('DATABASE_URL', 'postgresql://test')
+        monkeypatch.setattr(build, 'load_settings', lambda: ({'kurs': 5}, self.margins))
+        monkeypatch.setattr(build, 'load_stock', lambda: ({'ls1912': 3}, {'ls1520': 7}))
+        monkeypatch.setattr(build, 'update_stock_in_postgresql', lambda *args: True)
+        monkeypatch.setattr(build, 'notify_error', lambda error: None)
+        
+        # Кэш стадии catalog, как после полной сборки
+        stage = Stage('dedupe', lambda _: (make_catalog(self.products), pd.DataFrame()), cacheable=True)
+        run_pipeline([stage])
+        return tmp_path
+    
+    def read_shard(self, env, name):
+        manifest = json.loads((env / 'catalog' / 'index.json').read_text(encoding='utf-8'))
+        entry = next(m for m in manifest['manufacturers'] if m['name'] == name)
+        return json.loads((env / 'catalog' / entry['file']).read_text(encoding='utf-8'))['products']
+    
+    def test_stock_only_updates_shards(self, env):
+        """Новые остатки и сроки попадают в шарды"""
+        assert build.run_stock_refresh(False)
+        jung = {p['article']: p for p in self.read_shard(env, 'Jung')}
+        assert jung['ls1520']['astanaQty'] == 7
+        assert jung['ls1520']['leadTimeDefault'] == '6-10 дней'
+        # Срок из кэша (по остаткам полной сборки) пересчитан по новым остаткам
+        assert (jung['ls1912']['almatyQty'], jung['ls1912']['leadTimeDefault']) == (3, '10-14 дней')
+        obo = self.read_shard(env, 'OBO Bettermann')[0]
+        assert (obo['astanaQty'], obo['almatyQty'], obo['leadTimeDefault']) == (0, 0, 'по запросу')
+    
+    def test_reprice_updates_shards_and_history(self, env, monkeypatch):
+        """Новый курс - новые цены в шардах и снимок истории"""
+        monkeypatch.setattr(build, 'load_settings', lambda: ({'kurs': 4, 'global_margin': 0.6}, self.margins))
+        monkeypatch.setattr(build, 'reprice_in_postgresql', lambda *args: True)
+        assert build.run_reprice(False)
+        jung = {p['article']: p for p in self.read_shard(env, 'Jung')}
+        assert jung['ls1520']['priceRub'] == 2400
+        assert len(list_history_dates()) == 1
+    
+    def test_no_cached_catalog_invalidates_index(self, env):
+        """Без кэша каталога index.json удаляется - клиент идёт в API"""
+        build.run_stock_refresh(False)
+        os.remove(build._stage_cache_path('dedupe'))
+        assert build.run_stock_refresh(False)
+        assert not (env / 'catalog' / 'index.json').exists()
 
 
-class TestLeadTime:
-    """Тесты для функции determine_lead_time"""
-    
-    def test_astana_enough(self):
-        """Если есть в Астане → 6-10 дней"""
-        astana = {'art1': 14}
-        almaty = {'art1': 2}
-        assert determine_lead_time('art1', almaty, astana) == "6-10 дней"
-    
-    def test_astana_only(self):
-        """Только в Астане → 6-10 дней"""
-        astana = {'art1': 5}
-        almaty = {}
-        assert determine_lead_time('art1', almaty, astana) == "6-10 дней"
-    
-    def test_almaty_only(self):
-        """Только в Алматы → 10-14 дней"""
-        astana = {}
-        almaty = {'art1': 10}
-        assert determine_lead_time('art1', almaty, astana) == "10-14 дней"
-    
-    def test_combined_stock(self):
-        """Сумма складов > 0 → 10-14 дней"""
-        astana = {'art1': 0}
-        almaty = {'art1': 5}
-        assert determine_lead_time('art1', almaty, astana) == "10-14 дней"
-    
-    def test_no_stock(self):
-        """Нигде нет → по запросу"""
-        astana = {}
-        almaty = {}
-        assert determine_lead_time('art1', almaty, astana) == "по запросу"
-    
-    def test_zero_both(self):
-        """Нули везде → по запросу"""
-        astana = {'art1': 0}
-        almaty = {'art1': 0}
-        assert determine_lead_time('art1', almaty, astana) == "по запросу"
-    
-    def test_article_not_found(self):
-        """Артикул не найден → по запросу"""
-        astana = {'other': 10}
-        almaty = {'other': 10}
-        assert determine_lead_time('art1', almaty, astana) == "по запросу"
-
-
-class TestPriceCalculation:
-    """Тесты для расчета цен"""
-    
-    def test_basic_price(self):
-        """Базовый расчет цены"""
-        # dealer_price=6000, margin=60%, kurs=5
-        # (6000 * 1.6) / 5 = 1920
-        margins_dict = {
-            'global_margin': 0.6,
-            'by_manufacturer': {},
-            'by_article': {}
-        }
-        result = calculate_client_price(6000, 'art1', 'Jung', 5, margins_dict)
-        assert result == 1920
-    
-    def test_price_with_manufacturer_margin(self):
-        """Цена с маржой по производителю"""
-        margins_dict = {
-            'global_margin': 0.6,
-            'by_manufacturer': {'Jung': 0.5},  # 50% вместо 60%
-            'by_article': {}
-        }
-        # (6000 * 1.5) / 5 = 1800
-        result = calculate_client_price(6000, 'art1', 'Jung', 5, margins_dict)
-        assert result == 1800
-    
-    def test_price_with_article_margin(self):
-        """Цена с маржой по артикулу (приоритет)"""
-        margins_dict = {
-            'global_margin': 0.6,
-            'by_manufacturer': {'Jung': 0.5},
-            'by_article': {'art1': 0.4}  # 40% - приоритет над производителем
-        }
-        # (6000 * 1.4) / 5 = 1680
-        result = calculate_client_price(6000, 'art1', 'Jung', 5, margins_dict)
-        assert result == 1680
-    
-    def test_price_rounding(self):
-        """Округление цены до целого"""
-        margins_dict = {
-            'global_margin': 0.6,
-            'by_manufacturer': {},
-            'by_article': {}
-        }
-        # (1000 * 1.6) / 3 = 533.33... → 533
-        result = calculate_client_price(1000, 'art1', 'Jung', 3, margins_dict)
-        assert result == 533
-
-
-class TestMargin:
-    """Тесты для функции get_margin"""
-    
-    def test_global_margin(self):
-        """Глобальная маржа по умолчанию"""
-        margins_dict = {
-            'global_margin': 0.6,
-            'by_manufacturer': {},
-            'by_article': {}
-        }
-        assert get_margin('art1', 'Jung', margins_dict) == 0.6
-    
-    def test_manufacturer_margin(self):
-        """Маржа по производителю"""
-        margins_dict = {
-            'global_margin': 0.6,
-            'by_manufacturer': {'Jung': 0.5},
-            'by_article': {}
-        }
-        assert get_margin('art1', 'Jung', margins_dict) == 0.5
-    
-    def test_article_margin_priority(self):
-        """Маржа по артикулу имеет приоритет"""
-        margins_dict = {
-            'global_margin': 0.6,
-            'by_manufacturer': {'Jung': 0.5},
-            'by_article': {'art1': 0.4}
-        }
-        assert get_margin('art1', 'Jung', margins_dict) == 0.4
-    
-    def test_unknown_manufacturer(self):
-        """Неизвестный производитель → глобальная маржа"""
-        margins_dict = {
-            'global_margin': 0.6,
-            'by_manufacturer': {'Jung': 0.5},
-            'by_article': {}
-        }
-        assert get_margin('art1', 'Unknown', margins_dict) == 0.6
-
-
-class TestHelpers:
-    """Тесты вспомогательных функций"""
-    
-    def test_clean_string(self):
-        """Очистка строки от пробелов"""
-        assert clean("  hello  ") == "hello"
-        assert clean("test") == "test"
-    
-    def test_clean_non_string(self):
-        """Очистка не-строки"""
-        assert clean(123) == 123
-        assert clean(None) is None
-    
-    def test_safe_float_number(self):
-        """Преобразование числа"""
-        assert safe_float(123) == 123.0
-        assert safe_float(123.45) == 123.45
-    
-    def test_safe_float_string(self):
-        """Преобразование строки в число"""
-        assert safe_float("123") == 123.0
-        assert safe_float("123.45") == 123.45
-    
-    def test_safe_float_invalid(self):
-        """Невалидные значения"""
-        assert safe_float("abc") is None
-        assert safe_float(None) is None
-    
-    def test_safe_float_nan(self):
-        """NaN значения"""
-        import pandas as pd
-        assert safe_float(pd.NA) is None
-
-
-class TestExamplesFromTZ:
-    """Тесты примеров из ТЗ"""
-    
-    def test_ls1520_astana_14_almaty_2_order_14(self):
-        """LS1520: Астана=14, Алматы=2, Заказ=14 → 6-10 дней (проверка по наличию)"""
-        astana = {'ls1520': 14}
-        almaty = {'ls1520': 2}
-        # Функция determine_lead_time проверяет только наличие, не количество заказа
-        assert determine_lead_time('ls1520', almaty, astana) == "6-10 дней"
-    
-    def test_wago_default_lead_time(self):
-        """Wago всегда 10-14 дней (нет на локальных складах)"""
-        astana = {}
-        almaty = {}
-        # Wago нет на наших складах, но срок задается вручную
-        assert determine_lead_time('wago123', almaty, astana) == "по запросу"
+class TestSearchIndex:
+    """Тесты поискового индекса"""
+    
+    index = build_search_index(
+        ['ls1520', 'S201-C16', 'cd581', 'ls1912'],
+        ['Розетка с заземлением', 'Автомат 16А', 'Выключатель одноклавишный', 'Рамка 2-местная, ёлка']
+    )
+    
+    def test_keys_sorted(self):
+        """Ключи отсортированы, строки в postings по возрастанию"""
+        assert self.index['keys'] == sorted(self.index['keys'])
+        assert all(rows == sorted(rows) for rows in self.index['postings'])
+    
+    def test_article_substring(self):
+        """Часть артикула в любом месте, без учёта регистра и разделителей"""
+        assert search_index_lookup(self.index, '1520') == [0]
+        assert search_index_lookup(self.index, 'LS') == [0, 3]
+        assert search_index_lookup(self.index, 's201c16') == [1]
+        assert search_index_lookup(self.index, 'S201-C1') == [1]
+        assert search_index_lookup(self.index, '0') == [0, 1]  # в том числе последний символ
+    
+    def test_name_prefix(self):
+        """Префиксы слов наименования, все слова запроса должны совпасть"""
+        assert search_index_lookup(self.index, 'выкл') == [2]
+        assert search_index_lookup(self.index, 'Розетка заз') == [0]
+        assert search_index_lookup(self.index, 'розетка рамка') == []
+        assert search_index_lookup(self.index, 'елка') == [3]
+    
+    def test_empty_query(self):
+        """Пустой запрос ничего не находит"""
+        assert search_index_lookup(self.index, '  ') == []
+        assert search_index_lookup(self.index, 'zzz') == []
+
+
+class FakeDriveChanges:
+    """Заглушка service.changes() с постраничной выдачей"""
+    
+    def __init__(self, pages):
+        self.pages = pages
+        self.tokens = []
+    
+    def changes(self):
+        return self
+    
+    def list(self, pageToken, **kwargs):
+        self.tokens.append(pageToken)
+        page = self.pages[pageToken]
+        return type('Request', (), {'execute': lambda _self: page})()
+
+
+class TestWatch:
+    """Тесты режима наблюдения"""
+    
+    def test_detect_input_changes(self):
+        """Новые, изменённые и удалённые файлы"""
+        before = {'settings.xlsx': (1.0, 10), 'Axima_price.xlsx': (1.0, 20)}
+        after = {'settings.xlsx': (2.0, 10), 'Euroelectric.xlsx': (1.0, 30)}
+        assert detect_input_changes(before, after) == ['Axima_price.xlsx', 'Euroelectric.xlsx', 'settings.xlsx']
+        assert detect_input_changes(before, before) == []
+    
+    def test_local_change_during_build(self, tmp_path, monkeypatch):
+        """Файл, изменённый во время сборки, запускает следующую сборку"""
+        import time
+        
+        monkeypatch.setattr(build, 'INPUT_DIR', str(tmp_path / 'input'))
+        monkeypatch.setattr(build, 'OUTPUT_DIR', str(tmp_path / 'output'))
+        monkeypatch.setattr(build, 'WATCH_DEBOUNCE', 0)
+        (tmp_path / 'input').mkdir()
+        price = tmp_path / 'input' / 'Euroelectric.xlsx'
+        axima = tmp_path / 'input' / 'Axima_price.xlsx'
+        price.write_text('1')
+        axima.write_text('1')
+        
+        builds = []
+        
+        def fake_build(use_google_drive):
+            builds.append(len(builds))
+            if len(builds) == 1:
+                axima.write_text('22')  # поставщик загрузил файл посреди сборки
+        
+        sleeps = []
+        
+        def fake_sleep(_):
+            sleeps.append(1)
+            if len(sleeps) == 1:
+                price.write_text('22')
+            if len(sleeps) == 4:
+                raise KeyboardInterrupt
+        
+        monkeypatch.setattr(build, 'run_build', fake_build)
+        monkeypatch.setattr(time, 'sleep', fake_sleep)
+        build.watch(False)
+        assert len(builds) == 2
+    
+    def test_poll_drive_changes_filters_folder_files(self):
+        """Только входные файлы из нашей папки, все страницы"""
+        folder = build.GOOGLE_DRIVE_FOLDER_ID
+        service = FakeDriveChanges({
+            '1': {'nextPageToken': '2', 'changes': [
+                {'file': {'name': 'settings.xlsx', 'parents': [folder]}},
+                {'file': {'name': 'INTERNAL.xlsx', 'parents': [folder]}},
+            ]},
+            '2': {'newStartPageToken': '3', 'changes': [
+                {'file': {'name': 'Euroelectric.xlsx', 'parents': ['other-folder']}},
+                {'fileId': 'x', 'removed': True},
+            ]},
+        })
+        changed, token = poll_drive_changes(service, '1')
+        assert changed == ['settings.xlsx']
+        assert token == '3'
+        assert service.tokens == ['1', '2']
+
+
+class TestPublish:
+    """Тесты параллельной публикации"""
+    
+    def _stages(self, monkeypatch, tmp_path, use_google_drive=True):
+        calls = {'db': [], 'drive': [], 'telegram': [], 'captions': []}
+        sent = threading.Event()
+        
+        def upload(*args):
+            # Файл уходит в Telegram, не дожидаясь загрузки в БД
+            calls['db'].append(sent.wait(5))
+            return self.db_success
+        
+        monkeypatch.setattr(build, 'PIPELINE_STATE_DIR', str(tmp_path / 'state'))
+        monkeypatch.setattr(build, 'RUNS_DIR', str(tmp_path / 'runs'))
+        monkeypatch.setattr(build, 'TELEGRAM_BOT_TOKEN', 'token')
+        monkeypatch.setattr(build, 'upload_to_postgresql', upload)
+        monkeypatch.setattr(build, 'upload_file_to_drive',
+                            lambda path, name: calls['drive'].append(name) or 'file-id')
+        monkeypatch.setattr(build, 'send_telegram_file',
+                            lambda path, caption: calls['telegram'].append(caption) or sent.set() or {'1': 10})
+        monkeypatch.setattr(build, 'edit_telegram_caption',
+                            lambda messages, caption: calls['captions'].append((messages, caption)))
+        
+        def make_stages():
+            inputs = {'catalog': [{}], 'settings': ({}, {}), 'stock': ({}, {}),
+                      'internal': ('INTERNAL.xlsx', 'INTERNAL_2026.xlsx'), 'history': '📈 Изменения'}
+            return [Stage(name, lambda _, value=value: value) for name, value in inputs.items()] + [
+                s for s in build.build_stages(use_google_drive, 0.0) if s.name.startswith('publish:')
+            ]
+        
+        return make_stages, calls
+    
+    def test_publish_targets(self, tmp_path, monkeypatch):
+        """Все цели публикации - отдельные стадии, подпись Telegram - об успехе и с историей"""
+        self.db_success = True
+        make_stages, calls = self._stages(monkeypatch, tmp_path)
+        results = run_pipeline(make_stages())
+        assert results['publish:drive'] == 'file-id'
+        assert calls['drive'] == ['INTERNAL.xlsx']
+        assert calls['db'] == [True]
+        assert calls['telegram'] == ["⏳ <b>Загрузка на сайт...</b>"]
+        messages, caption = calls['captions'][0]
+        assert messages == {'1': 10}
+        assert 'Сборка завершена!' in caption and '📈 Изменения' in caption
+        
+        make_stages, calls = self._stages(monkeypatch, tmp_path, use_google_drive=False)
+        assert 'publish:drive' not in run_pipeline(make_stages())
+    
+    def test_db_error_caption_and_resume(self, tmp_path, monkeypatch):
+        """Ошибка БД валит сборку, но подпись в Telegram о ней сообщает; повтор не трогает Drive и Telegram"""
+        self.db_success = False
+        make_stages, calls = self._stages(monkeypatch, tmp_path)
+        run_dir = build.new_run_dir()
+        with pytest.raises(Exception, match='PostgreSQL'):
+            run_pipeline(make_stages(), run_dir=run_dir)
+        
+        manifest = build.load_run_manifest(run_dir)
+        assert manifest['failed'] == 'publish:postgresql'
+        assert {'publish:drive', 'publish:telegram'} <= set(manifest['stages'])
+        assert len(calls['telegram']) == 1
+        assert 'PostgreSQL: не загружено' in calls['captions'][0][1]
+        
+        self.db_success = True
+        stages = build.resume_stages(make_stages(), manifest['failed'], run_dir)
+        assert {s.name for s in stages if s.name.startswith('publish:')} == {
+            'publish:postgresql', 'publish:caption', 'publish:telegram'}  # telegram - из чекпойнта
+        run_pipeline(stages, run_dir=run_dir)
+        assert (len(calls['db']), len(calls['drive']), len(calls['telegram'])) == (2, 1, 1)
+        messages, caption = calls['captions'][-1]
+        assert messages == {'1': 10} and 'Сборка завершена!' in caption
+    
+    def test_telegram_not_sent(self, monkeypatch):
+        """Токен задан, но файл не дошёл ни до одного чата - ошибка стадии"""
+        monkeypatch.setattr(build, 'TELEGRAM_BOT_TOKEN', 'token')
+        monkeypatch.setattr(build, 'send_telegram_file', lambda path, caption: {})
+        with pytest.raises(Exception, match='Telegram'):
+            publish_telegram('INTERNAL.xlsx')
+    
+    def test_notify_catalog_updated(self):
+        """NOTIFY для API-сервера с версией каталога"""
+        class Cursor:
+            def execute(self, query, params):
+                self.query, self.params = query, params
+        
+        cur = Cursor()
+        assert notify_catalog_updated(cur, 'v1') == 'v1'
+        assert 'pg_notify' in cur.query
+        assert cur.params == ('catalog_updated', 'v1')
+        assert notify_catalog_updated(cur)  # версия по времени сборки
+
+
+class TestPartitions:
+    """Тесты секционированной таблицы products"""
+    
+    class Cursor:
+        def __init__(self):
+            self.queries = []
+        
+        def execute(self, query, params=None):
+            self.queries.append(repr(query) if not isinstance(query, str) else query)
+    
+    def test_partition_name(self):
+        """Стабильное имя в пределах 63 символов, регистр различается"""
+        assert build.partition_name('Jung') == build.partition_name('Jung')
+        assert build.partition_name('Jung') != build.partition_name('JUNG')
+        assert build.partition_name('OBO Bettermann').startswith('products_p_obo_bettermann_')
+        assert len(build.partition_name('X' * 300)) < 63
+    
+    def test_rows_hash_and_plan(self):
+        """Перезаливаются только изменившиеся, новые и пропавшие производители"""
+        rows = pd.DataFrame({'article': ['a', 'b'], 'price_rub': [100, 200]})
+        repriced = rows.assign(price_rub=[100, 201])
+        assert build.partition_rows_hash(rows) == build.partition_rows_hash(rows.copy())
+        assert build.partition_rows_hash(rows) != build.partition_rows_hash(repriced)
+        
+        current = {'Jung': 'h1', 'Legrand': 'h2', 'DKC': 'h3', 'IEK': None}
+        hashes = {'Jung': 'h1', 'Legrand': 'h2-new', 'IEK': 'h4', 'Wago': 'h5'}
+        assert build.plan_partitions(current, hashes) == (['IEK', 'Legrand', 'Wago'], ['DKC'])
+        assert build.plan_partitions(hashes, hashes) == ([], [])
+    
+    def test_swap_one_partition(self):
+        """Подменяется только изменившаяся партиция, остальные не трогаются"""
+        cur = self.Cursor()
+        build.swap_partitions(cur, ['Jung'], [], {'Jung', 'Legrand'}, {'Jung': 'h'}, {'Jung': 10}, False)
+        sql_text = '\n'.join(cur.queries)
+        jung = build.partition_name('Jung')
+        
+        assert 'DETACH PARTITION' in sql_text and 'ATTACH PARTITION' in sql_text
+        assert sql_text.count(jung) >= 4  # detach, drop, rename, attach
+        assert build.partition_name('Legrand') not in sql_text
+        assert 'CREATE TABLE products' not in sql_text
+    
+    def test_create_parent(self):
+        """Обычная таблица заменяется секционированной"""
+        cur = self.Cursor()
+        build.swap_partitions(cur, ['Jung'], [], set(), {'Jung': 'h'}, {'Jung': 10}, True)
+        sql_text = '\n'.join(cur.queries)
+        assert 'DROP TABLE IF EXISTS products' in sql_text
+        assert 'PARTITION BY LIST (manufacturer)' in sql_text
+        assert 'DETACH' not in sql_text
+    
+    def test_upload_uses_partitions(self, monkeypatch):
+        """PRODUCTS_PARTITIONED=true - загрузка по партициям"""
+        calls = []
+        monkeypatch.setattr(build, 'PRODUCTS_PARTITIONED', True)
+        monkeypatch.delenv('DATABASE_URL', raising=False)
+        monkeypatch.setattr(build, 'upload_partitioned', lambda *args: calls.append(args[-1]) or True)
+        assert build.upload_to_postgresql(None, {'database_url': 'postgresql://test'}, {}, {}, {})
+        assert calls == ['postgresql://test']
+
+
+@pytest.mark.skipif(not os.environ.get('TEST_DATABASE_URL'),
+                    reason="нужна PostgreSQL: TEST_DATABASE_URL (таблица products перезаписывается)")
+class TestPartitionsDatabase:
+    """Переключение и подмена партиций на настоящей PostgreSQL"""
+    
+    settings = {'kurs': 5}
+    margins = {'global_margin': 0.6, 'by_manufacturer': {}, 'by_article': {}}
+    products = [
+        ('Jung', 'ls1912', 'Рамка', 5000.0, '', '', ''),
+        ('Jung', 'ls1520', 'Розетка', 6000.0, '', '', ''),
+        ('ABB', 'abb1', 'Автомат', 2000.0, '', '', ''),
+        ('OBO', 'obo1', 'Лоток', 1000.0, '', '', ''),
+    ]
+    
+    @pytest.fixture
+    def conn(self, monkeypatch):
+        import psycopg2
+        
+        url = os.environ['TEST_DATABASE_URL']
+        monkeypatch.setenv('DATABASE_URL', url)
+        conn = psycopg2.connect(url)
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("DROP TABLE IF EXISTS products, products_partitions CASCADE")
+        cur.execute("LISTEN catalog_updated")
+        yield conn
+        cur.execute("DROP TABLE IF EXISTS products, products_partitions CASCADE")
+        conn.close()
+    
+    def _upload(self, monkeypatch, conn, products, partitioned: bool) -> int:
+        """Загрузка каталога; возвращает число полученных NOTIFY"""
+        monkeypatch.setattr(build, 'PRODUCTS_PARTITIONED', partitioned)
+        assert build.upload_to_postgresql(make_catalog(products), self.settings, {}, {}, self.margins)
+        conn.notifies.clear()
+        conn.cursor().execute("SELECT 1")  # забираем уведомления
+        return len(conn.notifies)
+    
+    def _state(self, conn):
+        """(relkind, {производитель: (таблица, oid, строк, сумма цен)})"""
+        cur = conn.cursor()
+        relkind = build.products_relkind(cur)
+        cur.execute("""
+            SELECT manufacturer, tableoid::regclass::text, tableoid::int, COUNT(*), SUM(price_rub)
+            FROM products GROUP BY 1, 2, 3
+        """)
+        return relkind, {row[0]: row[1:] for row in cur.fetchall()}
+    
+    def test_switch_swap_remove_and_back(self, conn, monkeypatch):
+        """Обычная → секционированная, подмена одной партиции, удаление производителя, обратно"""
+        cur = conn.cursor()
+        
+        assert self._upload(monkeypatch, conn, self.products, partitioned=False) == 1
+        relkind, tables = self._state(conn)
+        assert relkind == 'r' and {t[0] for t in tables.values()} == {'products'}
+        
+        assert self._upload(monkeypatch, conn, self.products, partitioned=True) == 1
+        relkind, before = self._state(conn)
+        assert relkind == 'p'
+        assert {m: t[0] for m, t in before.items()} == {m: build.partition_name(m) for m in ('Jung', 'ABB', 'OBO')}
+        assert before['Jung'][2] == 2
+        
+        # Тот же каталог - партиции не трогаются, NOTIFY нет
+        assert self._upload(monkeypatch, conn, self.products, partitioned=True) == 0
+        assert self._state(conn)[1] == before
+        
+        # Изменилась цена одного производителя - перезаливается только его партиция
+        repriced = [p if p[0] != 'ABB' else p[:3] + (4000.0,) + p[4:] for p in self.products]
+        assert self._upload(monkeypatch, conn, repriced, partitioned=True) == 1
+        _, after = self._state(conn)
+        assert after['ABB'][1] != before['ABB'][1] and after['ABB'][3] > before['ABB'][3]
+        assert after['Jung'] == before['Jung'] and after['OBO'] == before['OBO']
+        
+        # Производитель пропал из каталога - партиция и её запись удаляются
+        assert self._upload(monkeypatch, conn, [p for p in repriced if p[0] != 'OBO'], partitioned=True) == 1
+        _, after = self._state(conn)
+        assert set(after) == {'Jung', 'ABB'}
+        cur.execute("SELECT to_regclass(%s)", (build.partition_name('OBO'),))
+        assert cur.fetchone()[0] is None
+        cur.execute("SELECT manufacturer FROM products_partitions ORDER BY 1")
+        assert cur.fetchall() == [('ABB',), ('Jung',)]
+        
+        # Обратно в обычную таблицу
+        assert self._upload(monkeypatch, conn, self.products, partitioned=False) == 1
+        relkind, tables = self._state(conn)
+        assert relkind == 'r' and set(tables) == {'Jung', 'ABB', 'OBO'}
+        cur.execute("SELECT to_regclass('products_partitions')")
+        assert cur.fetchone()[0] is None
+
+
+class FakeDriveFiles:
+    """Заглушка service.files() для загрузки: get/list/update/create"""
+    
+    def __init__(self, files=None, fail_chunks=0):
+        self.files_by_id = files or {}
+        self.fail_chunks = fail_chunks
+        self.calls = []
+    
+    def files(self):
+        return self
+    
+    def _request(self, result=None, error=None):
+        fake = self
+        
+        class Request:
+            def execute(self):
+                if error:
+                    raise error
+                return result
+            
+            def next_chunk(self, num_retries=0):
+                fake.calls.append('chunk')
+                if fake.fail_chunks:
+                    fake.fail_chunks -= 1
+                    raise ConnectionError('reset')
+                return None, result
+        
+        return Request()
+    
+    def get(self, fileId, fields):
+        self.calls.append(('get', fileId))
+        if fileId not in self.files_by_id:
+            return self._request(error=KeyError(fileId))
+        return self._request(self.files_by_id[fileId])
+    
+    def list(self, q, fields):
+        self.calls.append('list')
+        return self._request({'files': list(self.files_by_id.values())})
+    
+    def update(self, fileId, body, media_body, fields):
+        self.calls.append(('update', fileId))
+        return self._request({'id': fileId})
+    
+    def create(self, body, media_body, fields):
+        self.calls.append('create')
+        return self._request({'id': 'new-id'})
+
+
+class TestDriveClient:
+    """Тесты общего клиента Google Drive"""
+    
+    def test_credentials_once_service_per_thread(self, monkeypatch):
+        """Учётные данные загружаются один раз, сервис переиспользуется внутри потока"""
+        loads, builds = [], []
+        monkeypatch.setenv('GOOGLE_CREDENTIALS_JSON', '{}')
+        monkeypatch.setattr(build, '_drive_credentials', None)
+        monkeypatch.setattr(build, '_drive_local', threading.local())
+        monkeypatch.setattr(build, 'drive_setup_stats', {'seconds': 0.0, 'clients': 0})
+        monkeypatch.setattr('google.oauth2.service_account.Credentials.from_service_account_info',
+                            lambda info, scopes: loads.append(info) or object())
+        monkeypatch.setattr('googleapiclient.discovery.build',
+                            lambda *args, **kwargs: builds.append(kwargs) or object())
+        
+        service = get_drive_service()
+        assert get_drive_service() is service
+        
+        other = []
+        thread = threading.Thread(target=lambda: other.append(get_drive_service()))
+        thread.start()
+        thread.join()
+        
+        assert other[0] is not service
+        assert len(loads) == 1
+        assert len(builds) == 2 and builds[0]['static_discovery'] is True
+        assert build.drive_setup_stats['clients'] == 2
+    
+    def test_stats_reset_per_build(self, tmp_path, monkeypatch):
+        """В --watch счётчики подключения не копятся между сборками"""
+        stats = {'seconds': 0.0, 'clients': 0}
+        seen = []
+        monkeypatch.setattr(build, 'drive_setup_stats', stats)
+        monkeypatch.setattr(build, 'RUNS_DIR', str(tmp_path))
+        monkeypatch.setattr(build, 'notify_start', lambda: None)
+        monkeypatch.setattr(build, 'build_stages', lambda use_google_drive, start_time: [])
+        
+        def fake_pipeline(stages, force=False, run_dir=None):
+            stats['seconds'] += 1.5
+            stats['clients'] += 3
+            seen.append(dict(stats))
+        
+        monkeypatch.setattr(build, 'run_pipeline', fake_pipeline)
+        
+        assert build.run_build(use_google_drive=True)
+        assert build.run_build(use_google_drive=True)
+        assert seen == [{'seconds': 1.5, 'clients': 3}] * 2
+
+
+class TestDriveUpload:
+    """Тесты загрузки на Google Drive"""
+    
+    @pytest.fixture
+    def xlsx(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(build, 'DRIVE_UPLOAD_CACHE', str(tmp_path / 'uploads.json'))
+        monkeypatch.setattr('time.sleep', lambda seconds: None)
+        path = tmp_path / 'INTERNAL.xlsx'
+        pd.DataFrame({'Артикул': ['A1'], 'Цена': [100]}).to_excel(path, index=False)
+        return str(path)
+    
+    def _upload(self, monkeypatch, xlsx, service):
+        monkeypatch.setattr(build, 'get_drive_service', lambda readonly=True: service)
+        return upload_file_to_drive(xlsx, 'INTERNAL.xlsx')
+    
+    def test_content_md5_ignores_metadata(self, tmp_path):
+        """Повторная запись того же xlsx даёт тот же хэш содержимого"""
+        df = pd.DataFrame({'Артикул': ['A1', 'A2']})
+        df.to_excel(tmp_path / 'a.xlsx', index=False)
+        df.to_excel(tmp_path / 'b.xlsx', index=False)
+        assert xlsx_content_md5(str(tmp_path / 'a.xlsx')) == xlsx_content_md5(str(tmp_path / 'b.xlsx'))
+    
+    def test_create_then_skip_by_cached_id(self, monkeypatch, xlsx):
+        """Новый файл создаётся, повторная загрузка пропускается без запроса list"""
+        service = FakeDriveFiles(fail_chunks=1)
+        assert self._upload(monkeypatch, xlsx, service) == 'new-id'
+        assert service.calls == ['list', 'create', 'chunk', 'chunk']
+        
+        service.files_by_id['new-id'] = {'id': 'new-id', 'appProperties': {'contentMd5': xlsx_content_md5(xlsx)}}
+        service.calls = []
+        assert self._upload(monkeypatch, xlsx, service) == 'new-id'
+        assert service.calls == [('get', 'new-id')]
+    
+    def test_update_changed_file(self, monkeypatch, xlsx):
+        """Изменённый файл обновляется; устаревший id из кэша заменяется найденным по имени"""
+        build.save_drive_upload_cache({'INTERNAL.xlsx': 'deleted-id'})
+        service = FakeDriveFiles({'old-id': {'id': 'old-id', 'md5Checksum': 'other'}})
+        assert self._upload(monkeypatch, xlsx, service) == 'old-id'
+        assert service.calls == [('get', 'deleted-id'), 'list', ('update', 'old-id'), 'chunk']
+        assert build.load_drive_upload_cache() == {'INTERNAL.xlsx': 'old-id'}
+
+
+class TestPipeline:
+    """Тесты DAG стадий"""
+    
+    def test_order_and_cycle(self):
+        """Зависимости идут раньше, цикл - ошибка"""
+        stages = [Stage('b', None, deps=('a',)), Stage('a', None)]
+        assert [s.name for s in order_stages(stages)] == ['a', 'b']
+        with pytest.raises(ValueError):
+            order_stages([Stage('a', None, deps=('b',)), Stage('b', None, deps=('a',))])
+    
+    def test_skip_unchanged_inputs(self, tmp_path, monkeypatch):
+        """Кэшируемая стадия с теми же входами не запускается повторно"""
+        monkeypatch.setattr(build, 'PIPELINE_STATE_DIR', str(tmp_path / 'state'))
+        source = tmp_path / 'source.txt'
+        source.write_text('1')
+        calls = []
+        
+        def make_stages():
+            return [
+                Stage('parse', lambda _: calls.append('parse') or source.read_text(),
+                      inputs=(str(source),), cacheable=True),
+                Stage('output', lambda r: calls.append('output') or r['parse'] + '!', deps=('parse',)),
+            ]
+        
+        assert run_pipeline(make_stages())['output'] == '1!'
+        assert run_pipeline(make_stages())['output'] == '1!'
+        assert calls == ['parse', 'output', 'output']
+        
+        source.write_text('2')
+        assert run_pipeline(make_stages())['output'] == '2!'
+        assert calls[-2:] == ['parse', 'output']
+    
+    def test_force(self, tmp_path, monkeypatch):
+        """--force запускает все стадии"""
+        monkeypatch.setattr(build, 'PIPELINE_STATE_DIR', str(tmp_path))
+        calls = []
+        stages = [Stage('parse', lambda _: calls.append('parse'), cacheable=True)]
+        run_pipeline(stages)
+        run_pipeline(stages, force=True)
+        assert calls == ['parse', 'parse']
+    
+    def test_checkpoint_and_resume(self, tmp_path, monkeypatch):
+        """--resume-from: перезапускается только хвост, остальное - из чекпойнтов прогона"""
+        monkeypatch.setattr(build, 'PIPELINE_STATE_DIR', str(tmp_path / 'state'))
+        monkeypatch.setattr(build, 'RUNS_DIR', str(tmp_path / 'runs'))
+        downloaded = tmp_path / 'input' / 'price.xlsx'
+        calls = []
+        attempts = []
+        
+        def download(_):
+            calls.append('download')
+            downloaded.parent.mkdir(exist_ok=True)
+            downloaded.write_text('price')
+            return str(downloaded)
+        
+        def publish(r):
+            calls.append('publish')
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise Exception("PostgreSQL недоступен")
+            return (len(r['catalog']), downloaded.read_text())
+        
+        def make_stages():
+            return [
+                Stage('download', download, files=lambda path: [path]),
+                Stage('catalog', lambda _: calls.append('catalog') or make_catalog(
+                    [('Jung', 'ls1520', 'Розетка', 1000.0, '', '', '')]), deps=('download',)),
+                Stage('snapshots', lambda r: calls.append('snapshots'), deps=('catalog',)),
+                Stage('publish', publish, deps=('catalog', 'download')),
+            ]
+        
+        run_dir = build.new_run_dir()
+        with pytest.raises(Exception):
+            run_pipeline(make_stages(), run_dir=run_dir)
+        manifest = build.load_run_manifest(run_dir)
+        assert manifest['failed'] == 'publish'
+        assert manifest['stages']['catalog']['data'] == 'catalog.parquet'
+        
+        downloaded.unlink()
+        calls.clear()
+        stages = build.resume_stages(make_stages(), 'publish', build.find_run_dir())
+        results = run_pipeline(stages, run_dir=run_dir)
+        
+        assert calls == ['publish']
+        assert results['publish'] == (1, 'price')  # файл восстановлен из чекпойнта
+        assert results['catalog']['manufacturer'].dtype == 'category'
+        assert build.load_run_manifest(run_dir)['failed'] is None
+    
+    def test_resume_needs_checkpoints(self, tmp_path, monkeypatch):
+        """Нельзя возобновить со стадии, зависимости которой не сохранены"""
+        monkeypatch.setattr(build, 'RUNS_DIR', str(tmp_path / 'runs'))
+        stages = [Stage('parse', None), Stage('publish', None, deps=('parse',))]
+        run_dir = build.new_run_dir()
+        with pytest.raises(ValueError):
+            build.resume_stages(stages, 'publish', run_dir)
+        with pytest.raises(ValueError):
+            build.resume_stages(stages, 'unknown', run_dir)
+        assert [s.name for s in build.resume_stages(stages, 'parse', run_dir)] == ['parse', 'publish']
+
+
+class TestBuildProfiles:
+    """Тесты мультипрофильной сборки"""
+    
+    def write_profiles(self, tmp_path, profiles):
+        path = tmp_path / 'profiles.json'
+        path.write_text(json.dumps(profiles))
+        return str(path)
+    
+    def test_load_and_validate(self, tmp_path):
+        """Имена уникальны и безопасны для путей, папка Drive обязательна"""
+        path = self.write_profiles(tmp_path, [{'name': 'astana', 'drive_folder_id': 'f1'},
+                                              {'name': 'partner-1', 'drive_folder_id': 'f2'}])
+        assert [p['name'] for p in load_build_profiles(path, True)] == ['astana', 'partner-1']
+        
+        for bad in ([], [{'name': '../x'}], [{'name': 'a'}, {'name': 'a'}]):
+            with pytest.raises(ValueError):
+                load_build_profiles(self.write_profiles(tmp_path, bad), False)
+        with pytest.raises(ValueError):
+            load_build_profiles(self.write_profiles(tmp_path, [{'name': 'a'}]), True)
+    
+    def test_stage_closure(self):
+        """Цель и все её зависимости"""
+        stages = [Stage('a', None), Stage('b', None, deps=('a',)), Stage('c', None, deps=('b',)),
+                  Stage('d', None)]
+        assert stage_closure(stages, ['c']) == {'a', 'b', 'c'}
+    
+    def test_profile_stages(self):
+        """Профиль качает только свой settings.xlsx, парсеры поставщиков заменены готовыми результатами"""
+        shared = {name: name + '-result' for name in build.SHARED_STAGES}
+        stages = profile_stages(build.build_stages(True, 0), shared, ('/input/Euroelectric.xlsx',))
+        names = [s.name for s in order_stages(stages)]
+        
+        assert 'download:settings.xlsx' in names and 'drive:list' in names
+        assert not [n for n in names if n.startswith('download:') and n != 'download:settings.xlsx']
+        assert names.count('euroelectric') == 1
+        
+        euroelectric = next(s for s in stages if s.name == 'euroelectric')
+        assert euroelectric.deps == () and euroelectric.inputs == ('/input/Euroelectric.xlsx',)
+        assert euroelectric.func({}) == 'euroelectric-result'
+    
+    def test_apply_build_profile(self, monkeypatch):
+        """Папки, Drive, Telegram и БД переключаются на профиль"""
+        for name in ('BUILD_PROFILE', 'GOOGLE_DRIVE_FOLDER_ID', 'TELEGRAM_CHAT_IDS', 'INPUT_DIR', 'OUTPUT_DIR',
+                     'DRIVE_UPLOAD_CACHE', 'PIPELINE_STATE_DIR', 'RUNS_DIR', 'HISTORY_DIR', 'STATIC_CATALOG_DIR'):
+            monkeypatch.setattr(build, name, getattr(build, name))
+        monkeypatch.setenv('DATABASE_URL', 'postgresql://shared')
+        
+        apply_build_profile({'name': 'astana', 'drive_folder_id': 'f1',
+                             'database_url': 'postgresql://astana', 'telegram_chat_ids': ['42']})
+        
+        assert build.BUILD_PROFILE == 'astana'
+        assert build.GOOGLE_DRIVE_FOLDER_ID == 'f1'
+        assert build.TELEGRAM_CHAT_IDS == ['42']
+        assert build.INPUT_DIR == os.path.join('input', 'profiles', 'astana')
+        assert build.PIPELINE_STATE_DIR == os.path.join('output', 'profiles', 'astana', '.pipeline')
+        assert build.RUNS_DIR == os.path.join('output', 'profiles', 'astana', 'runs')
+        assert os.environ['DATABASE_URL'] == 'postgresql://astana'
 
 
 if __name__ == '__main__':
@@ -0,0 +1,197 @@
+"""
+Тесты для loadtest.py: синтетический каталог, смесь запросов, отчёт
+"""
+import pytest
+import sys
+import os
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+# Добавляем путь к скриптам
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import loadtest
+from loadtest import (
+    synthetic_catalog,
+    synthetic_stock,
+    seed_database,
+    RequestPlan,
+    run_load,
+    summarize,
+    PAGE_SIZE,
+    REQUEST_MIX
+)
+from build import CATALOG_DTYPES, prepare_catalog_rows
+
+
+class TestSyntheticCatalog:
+    """Тесты синтетического каталога"""
+    
+    def test_shape_and_dtypes(self):
+        """Формат build.py, уникальные артикулы, воспроизводимость по seed"""
+        catalog = synthetic_catalog(10_000, seed=1)
+        assert len(catalog) == 10_000
+        assert catalog['article'].is_unique
+        assert {c: str(t) for c, t in catalog.dtypes.items()} == {c: str(t) for c, t in
+                                                                   catalog.astype(CATALOG_DTYPES).dtypes.items()}
+        assert catalog.equals(synthetic_catalog(10_000, seed=1))
+        
+        # Крупная вкладка и длинный хвост
+        counts = catalog['manufacturer'].value_counts()
+        assert counts.iloc[0] > 5 * counts.iloc[-1]
+    
+    def test_rows_for_database(self):
+        """Каталог проходит подготовку строк для upload_to_postgresql"""
+        catalog = synthetic_catalog(1000)
+        almaty, astana = synthetic_stock(catalog)
+        rows = prepare_catalog_rows(catalog, {'kurs': 5.0}, almaty, astana,
+                                    {'global_margin': 0.6, 'by_article': {}, 'by_manufacturer': {}})
+        assert len(rows) == 1000
+        assert (rows['astana_qty'] > 0).sum() > 100
+
+
+class TestSeedDatabase:
+    """Тесты загрузки каталога для нагрузки"""
+    
+    def test_reload_forgets_partition_hashes(self, monkeypatch):
+        """Перезагрузка сбрасывает хэши партиций до загрузки, иначе не будет NOTIFY"""
+        import psycopg2
+        calls = []
+        
+        class Conn:
+            def cursor(self):
+                return self
+            
+            def __enter__(self):
+                return self
+            
+            def __exit__(self, *args):
+                return False
+            
+            def commit(self):
+                calls.append('commit')
+            
+            def close(self):
+                pass
+        
+        monkeypatch.delenv('DATABASE_URL', raising=False)  # seed_database выставляет его сам
+        monkeypatch.setattr(psycopg2, 'connect', lambda url: Conn())
+        monkeypatch.setattr(loadtest.build, 'forget_partition_hashes', lambda cur: calls.append('forget'))
+        monkeypatch.setattr(loadtest.build, 'upload_to_postgresql', lambda *args: calls.append('upload') or True)
+        catalog = synthetic_catalog(100)
+        
+        assert seed_database(catalog, 'postgresql://test')
+        assert calls == ['upload']
+        assert seed_database(catalog, 'postgresql://test', reload=True)
+        assert calls == ['upload', 'forget', 'commit', 'upload']
+    
+    @pytest.mark.skipif(not os.environ.get('TEST_DATABASE_URL'),
+                        reason="нужна PostgreSQL: TEST_DATABASE_URL (таблица products перезаписывается)")
+    def test_reload_notifies_partitioned(self, monkeypatch):
+        """PRODUCTS_PARTITIONED: перезагрузка того же каталога отправляет NOTIFY"""
+        import psycopg2
+        
+        url = os.environ['TEST_DATABASE_URL']
+        monkeypatch.setattr(loadtest.build, 'PRODUCTS_PARTITIONED', True)
+        monkeypatch.setenv('DATABASE_URL', url)
+        catalog = synthetic_catalog(2000)
+        conn = psycopg2.connect(url)
+        conn.autocommit = True
+        cur = conn.cursor()
+        try:
+            cur.execute("DROP TABLE IF EXISTS products, products_partitions CASCADE")
+            assert seed_database(catalog, url)
+            cur.execute("LISTEN catalog_updated")
+            
+            assert seed_database(catalog, url, reload=True)
+            cur.execute("SELECT 1")  # забираем уведомления
+            assert len(conn.notifies) == 1
+            cur.execute("SELECT COUNT(*) FROM products")
+            assert cur.fetchone()[0] == 2000
+        finally:
+            cur.execute("DROP TABLE IF EXISTS products, products_partitions CASCADE")
+            conn.close()
+
+
+class TestRequestPlan:
+    """Тесты смеси запросов"""
+    
+    def test_mix_and_paths(self):
+        """Доли типов запросов и корректные параметры"""
+        catalog = synthetic_catalog(20_000)
+        plan = RequestPlan(catalog)
+        rng = np.random.default_rng(0)
+        requests = [plan.next(rng) for _ in range(4000)]
+        
+        kinds = [kind for kind, _ in requests]
+        for kind, share in REQUEST_MIX.items():
+            assert abs(kinds.count(kind) / len(kinds) - share) < 0.03
+        
+        counts = catalog['manufacturer'].value_counts()
+        offsets = []
+        for kind, path in requests:
+            if kind == 'manufacturer':
+                query = parse_qs(urlsplit(path).query)
+                offset = int(query['offset'][0])
+                assert offset % PAGE_SIZE == 0
+                assert offset < max(counts[query['manufacturer'][0]], PAGE_SIZE)
+                offsets.append(offset)
+        assert max(offsets) >= 5 * PAGE_SIZE  # глубокие страницы
+
+
+class FakeApi(BaseHTTPRequestHandler):
+    """Сервер-заглушка: 404 для промахов по артикулу, иначе 200"""
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        status = 404 if '/missing-' in self.path else 200
+        body = json.dumps({'ok': status == 200}).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+class TestRunLoad:
+    """Тесты прогона нагрузки и отчёта"""
+    
+    @pytest.fixture
+    def api_url(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeApi)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+        server.server_close()
+    
+    def test_samples_and_report(self, api_url):
+        """Сэмплы по всем типам запросов, 404 по артикулу - не ошибка"""
+        plan = RequestPlan(synthetic_catalog(1000))
+        samples = run_load(api_url, plan, duration=0.5, concurrency=4)
+        
+        assert len(samples) > 20
+        assert all(ok for _, _, _, ok in samples)
+        assert [s[1] for s in samples] == sorted(s[1] for s in samples)
+        
+        report = summarize(samples, 0.5)
+        assert report['all']['requests'] == len(samples)
+        assert set(report) == set(REQUEST_MIX) | {'all'}
+        assert report['all']['p50_ms'] <= report['all']['p95_ms'] <= report['all']['p99_ms']
+    
+    def test_connection_errors(self):
+        """Недоступный сервер - ошибки, а не исключение"""
+        plan = RequestPlan(synthetic_catalog(100))
+        samples = run_load("http://127.0.0.1:9", plan, duration=0.2, concurrency=1)
+        assert samples and not any(ok for _, _, _, ok in samples)
+        assert summarize(samples, 0.2)['all']['errors'] == len(samples)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])